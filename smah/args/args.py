@@ -2,6 +2,8 @@ import argparse
 import sys
 import logging
 
+from smah.runner.pipe_input import PipeInput
+
 def merge_args(args: argparse.Namespace, config: dict) -> argparse.Namespace:
     """
     Merges parsed command-line arguments with configuration settings.
@@ -18,21 +20,21 @@ def merge_args(args: argparse.Namespace, config: dict) -> argparse.Namespace:
             setattr(args, key, value)
     return args
 
-def extract_args() -> tuple[argparse.Namespace, str | None]:
+def extract_args() -> tuple[argparse.Namespace, PipeInput | None]:
     """
     Parses and extracts command-line arguments for the SMAH CLI tool.
 
     Returns:
         parser (ArgumentParser): The argument parser with configured options.
         args (Namespace): Parsed arguments and options.
-        pipe (str or None): Content read from standard input if available.
+        pipe (PipeInput or None): Standard input if piped, read as it is needed.
     """
     parser = __initialize_argument_parser()
     __add_general_arguments(parser)
     __add_ai_arguments(parser)
     __add_gui_arguments(parser)
     a = parser.parse_args()
-    return a, __get_pipe()
+    return a, __get_pipe(reserved=a.follow or a.batch == "-")
 
 def __initialize_argument_parser():
     """
@@ -56,6 +58,8 @@ def __add_general_arguments(parser: argparse.ArgumentParser) -> None:
     """
     parser.add_argument('-q', '--query', type=str, help='The Query to process')
     parser.add_argument('-i', '--instructions', type=str, help='The Instruction File to process')
+    parser.add_argument('--batch', type=str, help='Run Queries From a JSONL Jobs File (- for stdin)')
+    parser.add_argument('--batch-concurrency', type=int, help='Max Concurrent Batch Jobs', default=8)
     parser.add_argument('--interactive', action=argparse.BooleanOptionalAction, help='Run in interactive mode', default=False)
     parser.add_argument('-c', '--config', type=str, help='Path to alternative config file')
     parser.add_argument('--database', type=str, help='Path to sqlite smah database')
@@ -80,6 +84,18 @@ def __add_ai_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--model-review', type=str, help='Output Reviewer Model')
     parser.add_argument('--model-edit', type=str, help='Output Editor Model')
 
+    parser.add_argument('--pipe-concurrency', type=int, help='Max Concurrent Requests When Splitting Large Pipe Input', default=4)
+    parser.add_argument('--pipe-chunk-tokens', type=int, help='Max Tokens Per Chunk When Splitting Large Pipe Input')
+    parser.add_argument('--follow', action=argparse.BooleanOptionalAction, help='Process Unbounded Pipe Input (tail -f) In Windows', default=False)
+    parser.add_argument('--follow-interval', type=float, help='Max Seconds Per Follow Window', default=5.0)
+    parser.add_argument('--follow-lines', type=int, help='Max Lines Per Follow Window', default=200)
+    parser.add_argument('--plan-cache', action=argparse.BooleanOptionalAction, help='Reuse Cached Query/Pipe Plans', default=True)
+    parser.add_argument('--local-planner', action=argparse.BooleanOptionalAction, help='Plan Simple Requests Locally Without an LLM Call (default: config)', default=None)
+    parser.add_argument('--tools', action=argparse.BooleanOptionalAction, help='Let Queries Run Read-Only Diagnostic Commands (default: config)', default=None)
+    parser.add_argument('--hedge', action=argparse.BooleanOptionalAction, help='Duplicate Stalled Requests to a Fallback Model (default: config)', default=None)
+    parser.add_argument('--completion-cache', action=argparse.BooleanOptionalAction, help='Reuse Cached Completions for Identical Requests (default: config)', default=None)
+    parser.add_argument('--replay', action=argparse.BooleanOptionalAction, help='Only Serve Completions From Cache (offline)', default=False)
+
     parser.add_argument('--openai-api-tier', type=int, help='OpenAI Tier')
     parser.add_argument('--openai-api-key', type=str, help='OpenAI Api Key')
     parser.add_argument('--openai-api-org', type=str, help='OpenAI Api Org')
@@ -93,18 +109,22 @@ def __add_gui_arguments(parser: argparse.ArgumentParser) -> None:
     """
     parser.add_argument('--gui', action=argparse.BooleanOptionalAction, help='Run in GUI mode', default=False)
     parser.add_argument('--rich', action=argparse.BooleanOptionalAction, help='Rich Format Output', default=True)
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, help='Stream Responses As They Are Generated', default=True)
 
-def __get_pipe():
+def __get_pipe(reserved: bool = False):
     """
-    Reads data from standard input if present and available.
+    Standard input if present and available.
+
+    Args:
+        reserved (bool): Standard input is consumed incrementally by the runner instead (follow/batch mode).
 
     Returns:
-        str or None: The content available from standard input; otherwise, None if input is not a TTY.
+        PipeInput or None: Standard input, read lazily (large input is never held whole); None if input is a TTY.
     """
-    if sys.stdin.isatty():
+    if reserved or sys.stdin.isatty():
         return None
     else:
-        return sys.stdin.read()
+        return PipeInput(sys.stdin)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
@@ -1,28 +1,60 @@
 import argparse
+import functools
 import json
 import sqlite3
 import os
-from typing import Optional
+import threading
+from typing import Optional, Tuple
+
+
+def synchronized(method):
+    """
+    Serialize access to the shared connection so a Database may be used from worker threads.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class Database:
     DEFAULT_DATABASE = os.path.expanduser("~/.smah/smah.db")
+    BUSY_TIMEOUT = 5000
+    UNMIGRATED_ERRORS = ("no such table", "no such column")
 
     @staticmethod
     def default_database() -> str:
         return Database.DEFAULT_DATABASE
 
+    @staticmethod
+    def unmigrated(error: sqlite3.OperationalError) -> bool:
+        """
+        Whether an error is due to a missing migration (as opposed to, e.g., another process holding the lock).
+        """
+        return any(message in str(error) for message in Database.UNMIGRATED_ERRORS)
+
     @staticmethod
     def args_to_dict(args: argparse.Namespace) -> dict:
         return vars(args)
 
-    def __init__(self, args):
+    def __init__(self, args, check_same_thread: bool = True):
         file = args.database or self.default_database()
         if not os.path.exists(file):
             os.makedirs(os.path.dirname(file), exist_ok=True)
-        self.connection: sqlite3.Connection = sqlite3.connect(file)
+        self.connection: sqlite3.Connection = sqlite3.connect(
+            file,
+            check_same_thread=check_same_thread,
+            timeout=self.BUSY_TIMEOUT / 1000
+        )
+        # smah processes share the database (rate limit buckets, caches): wait out each other's write locks
+        # rather than failing, and let readers proceed while another process writes.
+        self.connection.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.lock = threading.RLock()
 
-    def last_session(self):
+    @synchronized
+    def last_session(self, compacted: bool = False):
         cursor = self.connection.cursor()
         cursor.execute(
             """
@@ -37,10 +69,20 @@ class Database:
         if result:
             (session_id,) = result
             session_id = int(session_id)
-            return self.session(session_id)
+            return self.session(session_id, compacted=compacted)
         return None
 
-    def session(self, session_id: int):
+    @synchronized
+    def session(self, session_id: int, compacted: bool = False):
+        """
+        Load a session.
+
+        Args:
+            session_id (int): The session id.
+            compacted (bool): Load the latest checkpoint summary followed by the messages after it,
+                rather than every message.
+        """
+        checkpoint = self.session_checkpoint(session_id) if compacted else None
         cursor = self.connection.cursor()
         cursor.execute(
             """
@@ -59,12 +101,12 @@ class Database:
             """
             SELECT message
             FROM chat_history_message
-            WHERE chat_history_id = ?
+            WHERE chat_history_id = ? AND id > ?
             ORDER BY id ASC
             """,
-            (session_id,)
+            (session_id, checkpoint["message_id"] if checkpoint else 0)
         ).fetchall()
-        messages = []
+        messages = [checkpoint["message"]] if checkpoint else []
         for row in mr:
             (row,) = row
             messages.append(json.loads(row))
@@ -79,10 +121,73 @@ class Database:
                 "args": json.loads(args),
                 "plan": json.loads(plan),
                 "pipe": pipe,
-                "messages": messages
+                "messages": messages,
+                "checkpoint": checkpoint
+            }
+        return None
+
+    @synchronized
+    def session_messages(self, session_id: int, after: int = 0) -> list[Tuple[int, dict]]:
+        """
+        (message id, message) pairs of a session after message id `after`, in order.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT id, message
+            FROM chat_history_message
+            WHERE chat_history_id = ? AND id > ?
+            ORDER BY id ASC
+            """,
+            (session_id, after)
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return [(id, json.loads(message)) for id, message in result]
+
+    @synchronized
+    def session_checkpoint(self, session_id: int) -> Optional[dict]:
+        """
+        The latest compaction checkpoint of a session: the summary message standing in for messages
+        up to and including `message_id`.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT message_id, message, tokens, created_on
+            FROM chat_history_checkpoint
+            WHERE chat_history_id = ?
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (session_id,)
+        )
+        result = cursor.fetchone()
+        cursor.close()
+        if result:
+            message_id, message, tokens, created_on = result
+            return {
+                "message_id": message_id,
+                "message": json.loads(message),
+                "tokens": tokens,
+                "created_on": created_on
             }
         return None
 
+    @synchronized
+    def save_session_checkpoint(self, session_id: int, message_id: int, message: dict, tokens: int) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            INSERT INTO chat_history_checkpoint (chat_history_id, message_id, message, tokens)
+            VALUES (?, ?, ?, ?)
+            """,
+            (session_id, message_id, json.dumps(message), tokens)
+        )
+        self.connection.commit()
+        cursor.close()
+
+    @synchronized
     def history(self, limit: int = 10):
         cursor = self.connection.cursor()
         cursor.execute(
@@ -108,6 +213,7 @@ class Database:
         response.reverse()
         return response
 
+    @synchronized
     def append_to_chat(self, session_id: int, messages: list) -> None:
         cursor = self.connection.cursor()
         cursor.execute("BEGIN TRANSACTION")
@@ -122,47 +228,394 @@ class Database:
         cursor.execute("COMMIT")
         cursor.close()
 
-    def save_chat(self, title: str, args: argparse.Namespace, plan: dict, messages: list, pipe: Optional[str] = None) -> None:
+    @synchronized
+    def save_chat(self, title: str, args: argparse.Namespace, plan: dict, messages: list, pipe: Optional[str] = None) -> int:
+        return self.save_chats([(title, args, plan, messages, pipe)])[-1]
+
+    @synchronized
+    def save_chats(self, chats: list[Tuple[str, argparse.Namespace, dict, list, Optional[str]]]) -> list[int]:
+        """
+        Save sessions in a single transaction (batch mode writes completed jobs in bulk).
+
+        Args:
+            chats (list): (title, args, plan, messages, pipe) entries.
+
+        Returns:
+            list[int]: The new session ids in order.
+        """
         cursor = self.connection.cursor()
+        ids = []
 
         cursor.execute("BEGIN TRANSACTION")
-        # Insert into chat_history
+        for title, args, plan, messages, pipe in chats:
+            # Insert into chat_history
+            cursor.execute(
+                """
+                INSERT INTO chat_history (title)
+                VALUES (?)
+                """, (title,)
+            )
+            chat_history_id = cursor.lastrowid
+            ids.append(chat_history_id)
+
+            # Insert into chat_history_details
+            cursor.execute(
+                """
+                INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input)
+                VALUES (?, ?, ?, ?)
+                """, (chat_history_id, json.dumps(self.args_to_dict(args)), json.dumps(plan), pipe)
+            )
+
+            # Insert into chat_history_message
+            cursor.executemany(
+                """
+                INSERT INTO chat_history_message (chat_history_id, message)
+                VALUES (?, ?)
+                """, [(chat_history_id, json.dumps(message)) for message in messages]
+            )
+
+        if ids:
+            cursor.execute(
+                """
+                INSERT INTO settings (setting, setting_value)
+                VALUES (?, ?)
+                ON CONFLICT(setting) DO UPDATE SET
+                    setting_value = excluded.setting_value
+                """,
+                ("last_session", f"{ids[-1]}")
+            )
+
+        # Commit the transaction
+        cursor.execute("COMMIT")
+        cursor.close()
+        return ids
+
+    @synchronized
+    def increment_setting(self, setting: str, amount: int = 1) -> None:
+        cursor = self.connection.cursor()
         cursor.execute(
             """
-            INSERT INTO chat_history (title)
-            VALUES (?)
-            """, (title,)
+            INSERT INTO settings (setting, setting_value)
+            VALUES (?, ?)
+            ON CONFLICT(setting) DO UPDATE SET
+                setting_value = CAST(setting_value AS INTEGER) + excluded.setting_value
+            """,
+            (setting, amount)
         )
-        chat_history_id = cursor.lastrowid
+        self.connection.commit()
+        cursor.close()
 
-        # Insert into chat_history_details
+    @synchronized
+    def counters(self, settings: list[str]) -> dict:
+        cursor = self.connection.cursor()
         cursor.execute(
-            """
-            INSERT INTO chat_history_details (chat_history_id, args, plan, pipe_input)
-            VALUES (?, ?, ?, ?)
-            """, (chat_history_id, json.dumps(self.args_to_dict(args)), json.dumps(plan), pipe)
+            f"""
+            SELECT setting, setting_value
+            FROM settings
+            WHERE setting IN ({",".join("?" * len(settings))})
+            """,
+            settings
         )
+        result = cursor.fetchall()
+        cursor.close()
+        counters = {setting: 0 for setting in settings}
+        for setting, value in result:
+            counters[setting] = int(value)
+        return counters
 
-        # Insert into chat_history_message
-        for message in messages:
+    @synchronized
+    def plan_cache_get(self, cache_key: str, ttl: int) -> Optional[dict]:
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT plan
+            FROM plan_cache
+            WHERE cache_key = ? AND created_on > strftime('%Y-%m-%d %H:%M:%f', 'now', ?)
+            """,
+            (cache_key, f"-{int(ttl)} seconds")
+        )
+        result = cursor.fetchone()
+        if result:
             cursor.execute(
                 """
-                INSERT INTO chat_history_message (chat_history_id, message)
-                VALUES (?, ?)
-                """, (chat_history_id, json.dumps(message))
+                UPDATE plan_cache
+                SET
+                    hits = hits + 1,
+                    accessed_on = strftime('%Y-%m-%d %H:%M:%f', 'now'),
+                    access_seq = (SELECT COALESCE(MAX(access_seq), 0) + 1 FROM plan_cache)
+                WHERE cache_key = ?
+                """,
+                (cache_key,)
             )
+            self.connection.commit()
+        cursor.close()
+        if result:
+            (plan,) = result
+            return json.loads(plan)
+        return None
 
+    @synchronized
+    def plan_cache_put(self, cache_key: str, kind: str, plan: dict, max_entries: int) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN TRANSACTION")
         cursor.execute(
             """
-            INSERT INTO settings (setting, setting_value)
-            VALUES (?, ?)
-            ON CONFLICT(setting) DO UPDATE SET
-                setting_value = excluded.setting_value
+            INSERT INTO plan_cache (cache_key, kind, plan, access_seq)
+            VALUES (?, ?, ?, (SELECT COALESCE(MAX(access_seq), 0) + 1 FROM plan_cache))
+            ON CONFLICT(cache_key) DO UPDATE SET
+                plan = excluded.plan,
+                hits = 0,
+                created_on = excluded.created_on,
+                accessed_on = excluded.accessed_on,
+                access_seq = excluded.access_seq
             """,
-            ("last_session", f"{chat_history_id}")
+            (cache_key, kind, json.dumps(plan))
         )
+        # Least recently used eviction, access_seq orders accesses within the same millisecond
+        cursor.execute(
+            """
+            DELETE FROM plan_cache
+            WHERE cache_key NOT IN (
+                SELECT cache_key FROM plan_cache ORDER BY access_seq DESC, accessed_on DESC LIMIT ?
+            )
+            """,
+            (max_entries,)
+        )
+        cursor.execute("COMMIT")
+        cursor.close()
 
-        # Commit the transaction
+    @synchronized
+    def plan_cache_clear(self) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute("DELETE FROM plan_cache")
+        self.connection.commit()
+        cursor.close()
+
+    @synchronized
+    def plan_cache_size(self) -> int:
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM plan_cache")
+        (count,) = cursor.fetchone()
+        cursor.close()
+        return count
+
+    @synchronized
+    def completion_cache_get(self, cache_key: str) -> Optional[str]:
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT response
+            FROM completion_cache
+            WHERE cache_key = ?
+            """,
+            (cache_key,)
+        )
+        result = cursor.fetchone()
+        if result:
+            cursor.execute(
+                """
+                UPDATE completion_cache
+                SET
+                    hits = hits + 1,
+                    accessed_on = strftime('%Y-%m-%d %H:%M:%f', 'now'),
+                    access_seq = (SELECT COALESCE(MAX(access_seq), 0) + 1 FROM completion_cache)
+                WHERE cache_key = ?
+                """,
+                (cache_key,)
+            )
+            self.connection.commit()
+        cursor.close()
+        if result:
+            (response,) = result
+            return response
+        return None
+
+    @synchronized
+    def completion_cache_put(self, cache_key: str, provider: str, model: str, response: str, max_bytes: int) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        cursor.execute(
+            """
+            INSERT INTO completion_cache (cache_key, provider, model, response, size, access_seq)
+            VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(access_seq), 0) + 1 FROM completion_cache))
+            ON CONFLICT(cache_key) DO UPDATE SET
+                response = excluded.response,
+                size = excluded.size,
+                accessed_on = excluded.accessed_on,
+                access_seq = excluded.access_seq
+            """,
+            (cache_key, provider, model, response, len(response))
+        )
+        # Least recently used eviction once the cache exceeds max_bytes, access_seq orders accesses within the
+        # same millisecond
+        cursor.execute(
+            """
+            DELETE FROM completion_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM (
+                    SELECT cache_key, SUM(size) OVER (ORDER BY access_seq DESC, accessed_on DESC, cache_key) AS total
+                    FROM completion_cache
+                )
+                WHERE total > ?
+            )
+            """,
+            (max_bytes,)
+        )
         cursor.execute("COMMIT")
         cursor.close()
 
+    @synchronized
+    def completion_cache_clear(self) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute("DELETE FROM completion_cache")
+        self.connection.commit()
+        cursor.close()
+
+    @synchronized
+    def completion_cache_size(self) -> Tuple[int, int]:
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completion_cache")
+        (count, size) = cursor.fetchone()
+        cursor.close()
+        return count, size
+
+    @synchronized
+    def rate_limit_acquire(self, buckets: list[Tuple[str, float, float]], now: float) -> float:
+        """
+        Atomically take `cost` from each of a set of per-minute token buckets shared by all smah processes.
+
+        Args:
+            buckets (list[Tuple[str, float, float]]): (bucket, capacity per minute, cost) entries.
+            now (float): Current epoch time.
+
+        Returns:
+            float: 0 if the cost was taken from every bucket, otherwise seconds until it can be.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            wait = 0.0
+            for bucket, capacity, cost in buckets:
+                cursor.execute("SELECT tokens, updated_on FROM rate_limit WHERE bucket = ?", (bucket,))
+                row = cursor.fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+                cost = min(cost, capacity)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) * 60 / capacity)
+                levels.append((bucket, tokens - cost))
+            if wait == 0:
+                cursor.executemany(
+                    """
+                    INSERT INTO rate_limit (bucket, tokens, updated_on)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(bucket) DO UPDATE SET
+                        tokens = excluded.tokens,
+                        updated_on = excluded.updated_on
+                    """,
+                    [(bucket, tokens, now) for bucket, tokens in levels]
+                )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+        return wait
+
+    @synchronized
+    def rate_limit_adjust(self, bucket: str, capacity: float, delta: float, now: float, ceiling: Optional[float] = None) -> None:
+        """
+        Credit or debit a shared token bucket (e.g. refund over-estimated usage), optionally capping its level
+        at `ceiling` (a negative ceiling holds off every process after a 429).
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("SELECT tokens, updated_on FROM rate_limit WHERE bucket = ?", (bucket,))
+            row = cursor.fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+            cursor.execute(
+                """
+                INSERT INTO rate_limit (bucket, tokens, updated_on)
+                VALUES (?, ?, ?)
+                ON CONFLICT(bucket) DO UPDATE SET
+                    tokens = excluded.tokens,
+                    updated_on = excluded.updated_on
+                """,
+                (bucket, min(capacity if ceiling is None else ceiling, tokens + delta), now)
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+
+    @synchronized
+    def telemetry_record(self, record: dict) -> None:
+        """
+        Store an inference call's telemetry (see smah.runner.telemetry.Telemetry.to_record).
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            INSERT INTO inference_telemetry ({", ".join(record)})
+            VALUES ({", ".join("?" * len(record))})
+            """,
+            list(record.values())
+        )
+        self.connection.commit()
+        cursor.close()
+
+    @synchronized
+    def telemetry_first_tokens(self, provider: str, model: str, limit: int) -> list[float]:
+        """
+        Time to first token of a model's most recent successful streamed calls.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT first_token
+            FROM inference_telemetry
+            WHERE provider = ? AND model = ? AND streamed = 1 AND status = 'ok' AND first_token IS NOT NULL
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (provider, model, limit)
+        )
+        values = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return values
+
+    @synchronized
+    def telemetry(self, since: Optional[str] = None, model: Optional[str] = None, phase: Optional[str] = None) -> list[dict]:
+        """
+        Inference telemetry rows, optionally filtered by created_on (`YYYY-MM-DD HH:MM:SS`), model and phase.
+        """
+        conditions = []
+        params = []
+        if since:
+            conditions.append("created_on >= ?")
+            params.append(since)
+        if model:
+            conditions.append("(model = ? OR provider || '.' || model = ?)")
+            params.extend([model, model])
+        if phase:
+            conditions.append("phase = ?")
+            params.append(phase)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            SELECT provider || '.' || model AS model, phase, streamed, status, queue_wait, first_token, latency,
+                prompt_tokens, completion_tokens, cached_tokens, cost, created_on
+            FROM inference_telemetry
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY id ASC
+            """,
+            params
+        )
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        cursor.close()
+        return rows
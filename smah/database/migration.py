@@ -52,7 +52,7 @@ class Migration:
     def get_migrations():
         migrations = []
         os.makedirs(Migration.MIGRATIONS_DIR, exist_ok=True)
-        for migration in os.listdir(Migration.MIGRATIONS_DIR):
+        for migration in sorted(os.listdir(Migration.MIGRATIONS_DIR)):
             if migration.endswith(".py"):
                 digest = hashlib.md5(open(os.path.join(Migration.MIGRATIONS_DIR, migration), "rb").read()).hexdigest()
                 migrations.append({'file': migration, 'checksum': digest})
@@ -0,0 +1,29 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS plan_cache(
+            cache_key CHAR(64) PRIMARY KEY,
+            kind VARCHAR(16),
+            plan JSON,
+            hits INTEGER DEFAULT 0,
+            created_on TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            accessed_on TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS plan_cache_accessed_on ON plan_cache(accessed_on)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX plan_cache_accessed_on")
+    cursor.execute("DROP TABLE plan_cache")
\ No newline at end of file
@@ -0,0 +1,31 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS completion_cache(
+            cache_key CHAR(64) PRIMARY KEY,
+            provider VARCHAR(64),
+            model VARCHAR(128),
+            response JSON,
+            size INTEGER,
+            hits INTEGER DEFAULT 0,
+            created_on TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            accessed_on TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS completion_cache_accessed_on ON completion_cache(accessed_on)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX completion_cache_accessed_on")
+    cursor.execute("DROP TABLE completion_cache")
\ No newline at end of file
@@ -0,0 +1,20 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit(
+            bucket VARCHAR(255) PRIMARY KEY,
+            tokens REAL,
+            updated_on REAL
+        )
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP TABLE rate_limit")
@@ -0,0 +1,37 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inference_telemetry(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider VARCHAR(64),
+            model VARCHAR(128),
+            phase VARCHAR(32),
+            streamed BOOLEAN,
+            status VARCHAR(64),
+            queue_wait REAL,
+            first_token REAL,
+            latency REAL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached_tokens INTEGER,
+            cost REAL,
+            created_on TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS inference_telemetry_created_on ON inference_telemetry(created_on)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX inference_telemetry_created_on")
+    cursor.execute("DROP TABLE inference_telemetry")
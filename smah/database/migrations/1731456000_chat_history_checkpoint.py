@@ -0,0 +1,30 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_history_checkpoint(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_history_id INTEGER,
+            message_id INTEGER,
+            message JSON,
+            tokens INTEGER,
+            created_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(chat_history_id) REFERENCES chat_history(id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS chat_history_checkpoint_chat_history_id ON chat_history_checkpoint(chat_history_id)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX chat_history_checkpoint_chat_history_id")
+    cursor.execute("DROP TABLE chat_history_checkpoint")
@@ -0,0 +1,16 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS inference_telemetry_model ON inference_telemetry(provider, model)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX inference_telemetry_model")
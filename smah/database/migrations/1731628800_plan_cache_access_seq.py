@@ -0,0 +1,22 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        ALTER TABLE plan_cache ADD COLUMN access_seq INTEGER DEFAULT 0
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS plan_cache_access_seq ON plan_cache(access_seq)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX plan_cache_access_seq")
+    cursor.execute("ALTER TABLE plan_cache DROP COLUMN access_seq")
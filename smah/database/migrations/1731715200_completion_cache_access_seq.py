@@ -0,0 +1,22 @@
+def up(cursor):
+    """
+    Apply schema.
+    """
+    cursor.execute(
+        """
+        ALTER TABLE completion_cache ADD COLUMN access_seq INTEGER DEFAULT 0
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS completion_cache_access_seq ON completion_cache(access_seq)
+        """
+    )
+
+
+def down(cursor):
+    """
+    Rollback schema.
+    """
+    cursor.execute("DROP INDEX completion_cache_access_seq")
+    cursor.execute("ALTER TABLE completion_cache DROP COLUMN access_seq")
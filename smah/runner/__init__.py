@@ -1,4 +1,6 @@
 # smah/runner/__init__.py
 from .runner import Runner
+from .async_runner import AsyncRunner
+from .client_pool import ClientPool
 
-__all__ = ['Runner']
\ No newline at end of file
+__all__ = ['Runner', 'AsyncRunner', 'ClientPool']
\ No newline at end of file
@@ -0,0 +1,507 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Callable, Generator, Optional, TextIO, Tuple, TypeVar
+
+from openai import AsyncOpenAI, NotGiven, NOT_GIVEN
+from openai.types.chat import ChatCompletion
+
+from smah.runner.backends import Backend
+from smah.runner.client_pool import ClientPool
+from smah.runner.completion_call import CompletionCall
+from smah.runner.prompts import Prompts
+from smah.runner.runner import Runner
+from smah.settings.inference.provider.model import Model
+
+R = TypeVar("R")
+
+
+class AsyncRunner(Runner):
+    """
+    Asyncio execution path for headless/automation use.
+
+    Shares prompt/thread assembly with Runner but performs inference through the async OpenAI client,
+    collects system stats (psutil) off the event loop and serializes database writes on a dedicated
+    thread so that a single process can drive many concurrent requests.
+    Interactive concerns (rendering, command confirmation) are left to the caller.
+    """
+    BATCH_FLUSH = 32
+
+    def __init__(self, args, settings):
+        super().__init__(args, settings)
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smah-db")
+
+    def openai_client(self, model: Model) -> AsyncOpenAI:
+        return self.backend(model).async_client(self.args)
+
+    async def close(self) -> None:
+        """
+        Close the pooled provider clients opened on the running event loop; await before the loop ends.
+        """
+        await ClientPool.aclose()
+
+    async def database(self, method, *args, **kwargs):
+        """
+        Run a Database method on the database thread.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, functools.partial(method, *args, **kwargs))
+
+    async def scheduled(self, call: CompletionCall, request: Callable[[], Awaitable[R]], max_wait: Optional[float] = None) -> R:
+        """
+        Await a request within the shared rate limit budget, retrying retryable failures (see RateLimiter.call).
+        """
+        schedule = call.limiter.schedule(call.model, call.cost, max_wait)
+        while True:
+            while (delay := await self.database(schedule.wait)) > 0:
+                await asyncio.sleep(delay)
+            call.telemetry.send()
+            try:
+                return await request()
+            except Exception as e:
+                delay = await self.database(schedule.retry, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def system_settings(self, include_system: bool = True) -> dict:
+        """
+        Build the system settings prompt off the event loop.
+        """
+        return await asyncio.to_thread(Prompts.system_settings, self.settings, include_system=include_system)
+
+    async def system_stats(self) -> dict:
+        """
+        Build the system stats prompt off the event loop (stat collection blocks on psutil).
+        """
+        return await asyncio.to_thread(Prompts.system_stats, self.settings)
+
+    async def run(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            fallbacks: Optional[list[Model]] = None
+            ) -> Optional[ChatCompletion]:
+        """
+        Run a completion, failing over to the fallback models in order (see Runner.run).
+        """
+        for candidate, fallback, max_wait in self.failover_candidates(model, fallbacks):
+            try:
+                return await self.run_model(
+                    candidate,
+                    thread,
+                    response_format=response_format,
+                    tools=tools,
+                    options=options,
+                    show=show,
+                    phase=phase,
+                    max_wait=max_wait
+                )
+            except Backend.FAILOVER_ERRORS as e:
+                if fallback is None:
+                    raise
+                await self.database(self.log_failover, candidate, fallback, e)
+        return None
+
+    async def run_model(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            max_wait: Optional[float] = None
+            ) -> Optional[ChatCompletion]:
+        call = self.completion_call(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase)
+        if call is None:
+            return None
+        response = await self.database(call.cached)
+        if response:
+            return response
+
+        client = self.openai_client(model)
+        try:
+            response = await self.scheduled(call, lambda: client.chat.completions.create(**call.request), max_wait=max_wait)
+        except Exception as e:
+            await self.database(call.failed, e)
+            raise
+        return await self.database(call.completed, response)
+
+    async def stream(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            fallbacks: Optional[list[Model]] = None
+            ) -> AsyncGenerator[str, None]:
+        """
+        Run a completion yielding content deltas as they arrive, failing over to the fallback models in order
+        when a provider errors or is saturated before the first delta arrives (see Runner.stream).
+        """
+        for candidate, fallback, max_wait in self.failover_candidates(model, fallbacks):
+            started = False
+            try:
+                async for delta in self.stream_model(
+                    candidate,
+                    thread,
+                    response_format=response_format,
+                    tools=tools,
+                    options=options,
+                    show=show,
+                    phase=phase,
+                    max_wait=max_wait
+                ):
+                    started = True
+                    yield delta
+                return
+            except Backend.FAILOVER_ERRORS as e:
+                if fallback is None or started:
+                    raise
+                await self.database(self.log_failover, candidate, fallback, e)
+
+    async def stream_model(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            max_wait: Optional[float] = None
+            ) -> AsyncGenerator[str, None]:
+        """
+        Run a completion against a single model yielding content deltas as they arrive.
+        """
+        if not self.streaming(model):
+            response = await self.run_model(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase, max_wait=max_wait)
+            if response is not None:
+                yield response.choices[0].message.content or ""
+            return
+
+        call = self.completion_call(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase, streamed=True)
+        if call is None:
+            return
+        cached = await self.database(call.cached)
+        if cached:
+            yield cached.choices[0].message.content or ""
+            return
+
+        client = self.openai_client(model)
+        try:
+            response = await self.scheduled(
+                call,
+                lambda: client.chat.completions.create(
+                    **call.request,
+                    stream=True,
+                    stream_options=self.backend(model).stream_options()
+                ),
+                max_wait=max_wait
+            )
+            async with response:
+                async for chunk in response:
+                    delta = call.chunk(chunk)
+                    if delta:
+                        yield delta
+        except Exception as e:
+            await self.database(call.failed, e)
+            raise
+        await self.database(call.streamed)
+
+    async def complete(self,
+            model: Model,
+            thread: list,
+            options: Optional[dict] = None,
+            phase: str = "query",
+            fallbacks: Optional[list[Model]] = None
+            ) -> str:
+        """
+        Run a completion and return the assembled content (streamed when enabled).
+        """
+        content = []
+        async for delta in self.stream(model, thread, options=options, phase=phase, fallbacks=fallbacks):
+            content.append(delta)
+        return "".join(content)
+
+    async def query_plan(self, query: str, system_settings: Optional[dict] = None, planner: Optional[Model] = None) -> Optional[Tuple[bool, dict]]:
+        self.log_mode("Query Plan", show=self.args.verbose >= 1)
+        planner = planner or self.inference_model("query")
+        cache_key = self.plan_cache.key("query", query, planner=f"{planner.provider}.{planner.name}")
+        plan = await self.database(self.plan_cache.get, cache_key)
+        if plan:
+            return True, plan
+        local = self.local_planner.plan("query", query)
+        if self.local_planner.confident(local):
+            await self.database(self.local_planner.record, local)
+            return True, local[1]
+        system_settings = system_settings or await self.system_settings()
+        response = await self.run(
+            model=planner,
+            thread=self.query_plan_thread(query, system_settings=system_settings, system_stats=await self.system_stats()),
+            response_format=Prompts.planner_response_format(),
+            phase="plan",
+            fallbacks=self.fallback_models(planner, "query")
+        )
+        plan = self.planner_response(response)
+        if plan:
+            await self.database(self.local_planner.record, local, plan[1])
+            await self.database(self.plan_cache.put, cache_key, "query", plan[1])
+        return plan
+
+    async def pipe_plan(self, query: str, pipe: str, system_settings: Optional[dict] = None, planner: Optional[Model] = None) -> Optional[Tuple[bool, dict]]:
+        self.log_mode("Pipe Plan", show=self.args.verbose >= 1)
+        planner = planner or self.inference_model("pipe")
+        cache_key = self.plan_cache.key("pipe", query, planner=f"{planner.provider}.{planner.name}", pipe=pipe)
+        plan = await self.database(self.plan_cache.get, cache_key)
+        if plan:
+            return True, plan
+        local = self.local_planner.plan("pipe", query, pipe)
+        if self.local_planner.confident(local):
+            await self.database(self.local_planner.record, local)
+            return True, local[1]
+        system_settings = system_settings or await self.system_settings()
+        response = await self.run(
+            model=planner,
+            thread=self.pipe_plan_thread(query, pipe, system_settings=system_settings, system_stats=await self.system_stats()),
+            response_format=Prompts.planner_response_format(),
+            phase="plan",
+            fallbacks=self.fallback_models(planner, "pipe")
+        )
+        plan = self.planner_response(response)
+        if plan:
+            await self.database(self.local_planner.record, local, plan[1])
+            await self.database(self.plan_cache.put, cache_key, "pipe", plan[1])
+        return plan
+
+    async def plan_settings(self, plan: dict, system_settings: dict) -> dict:
+        """
+        Reuse the planner's system settings prompt when the plan asks for system details.
+        """
+        if plan["include_settings"]:
+            return system_settings
+        return await self.system_settings(include_system=False)
+
+    def job_model(self, name: Optional[str]) -> Optional[Model]:
+        """
+        Resolve a model override by catalog id (e.g. `openai.gpt-4o-mini`).
+        """
+        if name is None:
+            return None
+        if name not in self.settings.inference.models:
+            raise ValueError(f"Unknown model: {name}")
+        return self.settings.inference.models[name]
+
+    async def query_session(self,
+            query: str,
+            system_settings: Optional[dict] = None,
+            model: Optional[str] = None,
+            planner: Optional[str] = None
+            ) -> Optional[dict]:
+        """
+        Plan and run a query, returning the session to record (title, plan, messages, pipe) and response content.
+        """
+        self.log_mode("Query", show=self.args.verbose >= 1)
+        system_settings = system_settings or await self.system_settings()
+        plan = await self.query_plan(query, system_settings=system_settings, planner=self.job_model(planner))
+        if plan:
+            _, p = plan
+            if self.job_model(model):
+                p = {**p, 'model': model}
+            self.log_query_plan(p, show=self.args.verbose >= 2)
+            request = self.query_request(query, p)
+            thread = self.query_thread(
+                request,
+                p,
+                system_settings=await self.plan_settings(p, system_settings),
+                system_stats=await self.system_stats() if p["include_settings"] else None
+            )
+            selected = self.settings.inference.models[p["model"]]
+            # Jobs that pin a model do not fail over.
+            fallbacks = [] if model else self.fallback_models(selected, "query")
+            content = await self.complete(selected, thread, fallbacks=fallbacks)
+            return {
+                'title': p["title"],
+                'plan': p,
+                'messages': [
+                    Prompts.message(content=request),
+                    {'role': 'assistant', 'content': content}
+                ],
+                'pipe': None,
+                'content': content
+            }
+        logging.error("Query plan failed for: %s", query)
+        return None
+
+    async def pipe_session(self,
+            query: str,
+            pipe: str,
+            system_settings: Optional[dict] = None,
+            model: Optional[str] = None,
+            planner: Optional[str] = None
+            ) -> Optional[dict]:
+        """
+        Plan and run a pipe request, returning the session to record (title, plan, messages, pipe) and response content.
+        """
+        self.log_mode("Pipe", show=self.args.verbose >= 1)
+        system_settings = system_settings or await self.system_settings()
+        plan = await self.pipe_plan(query, pipe, system_settings=system_settings, planner=self.job_model(planner))
+        if plan:
+            _, p = plan
+            if self.job_model(model):
+                p = {**p, 'model': model}
+            self.log_pipe_plan(p, show=self.args.verbose >= 2)
+            request = self.pipe_input_request(query, pipe, p)
+            thread = self.pipe_thread(
+                request,
+                p,
+                system_settings=await self.plan_settings(p, system_settings),
+                system_stats=await self.system_stats() if p["include_settings"] else None
+            )
+            selected = self.settings.inference.models[p["model"]]
+            # Jobs that pin a model do not fail over.
+            fallbacks = [] if model else self.fallback_models(selected, "pipe")
+            content = await self.complete(selected, thread, phase="pipe", fallbacks=fallbacks)
+            return {
+                'title': p["title"],
+                'plan': p,
+                'messages': [
+                    Prompts.message(content=self.pipe_history_request(query, p)),
+                    {'role': 'assistant', 'content': content}
+                ],
+                'pipe': pipe,
+                'content': content
+            }
+        logging.error("Pipe plan failed for: %s", query)
+        return None
+
+    async def save_sessions(self, sessions: list[dict]) -> list[int]:
+        return await self.database(
+            self.db.save_chats,
+            [(session['title'], self.args, session['plan'], session['messages'], session['pipe']) for session in sessions]
+        )
+
+    async def query(self, query: str) -> Optional[str]:
+        """
+        Plan and run a query, returning the response content and recording the session.
+        """
+        session = await self.query_session(query)
+        if session:
+            await self.save_sessions([session])
+            return session['content']
+        return None
+
+    async def pipe(self, query: str, pipe: str) -> Optional[str]:
+        """
+        Plan and run a pipe request, returning the response content and recording the session.
+        """
+        session = await self.pipe_session(query, pipe)
+        if session:
+            await self.save_sessions([session])
+            return session['content']
+        return None
+
+    @staticmethod
+    def read_jobs(jobs: TextIO) -> Generator[dict, None, None]:
+        """
+        Parse batch jobs, one JSON object per line: `{"id": ..., "query": ..., "pipe": "input.log", "model": ..., "planner": ...}`.
+
+        Blank lines and lines starting with `#` are skipped, jobs without an id are numbered by line.
+        """
+        for number, line in enumerate(jobs, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError("job must be a JSON object")
+            except ValueError as e:
+                job = {'error': f"Invalid job on line {number}: {e}"}
+            job.setdefault('id', number)
+            yield job
+
+    async def run_job(self, job: dict, system_settings: dict) -> Tuple[dict, Optional[dict]]:
+        """
+        Run a batch job, returning its result record and the session to save (None on failure).
+        """
+        started = time.monotonic()
+        try:
+            if job.get('error'):
+                raise ValueError(job['error'])
+            if not job.get('query'):
+                raise ValueError("Job has no query")
+            if job.get('pipe'):
+                pipe = await asyncio.to_thread(Path(job['pipe']).expanduser().read_text)
+                session = await self.pipe_session(job['query'], pipe, system_settings, model=job.get('model'), planner=job.get('planner'))
+            else:
+                session = await self.query_session(job['query'], system_settings, model=job.get('model'), planner=job.get('planner'))
+            if session is None:
+                raise RuntimeError("Planning failed")
+            return {
+                'id': job['id'],
+                'status': "ok",
+                'title': session['title'],
+                'model': session['plan']['model'],
+                'content': session['content'],
+                'elapsed': round(time.monotonic() - started, 3),
+            }, session
+        except Exception as e:
+            logging.error("Batch job %s failed: %s", job.get('id'), str(e))
+            return {
+                'id': job.get('id'),
+                'status': "error",
+                'error': str(e),
+                'elapsed': round(time.monotonic() - started, 3),
+            }, None
+
+    async def batch(self, jobs: TextIO, out: TextIO, concurrency: int = 8) -> dict:
+        """
+        Run batch jobs with at most `concurrency` in flight.
+
+        Results are written to `out` as JSON lines in completion order. Jobs are read lazily and completed
+        sessions are saved in bulk (every BATCH_FLUSH sessions), so memory use does not grow with the job count.
+
+        Returns:
+            dict: ok/error job counts.
+        """
+        self.log_mode("Batch", show=self.args.verbose >= 1)
+        system_settings = await self.system_settings()
+        counts = {'ok': 0, 'error': 0}
+        sessions = []
+        pending = set()
+
+        async def collect(done):
+            for task in done:
+                result, session = task.result()
+                counts[result['status']] += 1
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                if session:
+                    sessions.append(session)
+            if len(sessions) >= self.BATCH_FLUSH:
+                await self.save_sessions(sessions)
+                sessions.clear()
+
+        for job in self.read_jobs(jobs):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await collect(done)
+            pending.add(asyncio.create_task(self.run_job(job, system_settings)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await collect(done)
+        if sessions:
+            await self.save_sessions(sessions)
+        logging.info(f"Batch complete: {counts}")
+        return counts
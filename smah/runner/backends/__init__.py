@@ -0,0 +1,10 @@
+# smah/runner/backends/__init__.py
+from .backend import Backend
+from .openai_backend import OpenAIBackend
+from .openai_compatible_backend import OpenAICompatibleBackend
+
+Backend.register("openai", OpenAIBackend)
+Backend.register("fake", OpenAIBackend)
+Backend.register("openai-compatible", OpenAICompatibleBackend)
+
+__all__ = ['Backend', 'OpenAIBackend', 'OpenAICompatibleBackend']
@@ -0,0 +1,79 @@
+import inspect
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import openai
+from openai import AsyncOpenAI, NotGiven, NOT_GIVEN, OpenAI
+
+from smah.runner.rate_limiter import ProviderSaturated
+from smah.settings.inference.provider import Provider
+
+
+class Backend(ABC):
+    """
+    Inference backend for a provider.
+
+    Backends are resolved by the provider's `backend` setting, falling back to its identifier, so any provider
+    entry in config.yaml can be served by a registered backend:
+
+    ```yaml
+    providers:
+      local:
+        name: llama.cpp
+        enabled: true
+        settings:
+          backend: openai-compatible     # optional when base_url is set
+          base_url: http://localhost:8080/v1
+    ```
+
+    Providers with a `base_url` but no registered backend use the generic `openai-compatible` backend.
+    """
+    FAILOVER_ERRORS = (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.AuthenticationError,
+        openai.PermissionDeniedError,
+        openai.NotFoundError,
+        ProviderSaturated,
+    )
+    registry: dict[str, type["Backend"]] = {}
+
+    @staticmethod
+    def register(name: str, backend: type["Backend"]) -> None:
+        if inspect.isabstract(backend):
+            missing = ", ".join(sorted(backend.__abstractmethods__))
+            raise TypeError(f"Backend {backend.__name__} does not implement {missing}")
+        Backend.registry[name] = backend
+
+    @staticmethod
+    def resolve(provider: Provider) -> Optional["Backend"]:
+        """
+        The backend serving a provider, or None if the provider is not supported.
+        """
+        settings = provider.settings or {}
+        backend = Backend.registry.get(settings.get("backend") or provider.identifier)
+        if backend is None and settings.get("base_url"):
+            backend = Backend.registry.get("openai-compatible")
+        return backend(provider) if backend else None
+
+    def __init__(self, provider: Provider):
+        self.provider = provider
+        self.settings: dict = provider.settings or {}
+
+    @abstractmethod
+    def client(self, args) -> OpenAI:
+        pass
+
+    @abstractmethod
+    def async_client(self, args) -> AsyncOpenAI:
+        pass
+
+    def request(self, request: dict) -> dict:
+        """
+        Adapt chat completion request arguments to what the backend supports.
+        """
+        return request
+
+    def stream_options(self) -> dict | NotGiven:
+        return NOT_GIVEN
@@ -0,0 +1,19 @@
+from openai import AsyncOpenAI, NotGiven, OpenAI
+
+from smah.runner.backends.backend import Backend
+from smah.runner.client_pool import ClientPool
+
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI chat completions API through the pooled OpenAI SDK clients (also serves the in-process fake provider).
+    """
+
+    def client(self, args) -> OpenAI:
+        return ClientPool.client(self.provider, args)
+
+    def async_client(self, args) -> AsyncOpenAI:
+        return ClientPool.async_client(self.provider, args)
+
+    def stream_options(self) -> dict | NotGiven:
+        return {"include_usage": True}
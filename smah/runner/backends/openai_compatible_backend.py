@@ -0,0 +1,34 @@
+from openai import NotGiven, NOT_GIVEN
+
+from smah.runner.backends.openai_backend import OpenAIBackend
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """
+    Generic backend for servers implementing the OpenAI chat completions API (llama.cpp, vLLM, Ollama, LM Studio, ...).
+
+    Requests are adapted to the subset such servers commonly support, configurable per provider:
+
+    ```yaml
+    settings:
+      base_url: http://localhost:8000/v1
+      json_schema: true      # false: send json_schema response formats as plain json_object
+      stream_usage: true     # false: do not request usage with streamed responses
+    ```
+
+    `max_completion_tokens` is always sent as `max_tokens`.
+    """
+
+    def request(self, request: dict) -> dict:
+        request = dict(request)
+        max_completion_tokens = request.get("max_completion_tokens")
+        if max_completion_tokens is not None and not isinstance(max_completion_tokens, NotGiven):
+            request["max_tokens"] = max_completion_tokens
+            request["max_completion_tokens"] = NOT_GIVEN
+        response_format = request.get("response_format")
+        if not self.settings.get("json_schema", True) and isinstance(response_format, dict) and response_format.get("type") == "json_schema":
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def stream_options(self) -> dict | NotGiven:
+        return {"include_usage": True} if self.settings.get("stream_usage", True) else NOT_GIVEN
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import logging
+import threading
+
+import httpx
+import rich.box
+import yaml
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from smah.console import err_console
+from smah.runner.fake_provider import FakeProvider, FakeTransport, AsyncFakeTransport
+from smah.settings.inference.provider import Provider
+
+
+class PoolStats:
+    """
+    Request/connection counters for a pooled client.
+
+    Connection events are collected through the httpcore `trace` request extension,
+    so `reused` counts requests that were served over an already open keep-alive connection.
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    def record(self, event: str) -> None:
+        with self.lock:
+            if event == "request":
+                self.requests += 1
+            elif event == "lookup":
+                self.lookups += 1
+            elif event == "connection.connect_tcp.complete":
+                self.connections += 1
+            elif event == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def trace(self, event: str, info: dict) -> None:
+        self.record(event)
+
+    async def atrace(self, event: str, info: dict) -> None:
+        self.record(event)
+
+    def request_hook(self, request: httpx.Request) -> None:
+        self.record("request")
+        request.extensions["trace"] = self.trace
+
+    async def async_request_hook(self, request: httpx.Request) -> None:
+        self.record("request")
+        request.extensions["trace"] = self.atrace
+
+    def to_yaml(self) -> dict:
+        return {
+            'lookups': self.lookups,
+            'requests': self.requests,
+            'connections': self.connections,
+            'tls_handshakes': self.tls_handshakes,
+            'reused': max(self.requests - self.connections, 0),
+        }
+
+
+class ClientPool:
+    """
+    Process wide registry of provider clients.
+
+    Clients are keyed on provider identifier, credentials and endpoint, so planner and main calls
+    (and every request made by batch/interactive sessions) share one keep-alive connection pool
+    rather than paying a TLS handshake per call. Pool size and timeouts are read from the
+    provider `settings` block in config.yaml:
+
+    ```yaml
+    providers:
+      openai:
+        settings:
+          pool_size: 10          # max open connections
+          pool_keepalive: 5      # max idle keep-alive connections
+          keepalive_expiry: 30   # seconds an idle connection is kept
+          timeout: 600           # request timeout (seconds)
+          connect_timeout: 5     # connect timeout (seconds)
+          max_retries: 0         # SDK level retries, smah retries through RateLimiter (`retries`)
+    ```
+    """
+    DEFAULT_SETTINGS = {
+        "pool_size": 10,
+        "pool_keepalive": 5,
+        "keepalive_expiry": 30.0,
+        "timeout": 600.0,
+        "connect_timeout": 5.0,
+        "max_retries": 0,
+    }
+
+    lock = threading.Lock()
+    clients: dict = {}
+    stats: dict[tuple, PoolStats] = {}
+
+    @staticmethod
+    def setting(provider: Provider, name: str):
+        v = (provider.settings or {}).get(name)
+        return ClientPool.DEFAULT_SETTINGS[name] if v is None else v
+
+    @staticmethod
+    def fake(provider: Provider) -> bool:
+        """
+        Whether requests for the provider are answered in-process by FakeProvider
+        (the `fake` provider, or any provider with `backend: fake`).
+        """
+        return provider.identifier == "fake" or (provider.settings or {}).get("backend") == "fake"
+
+    @staticmethod
+    def credentials(provider: Provider, args) -> dict:
+        settings = provider.settings or {}
+        api_key = provider.api_key(args)
+        if not api_key and provider.identifier != "openai":
+            # Local OpenAI compatible servers (and the fake provider) do not check keys, but the SDK requires one.
+            api_key = provider.identifier
+        return {
+            'api_key': api_key,
+            'organization': getattr(args, "openai_api_org", None) if provider.identifier == "openai" else None,
+            'base_url': settings.get("base_url"),
+        }
+
+    @staticmethod
+    def key(provider: Provider, credentials: dict, kind: str) -> tuple:
+        digest = hashlib.sha256(
+            "\0".join(str(credentials[k] or "") for k in ['api_key', 'organization', 'base_url']).encode()
+        ).hexdigest()[:16]
+        return provider.identifier, digest, kind
+
+    @staticmethod
+    def limits(provider: Provider) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=ClientPool.setting(provider, "pool_size"),
+            max_keepalive_connections=ClientPool.setting(provider, "pool_keepalive"),
+            keepalive_expiry=ClientPool.setting(provider, "keepalive_expiry")
+        )
+
+    @staticmethod
+    def timeout(provider: Provider) -> httpx.Timeout:
+        return httpx.Timeout(
+            ClientPool.setting(provider, "timeout"),
+            connect=ClientPool.setting(provider, "connect_timeout")
+        )
+
+    @staticmethod
+    def pool_stats(key: tuple) -> PoolStats:
+        stats = ClientPool.stats.get(key)
+        if stats is None:
+            stats = PoolStats(f"{key[0]}.{key[2]}")
+            ClientPool.stats[key] = stats
+        return stats
+
+    @staticmethod
+    def client(provider: Provider, args) -> OpenAI:
+        """
+        Return the shared synchronous client for a provider, creating it on first use.
+        """
+        credentials = ClientPool.credentials(provider, args)
+        key = ClientPool.key(provider, credentials, "sync")
+        with ClientPool.lock:
+            stats = ClientPool.pool_stats(key)
+            stats.record("lookup")
+            client = ClientPool.clients.get(key)
+            if client is None:
+                logging.debug(f"Creating pooled client {stats.label}")
+                client = OpenAI(
+                    **credentials,
+                    max_retries=ClientPool.setting(provider, "max_retries"),
+                    http_client=DefaultHttpxClient(
+                        limits=ClientPool.limits(provider),
+                        timeout=ClientPool.timeout(provider),
+                        event_hooks={'request': [stats.request_hook]},
+                        **({'transport': FakeTransport(FakeProvider(provider))} if ClientPool.fake(provider) else {})
+                    )
+                )
+                ClientPool.clients[key] = client
+            return client
+
+    @staticmethod
+    def async_client(provider: Provider, args) -> AsyncOpenAI:
+        """
+        Return the shared async client for a provider on the running event loop.
+
+        Async connection pools are bound to the loop they were opened on, so clients are kept per loop.
+        Close them with aclose before the loop ends; clients left on a loop that has ended are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        credentials = ClientPool.credentials(provider, args)
+        key = ClientPool.key(provider, credentials, "async")
+        with ClientPool.lock:
+            stats = ClientPool.pool_stats(key)
+            stats.record("lookup")
+            ClientPool.prune()
+            entry = ClientPool.clients.get((*key, id(loop)))
+            if entry is None or entry[0] is not loop:
+                logging.debug(f"Creating pooled client {stats.label}")
+                client = AsyncOpenAI(
+                    **credentials,
+                    max_retries=ClientPool.setting(provider, "max_retries"),
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=ClientPool.limits(provider),
+                        timeout=ClientPool.timeout(provider),
+                        event_hooks={'request': [stats.async_request_hook]},
+                        **({'transport': AsyncFakeTransport(FakeProvider(provider))} if ClientPool.fake(provider) else {})
+                    )
+                )
+                entry = (loop, client)
+                ClientPool.clients[(*key, id(loop))] = entry
+            return entry[1]
+
+    @staticmethod
+    def prune() -> None:
+        """
+        Drop async clients whose event loop has ended (their connections can no longer be closed). Holds the lock.
+        """
+        for key, entry in list(ClientPool.clients.items()):
+            if isinstance(entry, tuple) and entry[0].is_closed():
+                logging.debug(f"Dropping pooled client {key[0]}.{key[2]} of an ended event loop")
+                ClientPool.clients.pop(key)
+
+    @staticmethod
+    async def aclose() -> None:
+        """
+        Close the pooled async clients opened on the running event loop (see AsyncRunner.close).
+        """
+        loop = asyncio.get_running_loop()
+        with ClientPool.lock:
+            keys = [key for key, entry in ClientPool.clients.items() if isinstance(entry, tuple) and entry[0] is loop]
+            clients = [ClientPool.clients.pop(key)[1] for key in keys]
+        for client in clients:
+            await client.close()
+
+    @staticmethod
+    def report() -> dict:
+        with ClientPool.lock:
+            return {stats.label: stats.to_yaml() for stats in ClientPool.stats.values()}
+
+    @staticmethod
+    def log_stats(level: int = logging.DEBUG, show: bool = False) -> None:
+        report = ClientPool.report()
+        if not report:
+            return
+        payload = yaml.dump(report, sort_keys=False)
+        logging.log(level, f"Client Pool Stats:\n{payload}")
+        if show:
+            err_console.print(Panel(
+                Markdown("```yaml\n" + payload + "\n```\n"),
+                title="Client Pool Stats",
+                style="bold white",
+                box=rich.box.ROUNDED)
+            )
+
+    @staticmethod
+    def close() -> None:
+        """
+        Close all pooled synchronous clients. Async clients can only be closed on their event loop
+        (aclose), any still registered are dropped.
+        """
+        with ClientPool.lock:
+            for key, client in list(ClientPool.clients.items()):
+                if isinstance(client, OpenAI):
+                    client.close()
+                ClientPool.clients.pop(key)
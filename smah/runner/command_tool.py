@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from smah.runner.context_budget import ContextBudget
+from smah.runner.pipe_chunker import PipeChunker
+from smah.runner.tokens import Tokens
+from smah.settings import Settings
+
+
+class CommandTool:
+    """
+    Executes `run_command` tool calls (see Prompts.run_command_tool) for the agentic query loop.
+
+    Only read-only diagnostics are run: each command of a pipeline must match a READ_ONLY entry (plus any
+    operator `allow` entries) and not use a denied option, and commands with other shell syntax (`;`, `&&`,
+    redirection, substitution, variables) are refused. Approved pipelines run without a shell, with the words
+    shlex split (no globbing or other expansion). A round's approved commands run concurrently, each under a
+    timeout, and output over `max_output_tokens` is reduced to a summary line and its head and tail. A pipeline is
+    killed once its output exceeds OUTPUT_FACTOR times what `max_output_tokens` holds (`cat /dev/zero`).
+    Command output is sent to the model.
+
+    Denied options are matched as the command would parse them, by their form: `-o` also within a cluster of
+    short options (`-uo`), `--output` also abbreviated or with a value (`--outp=x`), and single dash predicates
+    such as find's `-exec` by prefix (`-execdir`).
+
+    ```yaml
+    inference:
+      tools:
+        enabled: false
+        max_rounds: 6
+        timeout: 15
+        concurrency: 4
+        max_output_tokens: 1000
+        allow: []            # additional read-only commands, e.g. ["zpool status", "nvidia-smi"]
+    ```
+    """
+    READ_ONLY: dict[str, tuple] = {
+        "ls": (), "cat": (), "head": (), "tail": (), "wc": (), "cut": (), "tr": (), "stat": (),
+        "grep": (), "egrep": (), "fgrep": (), "rg": ("--pre",),
+        "find": ("-exec", "-execdir", "-ok", "-okdir", "-delete", "-fprint", "-fls"),
+        "sort": ("-o", "--output", "--compress-program"),
+        "file": ("-C", "--compile"),
+        "du": (), "df": (), "free": (), "uptime": (), "ps": (), "pgrep": (), "uname": (), "whoami": (), "id": (),
+        "groups": (), "which": (), "nproc": (), "vmstat": (), "iostat": (), "mpstat": (),
+        "lsblk": (), "lscpu": (), "lsmod": (), "lspci": (), "lsusb": (), "lsof": (), "findmnt": (),
+        "ss": ("-K", "--kill"), "netstat": (), "dig": (), "nslookup": (), "host": (),
+        "ip addr show": (), "ip route show": (), "ip link show": (),
+        "dmesg": ("-c", "-C", "-D", "-E", "-n", "--clear", "--read-clear", "--console"),
+        "journalctl": (
+            "--vacuum", "--rotate", "--flush", "--sync", "--relinquish-var", "--smart-relinquish-var", "--setup-keys",
+            "--update-catalog", "-f", "--follow"
+        ),
+        "systemctl status": (), "systemctl list-units": (), "systemctl list-unit-files": (), "systemctl is-active": (),
+        "systemctl is-enabled": (), "systemctl show": (),
+        "docker ps": (), "docker images": (), "docker inspect": (), "docker logs": ("-f", "--follow"),
+        "kubectl get": ("-w", "--watch"), "kubectl describe": (), "kubectl logs": ("-f", "--follow"),
+        "git status": (), "git log": ("--output",), "git diff": ("--output",), "git show": ("--output",),
+    }
+    SHELL_SYNTAX = ("`", "$", "\n")
+    OUTPUT_FACTOR = 4
+    READ_SIZE = 65536
+
+    @staticmethod
+    def arguments(call) -> dict:
+        """
+        Parse a tool call's JSON arguments (an empty dict if they are not valid JSON).
+        """
+        try:
+            arguments = json.loads(call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return {}
+        return arguments if isinstance(arguments, dict) else {}
+
+    @staticmethod
+    def pipeline(command: str) -> Optional[list[list[str]]]:
+        """
+        Split a command into the words of each `|` separated command, None if it uses any other shell syntax.
+        """
+        if not command.strip() or any(syntax in command for syntax in CommandTool.SHELL_SYNTAX):
+            return None
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            return None
+        commands = [[]]
+        for token in tokens:
+            if token == "|":
+                commands.append([])
+            elif token and all(c in lexer.punctuation_chars for c in token):
+                return None
+            else:
+                commands[-1].append(token)
+        return commands if all(commands) else None
+
+    @staticmethod
+    def denied(word: str, options: tuple) -> Optional[str]:
+        """
+        The denied option a word sets, None if it sets none.
+        """
+        if not word.startswith("-") or word in ("-", "--"):
+            return None
+        if word.startswith("--"):
+            name = word.split("=", 1)[0]
+            # long options may be abbreviated to any prefix, or extended (`--vacuum` denies `--vacuum-size`).
+            return next((option for option in options if option.startswith("--") and (option.startswith(name) or name.startswith(option))), None)
+        for option in options:
+            if option.startswith("--"):
+                continue
+            if len(option) == 2:
+                if option[1] in word[1:]:
+                    return option
+            elif word.startswith(option):
+                return option
+        return None
+
+    def __init__(self, settings: Settings, enabled: Optional[bool] = None):
+        config = settings.inference.tools if settings.inference else {}
+        self.enabled: bool = config.get("enabled", False) if enabled is None else enabled
+        self.max_rounds: int = config.get("max_rounds", 6)
+        self.timeout: float = config.get("timeout", 15)
+        self.concurrency: int = config.get("concurrency", 4)
+        self.max_output_tokens: int = config.get("max_output_tokens", 1000)
+        self.allowed: dict[str, tuple] = {**self.READ_ONLY, **{entry: () for entry in config.get("allow") or []}}
+        self.max_output_bytes: int = self.max_output_tokens * Tokens.CHARS_PER_TOKEN * self.OUTPUT_FACTOR
+
+    def refusal(self, command: str) -> Optional[str]:
+        """
+        Why a command may not be run, None if it is an approved read-only command.
+        """
+        commands = self.pipeline(command)
+        if commands is None:
+            return "Only read-only commands joined by `|` may be run (no `;`, `&&`, redirection, substitution or variables; stderr is captured)."
+        for words in commands:
+            entry = next((" ".join(words[:n]) for n in (2, 1) if " ".join(words[:n]) in self.allowed), None)
+            if entry is None:
+                return f"`{words[0]}` is not an approved read-only command. Suggest it to the operator in your answer instead."
+            for word in words[len(entry.split()):]:
+                if self.denied(word, self.allowed[entry]) is not None:
+                    return f"`{entry} {word}` is not permitted. Suggest it to the operator in your answer instead."
+        return None
+
+    def summarize(self, output: str) -> str:
+        """
+        Output within max_output_tokens, large outputs reduced to their head and tail.
+        """
+        excess = Tokens.estimate(output) - self.max_output_tokens
+        if excess <= 0:
+            return output
+        lines = output.count("\n") + 1
+        return (
+            f"[output truncated: {lines} lines, {len(output)} characters, showing the first and last lines]\n"
+            + ContextBudget.trim_content(output, excess)
+        )
+
+    def execute(self, command: str) -> dict:
+        """
+        Run an approved command's pipeline, each command's stdout piped to the next. The output is the last
+        command's stdout with every command's stderr, as `sh -c` with stderr redirected would capture it.
+
+        Output is read up to max_output_bytes; the pipeline is killed once it writes more.
+        """
+        started = time.monotonic()
+        read, write = os.pipe()
+        processes: list[subprocess.Popen] = []
+        output: list[bytes] = []
+        status = None
+        commands = self.pipeline(command) or []
+        try:
+            stdin = subprocess.DEVNULL
+            for n, words in enumerate(commands):
+                try:
+                    process = subprocess.Popen(
+                        words,
+                        stdin=stdin,
+                        stdout=write if n == len(commands) - 1 else subprocess.PIPE,
+                        stderr=write,
+                        start_new_session=True
+                    )
+                except OSError as e:
+                    output.append(f"{words[0]}: {e.strerror}\n".encode())
+                    status = "exit 127"
+                    self.kill(processes)
+                    break
+                finally:
+                    if processes:
+                        # the next command holds the pipe now.
+                        processes[-1].stdout.close()
+                processes.append(process)
+                stdin = process.stdout
+        finally:
+            os.close(write)
+        truncated = threading.Event()
+
+        def read_output(reader) -> None:
+            size = 0
+            while chunk := reader.read1(self.READ_SIZE):
+                output.append(chunk[:self.max_output_bytes - size])
+                size += len(chunk)
+                if size > self.max_output_bytes:
+                    truncated.set()
+                    self.kill(processes)
+                    return
+
+        with os.fdopen(read, "rb") as reader:
+            thread = threading.Thread(target=read_output, args=(reader,), daemon=True)
+            thread.start()
+            thread.join(max(self.timeout - (time.monotonic() - started), 0))
+            if thread.is_alive():
+                self.kill(processes)
+                thread.join()
+                status = f"timed out after {self.timeout}s"
+        for process in processes:
+            process.wait()
+        if truncated.is_set():
+            status = f"truncated after {self.max_output_bytes} bytes"
+        elif status is None:
+            status = f"exit {processes[-1].returncode}" if processes else "exit 127"
+        return {'status': status, 'output': b"".join(output).decode(errors="replace"), 'elapsed': time.monotonic() - started}
+
+    @staticmethod
+    def kill(processes: list[subprocess.Popen]) -> None:
+        for process in processes:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def call(self, call) -> dict:
+        """
+        Run one tool call, returning its tool result message and a record of what ran.
+        """
+        arguments = self.arguments(call)
+        command = arguments.get("command") or ""
+        if call.function.name != "run_command":
+            result = {'status': "refused", 'output': f"Unknown tool: {call.function.name}", 'elapsed': 0.0}
+        elif (refusal := self.refusal(command)) is not None:
+            result = {'status': "refused", 'output': refusal, 'elapsed': 0.0}
+        else:
+            result = self.execute(command)
+        logging.info(f"run_command `{command}`: {result['status']} in {result['elapsed']:.2f}s")
+        content = f"$ {command}\n[{result['status']}]\n{self.summarize(result['output'])}"
+        return {
+            'command': command,
+            'title': arguments.get("title") or command,
+            'status': result['status'],
+            'elapsed': result['elapsed'],
+            'message': {'role': "tool", 'tool_call_id': call.id, 'content': content},
+        }
+
+    def run(self, calls: list) -> list[dict]:
+        """
+        Run a round of tool calls concurrently (up to `concurrency`), results in call order.
+        """
+        return PipeChunker.bounded_map(self.call, calls, max(self.concurrency, 1))
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Optional
+
+from openai import NotGiven
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion
+
+from smah.database import Database
+from smah.runner.prompts import Prompts
+from smah.settings import Settings
+
+
+class ReplayMiss(RuntimeError):
+    """
+    Raised in replay mode when a request has no recorded completion.
+    """
+    pass
+
+
+class CompletionCache:
+    """
+    Opt-in exact match cache of chat completions stored in the smah database.
+
+    Entries are addressed by a hash of the full request (provider, model id, message thread, response_format,
+    tools and token limits), so an identical pipe invocation on unchanged input returns without a network call.
+    The live system stats message (Prompts.system_stats) is left out of the key: its readings and timestamps
+    differ on every call, so with `include_settings` no two requests would otherwise match.
+    The cache is size bounded (`inference.completion_cache.max_bytes`) with least recently used eviction.
+
+    In replay mode requests are only served from the cache and a miss raises ReplayMiss rather than
+    reaching the provider, which lets tests and benchmarks run against recorded completions offline.
+    """
+    HITS = "completion_cache_hits"
+    MISSES = "completion_cache_misses"
+
+    @staticmethod
+    def key(provider: str, request: dict) -> str:
+        messages = [message for message in request.get('messages') or [] if not Prompts.is_system_stats(message)]
+        payload = json.dumps(
+            [provider, {**request, 'messages': messages}],
+            sort_keys=True,
+            default=lambda o: None if isinstance(o, NotGiven) else str(o)
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def streamed_completion(model: str, content: str, usage: Optional[CompletionUsage] = None, finish_reason: str = "stop") -> ChatCompletion:
+        """
+        Assemble a ChatCompletion from streamed content so streamed and blocking requests share cache entries.
+        """
+        return ChatCompletion.model_validate({
+            'id': f"smah-stream-{int(time.time() * 1000)}",
+            'object': "chat.completion",
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'finish_reason': finish_reason,
+                'message': {'role': "assistant", 'content': content}
+            }],
+            'usage': usage.to_dict() if usage else None
+        })
+
+    def __init__(self, db: Database, settings: Settings, enabled: bool = False, replay: bool = False):
+        self.db = db
+        config = settings.inference.completion_cache if settings.inference else {}
+        self.replay = replay
+        self.enabled = enabled or replay
+        self.max_bytes: int = config.get("max_bytes", 64 * 1024 * 1024)
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        if not self.enabled:
+            return None
+        try:
+            response = self.db.completion_cache_get(key)
+            self.db.increment_setting(self.HITS if response else self.MISSES)
+        except sqlite3.OperationalError as e:
+            if self.replay:
+                raise ReplayMiss(f"Completion cache unavailable: {e}")
+            self.unavailable(e)
+            return None
+        logging.info(f"Completion Cache {'Hit' if response else 'Miss'}: {key}")
+        if response:
+            return ChatCompletion.model_validate_json(response)
+        if self.replay:
+            raise ReplayMiss(f"No recorded completion for request {key}")
+        return None
+
+    def put(self, key: str, provider: str, model: str, response: ChatCompletion) -> None:
+        if not self.enabled or self.replay:
+            return
+        try:
+            self.db.completion_cache_put(key, provider, model, response.model_dump_json(), self.max_bytes)
+        except sqlite3.OperationalError as e:
+            self.unavailable(e)
+
+    def unavailable(self, error: sqlite3.OperationalError) -> None:
+        """
+        Disable the cache when its table is missing; other errors (a busy database) only skip this lookup or store.
+        """
+        if not Database.unmigrated(error):
+            logging.warning(f"Completion cache busy: {error}")
+            return
+        logging.warning(f"Completion cache unavailable (run `smah-db migrate`): {error}")
+        self.enabled = False
+
+    def stats(self) -> dict:
+        counters = self.db.counters([self.HITS, self.MISSES])
+        entries, size = self.db.completion_cache_size()
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': counters[self.HITS],
+            'misses': counters[self.MISSES],
+        }
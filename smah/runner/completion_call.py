@@ -0,0 +1,104 @@
+from typing import Callable, Optional, TYPE_CHECKING, TypeVar
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from smah.runner.telemetry import Telemetry
+from smah.settings.inference.provider.model import Model
+
+if TYPE_CHECKING:
+    from smah.runner.runner import Runner
+
+R = TypeVar("R")
+
+
+class CompletionCall:
+    """
+    The bookkeeping of one chat completion request, shared by Runner and AsyncRunner so that only sending the
+    request differs between them: the request and its completion cache key, its rate limit cost and telemetry,
+    and the content of a streamed response as it arrives.
+
+    cached, failed, completed and streamed read or write the smah database (AsyncRunner runs them on its
+    database thread).
+    """
+
+    def __init__(self, runner: "Runner", model: Model, request: dict, phase: str, streamed: bool = False, show: bool = False):
+        self.runner = runner
+        self.model = model
+        self.request = request
+        self.streamed_response = streamed
+        self.show = show
+        self.cache_key = runner.completion_cache.key(model.provider, request)
+        self.limiter = runner.rate_limiter(model)
+        self.cost = self.limiter.cost(request)
+        self.telemetry = Telemetry(model, phase, streamed=streamed)
+        self.content: list[str] = []
+        self.usage = None
+        self.finish_reason = None
+
+    def cached(self) -> Optional[ChatCompletion]:
+        """
+        The cached response to the request, None on a miss.
+        """
+        response = self.runner.completion_cache.get(self.cache_key)
+        if response:
+            if self.streamed_response:
+                self.runner.log_openai_completion_stream(response.choices[0].message.content or "", response.usage, show=self.show)
+            else:
+                self.runner.log_openai_completion_response(response, show=self.show)
+        return response
+
+    def send(self, fn: Callable[[], R], max_wait: Optional[float] = None) -> R:
+        """
+        Send the request within the provider's rate limits, blocking (see RateLimiter.call).
+        """
+        return self.limiter.call(self.model, self.cost, fn, self.telemetry, max_wait=max_wait)
+
+    def chunk(self, chunk: ChatCompletionChunk) -> Optional[str]:
+        """
+        Take a streamed chunk, returning its content delta if it has one.
+        """
+        if chunk.usage:
+            self.usage = chunk.usage
+        if chunk.choices:
+            self.finish_reason = chunk.choices[0].finish_reason or self.finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                self.telemetry.token()
+                self.content.append(delta)
+                return delta
+        return None
+
+    def failed(self, error: Exception) -> None:
+        self.telemetry.finish(self.usage, error=error)
+        self.telemetry.record(self.runner.db)
+
+    def completed(self, response: ChatCompletion) -> ChatCompletion:
+        """
+        Record a blocking response: telemetry, actual token usage against the rate limit, prompt cache usage and
+        the completion cache entry.
+        """
+        self.telemetry.finish(response.usage)
+        self.telemetry.record(self.runner.db)
+        self.limiter.release(self.model, self.cost, response.usage)
+        self.runner.record_usage(self.model, response.usage)
+        self.runner.log_openai_completion_response(response, show=self.show)
+        self.runner.completion_cache.put(self.cache_key, self.model.provider, self.model.model, response)
+        return response
+
+    def streamed(self) -> str:
+        """
+        Record a finished streamed response (as completed does), returning its content.
+        """
+        content = "".join(self.content)
+        self.telemetry.finish(self.usage)
+        self.telemetry.record(self.runner.db)
+        self.limiter.release(self.model, self.cost, self.usage)
+        self.runner.record_usage(self.model, self.usage)
+        self.runner.log_openai_completion_stream(content, self.usage, show=self.show)
+        self.runner.completion_cache.put(
+            self.cache_key,
+            self.model.provider,
+            self.model.model,
+            self.runner.completion_cache.streamed_completion(self.model.model, content, self.usage, self.finish_reason or "stop")
+        )
+        return content
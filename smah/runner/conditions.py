@@ -0,0 +1,132 @@
+import ast
+import functools
+import operator
+from typing import Any, Callable
+
+
+class ConditionError(ValueError):
+    """
+    Raised for an exec-if condition that is not a supported expression or cannot be evaluated.
+    """
+    pass
+
+
+class Conditions:
+    """
+    Evaluator for `exec-if` conditions in model responses.
+
+    Conditions are a small expression language over the condition namespace: names, string/number/bool/None
+    literals, tuples and lists of them, comparisons (`==`, `!=`, `<`, `<=`, `>`, `>=`, `in`, `not in`, `is`,
+    `is not`), `and`, `or`, `not` and unary `-`/`+`. Anything else (calls, attributes, subscripts, lambdas,
+    comprehensions, ...) is rejected. Expressions are compiled once per source text into closures.
+
+        Conditions.evaluate("os == 'Linux' and cores >= 4", {'os': "Linux", 'cores': 8})  # True
+    """
+    MAX_LENGTH = 1000
+    COMPARISONS: dict[type, Callable[[Any, Any], Any]] = {
+        ast.Eq: operator.eq,
+        ast.NotEq: operator.ne,
+        ast.Lt: operator.lt,
+        ast.LtE: operator.le,
+        ast.Gt: operator.gt,
+        ast.GtE: operator.ge,
+        ast.In: lambda a, b: a in b,
+        ast.NotIn: lambda a, b: a not in b,
+        ast.Is: operator.is_,
+        ast.IsNot: operator.is_not,
+    }
+    UNARY: dict[type, Callable[[Any], Any]] = {
+        ast.Not: operator.not_,
+        ast.USub: operator.neg,
+        ast.UAdd: operator.pos,
+    }
+    LITERALS = (str, int, float, bool, type(None))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def compile(source: str) -> Callable[[dict], Any]:
+        """
+        Compile a condition into a function of the namespace (cached by source text).
+        """
+        if len(source) > Conditions.MAX_LENGTH:
+            raise ConditionError(f"condition is longer than {Conditions.MAX_LENGTH} characters")
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ConditionError(f"invalid condition `{source}`: {e.msg}") from None
+        return Conditions.node(tree.body, source)
+
+    @staticmethod
+    def node(node: ast.AST, source: str) -> Callable[[dict], Any]:
+        if isinstance(node, ast.Constant):
+            if not isinstance(node.value, Conditions.LITERALS):
+                raise ConditionError(f"unsupported literal {node.value!r} in `{source}`")
+            value = node.value
+            return lambda namespace: value
+
+        if isinstance(node, ast.Name):
+            name = node.id
+
+            def lookup(namespace: dict) -> Any:
+                if name not in namespace:
+                    raise ConditionError(f"undefined name `{name}` in `{source}`")
+                return namespace[name]
+            return lookup
+
+        if isinstance(node, (ast.Tuple, ast.List)):
+            items = [Conditions.node(item, source) for item in node.elts]
+            return lambda namespace: tuple(item(namespace) for item in items)
+
+        if isinstance(node, ast.BoolOp):
+            values = [Conditions.node(value, source) for value in node.values]
+            is_and = isinstance(node.op, ast.And)
+
+            def boolean(namespace: dict) -> Any:
+                result = None
+                for value in values:
+                    result = value(namespace)
+                    if bool(result) != is_and:
+                        return result
+                return result
+            return boolean
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in Conditions.UNARY:
+            op = Conditions.UNARY[type(node.op)]
+            operand = Conditions.node(node.operand, source)
+            return lambda namespace: op(operand(namespace))
+
+        if isinstance(node, ast.Compare):
+            unsupported = [type(op).__name__ for op in node.ops if type(op) not in Conditions.COMPARISONS]
+            if unsupported:
+                raise ConditionError(f"unsupported comparison {unsupported[0]} in `{source}`")
+            ops = [Conditions.COMPARISONS[type(op)] for op in node.ops]
+            left = Conditions.node(node.left, source)
+            rights = [Conditions.node(comparator, source) for comparator in node.comparators]
+
+            def compare(namespace: dict) -> bool:
+                a = left(namespace)
+                for op, right in zip(ops, rights):
+                    b = right(namespace)
+                    if not op(a, b):
+                        return False
+                    a = b
+                return True
+            return compare
+
+        raise ConditionError(f"unsupported expression `{ast.unparse(node)}` ({type(node).__name__}) in `{source}`")
+
+    @staticmethod
+    def evaluate(source: str, namespace: dict) -> bool:
+        """
+        Evaluate a condition over the namespace.
+
+        Raises:
+            ConditionError: the condition is not supported or cannot be evaluated (undefined name, incompatible types).
+        """
+        condition = Conditions.compile(source)
+        try:
+            return bool(condition(namespace))
+        except ConditionError:
+            raise
+        except Exception as e:
+            raise ConditionError(f"cannot evaluate `{source}`: {e}") from None
@@ -0,0 +1,198 @@
+import logging
+from typing import Optional
+
+import rich.box
+import yaml
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from smah.console import err_console
+from smah.runner.tokens import Tokens
+from smah.settings.inference.provider.model import Model
+
+
+class Section:
+    """
+    A run of thread messages with a reduction policy.
+
+    Strategies:
+        keep: never reduced.
+        trim: cut the middle of the largest message(s), keeping the head and tail.
+        drop: drop messages, oldest first.
+        summarize: drop messages oldest first, replacing them with a short digest of what was dropped.
+
+    Sections with a lower priority are reduced first.
+    """
+
+    def __init__(self, name: str, messages: list, priority: int = 0, strategy: str = "keep"):
+        self.name = name
+        self.messages = list(messages)
+        self.priority = priority
+        self.strategy = strategy
+        self.action: Optional[str] = None
+
+
+class Thread(list):
+    """
+    Message thread that remembers the sections it was assembled from, so it can be fitted to a model's context.
+    """
+
+    def __init__(self, sections: list[Section]):
+        self.sections = [section for section in sections if section.messages]
+        super().__init__(message for section in self.sections for message in section.messages)
+
+
+class ContextBudget:
+    """
+    Token accounting for chat threads.
+
+    Counts use the local Tokens approximation (a length calculation, so nothing is kept to memoize it). `fit`
+    reduces a Thread section by section, in priority order, until it fits the model's input window: `context.in`
+    when configured, otherwise `context.window` less the reserved output tokens.
+    """
+    DEFAULT_INPUT_WINDOW = 8192
+    MESSAGE_OVERHEAD = 4
+    REPLY_OVERHEAD = 3
+    DIGEST_LINE_LENGTH = 120
+    TRIM_MARKER = "\n...[{tokens} tokens omitted]...\n"
+
+    @staticmethod
+    def input_window(model: Model, max_output: Optional[int] = None) -> int:
+        context = model.context or {}
+        if max_output is None:
+            max_output = context.get("out", 0)
+        window = context.get("in") or (context.get("window", 0) - max_output)
+        return window if window > 0 else ContextBudget.DEFAULT_INPUT_WINDOW
+
+    @staticmethod
+    def count(content: str) -> int:
+        return Tokens.estimate(content)
+
+    @staticmethod
+    def message_tokens(message: dict) -> int:
+        content = message.get("content")
+        if not isinstance(content, str):
+            content = "" if content is None else yaml.dump(content)
+        return ContextBudget.count(content) + ContextBudget.MESSAGE_OVERHEAD
+
+    @staticmethod
+    def tokens(messages: list) -> int:
+        return sum(ContextBudget.message_tokens(message) for message in messages) + ContextBudget.REPLY_OVERHEAD
+
+    @staticmethod
+    def trim_content(content: str, tokens: int) -> str:
+        """
+        Cut `tokens` (estimated) tokens from the middle of content, keeping its head and tail.
+        """
+        remove = min(len(content), (tokens + 8) * Tokens.CHARS_PER_TOKEN)
+        keep = len(content) - remove
+        head = keep * 2 // 3
+        tail = keep - head
+        marker = ContextBudget.TRIM_MARKER.format(tokens=Tokens.estimate(content[head:len(content) - tail]))
+        return content[:head] + marker + (content[-tail:] if tail else "")
+
+    @staticmethod
+    def digest(messages: list) -> dict:
+        lines = []
+        for message in messages:
+            content = message.get("content")
+            first = (content.strip().splitlines() or [""])[0] if isinstance(content, str) else ""
+            if len(first) > ContextBudget.DIGEST_LINE_LENGTH:
+                first = first[:ContextBudget.DIGEST_LINE_LENGTH] + "..."
+            lines.append(f"- {message.get('role', 'user')}: {first}")
+        return {
+            'role': "user",
+            'content': f"[{len(messages)} earlier messages omitted to fit the context window, first lines:]\n" + "\n".join(lines)
+        }
+
+    def __init__(self, model: Model, max_output: Optional[int] = None):
+        self.model = model
+        self.window = self.input_window(model, max_output)
+        self.sections: list[Section] = []
+        self.total = 0
+
+    def reduce(self, section: Section, excess: int) -> int:
+        """
+        Reduce a section by (at least) `excess` tokens where its strategy allows, returning the tokens freed.
+        """
+        before = self.tokens(section.messages)
+        if section.strategy == "trim":
+            while excess > 0 and section.messages:
+                index = max(range(len(section.messages)), key=lambda i: self.message_tokens(section.messages[i]))
+                message = section.messages[index]
+                if not isinstance(message.get("content"), str):
+                    break
+                size = self.count(message["content"])
+                if size <= 32:
+                    break
+                cut = min(excess, size - 32)
+                section.messages[index] = {**message, 'content': self.trim_content(message["content"], cut)}
+                excess -= cut
+            section.action = "trimmed"
+        elif section.strategy in ("drop", "summarize"):
+            summarize = section.strategy == "summarize"
+            dropped = []
+            freed = 0
+            while section.messages and freed < excess:
+                dropped.append(section.messages.pop(0))
+                freed = before - self.tokens(section.messages) - (self.message_tokens(self.digest(dropped)) if summarize else 0)
+            if dropped and summarize:
+                section.messages.insert(0, self.digest(dropped))
+            section.action = f"{'summarized' if summarize else 'dropped'} {len(dropped)} messages"
+        return before - self.tokens(section.messages)
+
+    def fit(self, thread: list) -> list:
+        """
+        Fit a thread to the model's input window.
+
+        Plain lists are returned unchanged (only measured). Threads are reduced section by section, lowest priority
+        first, until the estimate fits the window.
+
+        Returns:
+            list: The messages to send.
+        """
+        if not isinstance(thread, Thread):
+            self.sections = [Section("thread", thread)]
+            self.total = self.tokens(thread)
+            return list(thread)
+
+        self.sections = [Section(s.name, s.messages, s.priority, s.strategy) for s in thread.sections]
+        self.total = self.tokens(thread)
+        for section in sorted(self.sections, key=lambda s: s.priority):
+            if self.total <= self.window:
+                break
+            if section.strategy == "keep":
+                continue
+            self.total -= self.reduce(section, self.total - self.window)
+        return [message for section in self.sections for message in section.messages]
+
+    def reduced(self) -> bool:
+        return any(section.action for section in self.sections)
+
+    def to_yaml(self) -> dict:
+        return {
+            'model': f"{self.model.provider}.{self.model.name}",
+            'window': self.window,
+            'total': self.total,
+            'sections': {
+                section.name: {
+                    'tokens': self.tokens(section.messages) - self.REPLY_OVERHEAD,
+                    'messages': len(section.messages),
+                    **({'action': section.action} if section.action else {})
+                } for section in self.sections
+            }
+        }
+
+    def log(self, level: int = logging.DEBUG, show: bool = False) -> None:
+        payload = yaml.dump(self.to_yaml(), sort_keys=False)
+        if self.total > self.window:
+            logging.warning(f"Request exceeds context window after reduction:\n{payload}")
+        else:
+            logging.log(logging.INFO if self.reduced() else level, f"Context Budget:\n{payload}")
+        if show:
+            err_console.print(Panel(
+                Markdown("```yaml\n" + payload + "\n```\n"),
+                title="Context Budget",
+                style="bold white",
+                box=rich.box.ROUNDED)
+            )
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import AsyncIterator, Generator, Iterator, Optional
+
+import httpx
+import yaml
+
+from smah.runner.context_budget import ContextBudget
+from smah.runner.tokens import Tokens
+from smah.settings.inference.provider import Provider
+
+
+class FakeProvider:
+    """
+    In-process stand-in for an OpenAI compatible chat completions endpoint.
+
+    Requests go through the real OpenAI SDK (serialization, SSE parsing, retries) and are answered by an httpx
+    transport, so smah's own overhead can be measured reproducibly without network access. Register it like any
+    other provider in config.yaml:
+
+    ```yaml
+    providers:
+      fake:
+        name: Fake
+        enabled: true
+        settings:
+          profile: typical        # instant | fast | typical | slow
+          latency: 0.4            # seconds to first token (overrides profile)
+          tokens_per_second: 80   # streaming rate, 0 for unthrottled (overrides profile)
+          default_tokens: 64      # size of the filler response when no canned response matches
+          prompt_cache_min_tokens: 1024  # shortest repeated prefix reported as cached_tokens
+          responses:              # canned responses, first match on the last user message wins
+            - match: "disk usage"
+              content: "df -h"
+            - schema: model-pick    # json_schema requests only match responses for their schema name
+              content: {title: "Disk Usage", model: fake.fake, ...}
+            - match: "why is .* slow" # requests with tools call them, unless answering tool results
+              tool_calls:
+                - {command: "uptime", title: "Load", purpose: "Check load average"}
+          responses_file: ~/.smah/fake-responses.yaml
+        models:
+          - name: fake
+            model: fake
+            enabled: true
+            context: {window: 128000, out: 4096}
+    ```
+
+    json_schema requests without a canned response get a generated object conforming to the schema:
+    properties named `model` refer to the provider's first model and other strings are filler.
+    Prompt caching is simulated: usage reports the longest previously seen message prefix as cached tokens.
+    Canned `tool_calls` are only returned (as run_command calls) by blocking requests.
+    """
+    PROFILES = {
+        "instant": {"latency": 0.0, "tokens_per_second": 0},
+        "fast": {"latency": 0.05, "tokens_per_second": 500},
+        "typical": {"latency": 0.4, "tokens_per_second": 80},
+        "slow": {"latency": 1.5, "tokens_per_second": 20},
+    }
+    PROMPT_CACHE_MIN_TOKENS = 1024
+    FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+
+    @staticmethod
+    def filler(tokens: int) -> str:
+        text = FakeProvider.FILLER * (tokens * Tokens.CHARS_PER_TOKEN // len(FakeProvider.FILLER) + 1)
+        return text[:tokens * Tokens.CHARS_PER_TOKEN].strip()
+
+    def __init__(self, provider: Provider):
+        settings = provider.settings or {}
+        profile = self.PROFILES.get(settings.get("profile", "instant"), self.PROFILES["instant"])
+        self.latency: float = settings.get("latency", profile["latency"])
+        self.tokens_per_second: float = settings.get("tokens_per_second", profile["tokens_per_second"])
+        self.default_tokens: int = settings.get("default_tokens", 64)
+        self.responses: list = list(settings.get("responses") or [])
+        if settings.get("responses_file"):
+            with open(os.path.expanduser(settings["responses_file"])) as file:
+                self.responses.extend(yaml.safe_load(file) or [])
+        self.model_id = f"{provider.identifier}.{provider.models[0].name}" if provider.models else provider.identifier
+        self.prompt_cache_min_tokens: int = settings.get("prompt_cache_min_tokens", self.PROMPT_CACHE_MIN_TOKENS)
+        self.prefixes: set[str] = set()
+
+    def schema_value(self, name: str, schema: dict):
+        if "enum" in schema:
+            return schema["enum"][0]
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "null")
+        if kind == "object":
+            return {k: self.schema_value(k, v) for k, v in (schema.get("properties") or {}).items()}
+        if kind == "array":
+            return [self.schema_value(name, schema.get("items") or {})]
+        if kind == "boolean":
+            return False
+        if kind in ("integer", "number"):
+            return 0
+        if kind == "null":
+            return None
+        return self.model_id if name == "model" else f"fake {name}"
+
+    def content(self, body: dict) -> str:
+        messages = body.get("messages") or []
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        response_format = body.get("response_format") or {}
+        schema = response_format.get("json_schema") if response_format.get("type") == "json_schema" else None
+        for response in self.responses:
+            if response.get("schema") != (schema or {}).get("name") or response.get("tool_calls"):
+                continue
+            if re.search(response.get("match", ""), prompt if isinstance(prompt, str) else ""):
+                content = response.get("content", "")
+                return content if isinstance(content, str) else json.dumps(content)
+        if schema:
+            return json.dumps(self.schema_value("", schema.get("schema") or {}))
+        return self.filler(self.default_tokens)
+
+    def tool_calls(self, body: dict) -> Optional[list]:
+        """
+        Canned tool calls for a request offering tools, unless it is answering tool results or tool_choice is none.
+        """
+        messages = body.get("messages") or []
+        if not body.get("tools") or body.get("tool_choice") == "none" or (messages and messages[-1].get("role") == "tool"):
+            return None
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        for response in self.responses:
+            if response.get("tool_calls") and re.search(response.get("match", ""), prompt if isinstance(prompt, str) else ""):
+                return [
+                    {
+                        'id': f"call-{index}",
+                        'type': "function",
+                        'function': {'name': "run_command", 'arguments': json.dumps(arguments)}
+                    }
+                    for index, arguments in enumerate(response["tool_calls"])
+                ]
+        return None
+
+    def cached_tokens(self, messages: list) -> int:
+        """
+        Simulate provider prompt caching: the longest message prefix seen in an earlier request is cached,
+        once it reaches `prompt_cache_min_tokens`.
+        """
+        cached = 0
+        digest = hashlib.sha256()
+        for index, message in enumerate(messages):
+            digest.update(json.dumps(message, sort_keys=True).encode())
+            key = digest.hexdigest()
+            if key in self.prefixes:
+                cached = index + 1
+            self.prefixes.add(key)
+        tokens = ContextBudget.tokens(messages[:cached]) - ContextBudget.REPLY_OVERHEAD if cached else 0
+        return tokens if tokens >= self.prompt_cache_min_tokens else 0
+
+    def usage(self, body: dict, content: str) -> dict:
+        messages = body.get("messages") or []
+        prompt = ContextBudget.tokens(messages)
+        completion = Tokens.estimate(content)
+        return {
+            'prompt_tokens': prompt,
+            'completion_tokens': completion,
+            'total_tokens': prompt + completion,
+            'prompt_tokens_details': {'cached_tokens': self.cached_tokens(messages)}
+        }
+
+    def completion(self, body: dict, content: str) -> dict:
+        tool_calls = self.tool_calls(body)
+        if tool_calls:
+            return {
+                'id': f"fake-{time.time_ns()}",
+                'object': "chat.completion",
+                'created': int(time.time()),
+                'model': body.get("model"),
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': "tool_calls",
+                    'message': {'role': "assistant", 'content': None, 'tool_calls': tool_calls}
+                }],
+                'usage': self.usage(body, "")
+            }
+        return {
+            'id': f"fake-{time.time_ns()}",
+            'object': "chat.completion",
+            'created': int(time.time()),
+            'model': body.get("model"),
+            'choices': [{
+                'index': 0,
+                'finish_reason': "stop",
+                'message': {'role': "assistant", 'content': content}
+            }],
+            'usage': self.usage(body, content)
+        }
+
+    def deltas(self, content: str) -> list[str]:
+        size = Tokens.CHARS_PER_TOKEN
+        return [content[i:i + size] for i in range(0, len(content), size)]
+
+    def event(self, body: dict, created: int, delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> bytes:
+        chunk = {
+            'id': f"fake-{created}",
+            'object': "chat.completion.chunk",
+            'created': created,
+            'model': body.get("model"),
+            'choices': [] if usage else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+        }
+        if usage:
+            chunk['usage'] = usage
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    def events(self, body: dict, content: str) -> Generator[tuple[float, bytes], None, None]:
+        """
+        SSE events for a streamed completion, paired with the delay to wait before sending each.
+        """
+        created = int(time.time())
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        yield self.latency, self.event(body, created, {'role': "assistant", 'content': ""})
+        for delta in self.deltas(content):
+            yield interval, self.event(body, created, {'content': delta})
+        yield 0.0, self.event(body, created, {}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield 0.0, self.event(body, created, {}, usage=self.usage(body, content))
+        yield 0.0, b"data: [DONE]\n\n"
+
+    def response_delay(self, content: str) -> float:
+        return self.latency + (Tokens.estimate(content) / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+    @staticmethod
+    def not_found(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(404, json={'error': {'message': f"Not found: {request.url.path}", 'type': "invalid_request_error"}})
+
+
+class FakeStream(httpx.SyncByteStream):
+    def __init__(self, events: Iterator[tuple[float, bytes]]):
+        self.events = events
+
+    def __iter__(self) -> Iterator[bytes]:
+        for delay, event in self.events:
+            if delay:
+                time.sleep(delay)
+            yield event
+
+
+class AsyncFakeStream(httpx.AsyncByteStream):
+    def __init__(self, events: Iterator[tuple[float, bytes]]):
+        self.events = events
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for delay, event in self.events:
+            if delay:
+                await asyncio.sleep(delay)
+            yield event
+
+
+class FakeTransport(httpx.BaseTransport):
+    def __init__(self, fake: FakeProvider):
+        self.fake = fake
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return self.fake.not_found(request)
+        body = json.loads(request.read())
+        content = self.fake.content(body)
+        if body.get("stream"):
+            return httpx.Response(200, headers={'content-type': "text/event-stream"}, stream=FakeStream(self.fake.events(body, content)))
+        time.sleep(self.fake.response_delay(content))
+        return httpx.Response(200, json=self.fake.completion(body, content))
+
+
+class AsyncFakeTransport(httpx.AsyncBaseTransport):
+    def __init__(self, fake: FakeProvider):
+        self.fake = fake
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return self.fake.not_found(request)
+        body = json.loads(await request.aread())
+        content = self.fake.content(body)
+        if body.get("stream"):
+            return httpx.Response(200, headers={'content-type': "text/event-stream"}, stream=AsyncFakeStream(self.fake.events(body, content)))
+        await asyncio.sleep(self.fake.response_delay(content))
+        return httpx.Response(200, json=self.fake.completion(body, content))
@@ -0,0 +1,149 @@
+import logging
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Generator, Optional
+
+from smah.database import Database
+from smah.runner.telemetry import Telemetry
+from smah.settings import Settings
+from smah.settings.inference.provider.model import Model
+
+
+class HedgeCancelled(Exception):
+    """
+    Raised inside a hedged stream that lost the race, so its telemetry is recorded as cancelled.
+    """
+    pass
+
+
+class HedgeLeg:
+    """
+    A streamed completion running on its own thread, forwarding (leg, kind, value) events to a shared queue:
+    ("delta", str) per content delta, then ("done", content) or ("error", Exception).
+    """
+
+    def __init__(self, name: str, model: Model, start: Callable[["HedgeLeg"], Generator[str, None, Any]], events: queue.Queue):
+        self.name = name
+        self.model = model
+        self.start = start
+        self.events = events
+        self.cancelled = threading.Event()
+        self.response = None
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name=f"smah-hedge-{name}", daemon=True)
+
+    def run(self) -> None:
+        try:
+            deltas = self.start(self)
+            while True:
+                try:
+                    delta = next(deltas)
+                except StopIteration as done:
+                    self.events.put((self, "done", done.value))
+                    return
+                self.events.put((self, "delta", delta))
+        except Exception as e:
+            self.events.put((self, "error", e))
+
+    def launch(self) -> "HedgeLeg":
+        self.thread.start()
+        return self
+
+    def attach(self, response) -> None:
+        """
+        Register the leg's open response so cancel can close it (closed immediately if already cancelled).
+        """
+        with self.lock:
+            self.response = response
+        if self.cancelled.is_set():
+            self.close()
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise HedgeCancelled(f"{self.name} request to {self.model.provider}.{self.model.name} lost the hedge")
+
+    def close(self) -> None:
+        with self.lock:
+            response, self.response = self.response, None
+        if response is not None:
+            try:
+                response.close()
+            except Exception as e:
+                # The response may be mid read on the leg's thread, which then stops at its next chunk.
+                logging.debug(f"Hedge {self.name} response close deferred: {e}")
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        self.close()
+
+
+class Hedger:
+    """
+    Tail latency control for streamed completions.
+
+    When the first token of a request has not arrived within the `percentile` of the model's recorded
+    time to first token (see `smah-db stats`), a duplicate request is sent to the first fallback model
+    (`target: fallback`, the same model if there is none) or to the same model (`target: same`).
+    The first request to produce a token wins and the other is cancelled. Models with fewer than
+    `min_samples` recorded calls are not hedged. Hedging is opt in as it adds request load.
+
+    ```yaml
+    inference:
+      hedging:
+        enabled: false
+        percentile: 95
+        min_samples: 20
+        min_delay: 0.5
+        max_delay: 30
+        target: fallback
+        phases: [query, interactive, resume]
+    ```
+    """
+    ARMED = "hedge_armed"
+    HEDGED = "hedge_sent"
+    WINS = "hedge_wins"
+    SAMPLES = 200
+
+    def __init__(self, db: Database, settings: Settings, enabled: Optional[bool] = None):
+        self.db = db
+        config = settings.inference.hedging if settings.inference else {}
+        self.enabled: bool = config.get("enabled", False) if enabled is None else enabled
+        self.percentile: float = config.get("percentile", 95)
+        self.min_samples: int = config.get("min_samples", 20)
+        self.min_delay: float = config.get("min_delay", 0.5)
+        self.max_delay: float = config.get("max_delay", 30)
+        self.target_model: str = config.get("target", "fallback")
+        self.phases: list[str] = list(config.get("phases") or [])
+        self.delays: dict[tuple, Optional[float]] = {}
+
+    def delay(self, model: Model, phase: str) -> Optional[float]:
+        """
+        Seconds to wait for the first token before hedging, None if the request should not be hedged.
+        Computed once per model from its most recent successful streamed calls.
+        """
+        if not self.enabled or phase not in self.phases:
+            return None
+        key = (model.provider, model.name)
+        if key not in self.delays:
+            try:
+                samples = self.db.telemetry_first_tokens(model.provider, model.name, self.SAMPLES)
+            except sqlite3.OperationalError as e:
+                logging.debug(f"Inference telemetry unavailable (run `smah-db migrate`): {e}")
+                samples = []
+            delay = None
+            if len(samples) >= self.min_samples:
+                delay = min(max(Telemetry.percentile(samples, self.percentile), self.min_delay), self.max_delay)
+            self.delays[key] = delay
+        return self.delays[key]
+
+    def target(self, model: Model, fallbacks: Optional[list[Model]]) -> Model:
+        if self.target_model == "fallback" and fallbacks:
+            return fallbacks[0]
+        return model
+
+    def record(self, setting: str) -> None:
+        try:
+            self.db.increment_setting(setting)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Hedge counters unavailable: {e}")
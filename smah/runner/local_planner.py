@@ -0,0 +1,234 @@
+import logging
+import math
+import re
+import sqlite3
+from typing import Optional, Tuple
+
+import yaml
+
+from smah.database import Database
+from smah.runner.context_budget import ContextBudget
+from smah.runner.tokens import Tokens
+from smah.settings import Settings
+from smah.settings.inference.provider.model import Model
+
+
+class LocalPlanner:
+    """
+    Deterministic planner that picks a model without an LLM round trip.
+
+    The request is classified by keyword into use cases (e.g. a "script" request is Code Generation, "why" is
+    Reasoning) and a complexity estimate (request length, pipe size, reasoning keywords). Each model is scored on
+    its `use_cases` scores for the request's use cases, its `strengths`, its `attributes` (speed for simple requests,
+    reasoning/coding for complex ones) and its `cost`; models whose context window can not hold the pipe input
+    are excluded. Confidence combines how clearly the request matched a use case with the margin between the best
+    and runner up models. Plans below `inference.local_planner.min_confidence` are deferred to the LLM planner.
+
+    ```yaml
+    inference:
+      local_planner:
+        enabled: true
+        min_confidence: 0.6
+    ```
+    """
+    PLANS = "local_planner_plans"
+    DEFERRED = "local_planner_deferred"
+    AGREED = "local_planner_agreed"
+    USE_CASES = {
+        "Code Generation": ("script", "code", "function", "program", "regex", "python", "bash", "awk", "sed", "implement", "refactor", "snippet"),
+        "Data Analysis": ("analyze", "analyse", "count", "summarize", "summarise", "stats", "statistics", "csv", "json", "log", "logs", "errors", "top", "table", "parse", "extract"),
+        "Reasoning": ("why", "explain", "debug", "diagnose", "troubleshoot", "compare", "cause", "root cause", "difference", "should i"),
+        "Planning": ("plan", "steps", "migrate", "migration", "design", "architecture", "roadmap", "strategy"),
+        "Translation": ("translate", "translation", "in spanish", "in french", "in german", "convert to"),
+        "Creativity": ("story", "poem", "creative", "brainstorm", "ideas", "slogan"),
+    }
+    COMMAND = ("command", "how do i", "how to", "how can i", "show me", "list", "check", "find", "install", "kill", "restart", "run")
+    SYSTEM = (
+        "command", "install", "my system", "my machine", "disk", "memory", "cpu", "process", "processes", "port", "ports",
+        "service", "package", "network", "file", "files", "directory", "folder", "kernel", "os", "shell", "terminal",
+    )
+    FORMAT = ("format", "markdown", "table", "report", "pretty", "readable")
+    RAW = ("raw", "only the command", "just the command", "no formatting", "plain text")
+    INSTRUCTIONS = {
+        "Command": "Reply with the command(s) for the operator's system and a one line explanation of each.",
+        "Code Generation": "Reply with the complete script or code, followed by brief usage notes.",
+        "Data Analysis": "Base the answer only on the provided input, quote the relevant lines.",
+        "Reasoning": "Explain the reasoning step by step, then give a concise conclusion.",
+        "Planning": "Reply with a numbered list of steps.",
+        "Translation": "Reply with the translation only.",
+        "Creativity": "Be creative, keep the response focused on the request.",
+    }
+    COMPLEX_TOKENS = 400
+    COMPLEX_PIPE_TOKENS = 8000
+    MARGIN_SCALE = 0.15
+    TITLE_WORDS = 8
+
+    @staticmethod
+    def matches(text: str, keywords: Tuple[str, ...]) -> list[str]:
+        return [keyword for keyword in keywords if re.search(rf"\b{re.escape(keyword)}\b", text)]
+
+    @staticmethod
+    def features(query: str, pipe: Optional[str] = None) -> dict:
+        """
+        Request features the plan is derived from: matched use cases, command/system/format intent and complexity.
+        """
+        text = " ".join(query.lower().split())
+        use_cases = {name: len(LocalPlanner.matches(text, keywords)) for name, keywords in LocalPlanner.USE_CASES.items()}
+        use_cases = {name: hits for name, hits in use_cases.items() if hits}
+        command = bool(LocalPlanner.matches(text, LocalPlanner.COMMAND))
+        if pipe is not None:
+            use_cases["Data Analysis"] = use_cases.get("Data Analysis", 0) + 1
+        query_tokens = Tokens.estimate(query)
+        pipe_tokens = Tokens.estimate(pipe) if pipe else 0
+        complexity = min(1.0, query_tokens / LocalPlanner.COMPLEX_TOKENS + pipe_tokens / LocalPlanner.COMPLEX_PIPE_TOKENS)
+        complexity = min(1.0, complexity + 0.2 * use_cases.get("Reasoning", 0) + 0.2 * use_cases.get("Planning", 0))
+        return {
+            'use_cases': use_cases,
+            'command': command,
+            'system': bool(LocalPlanner.matches(text, LocalPlanner.SYSTEM)),
+            'format': bool(LocalPlanner.matches(text, LocalPlanner.FORMAT)),
+            'raw': bool(LocalPlanner.matches(text, LocalPlanner.RAW)),
+            'query_tokens': query_tokens,
+            'pipe_tokens': pipe_tokens,
+            'complexity': round(complexity, 3),
+        }
+
+    @staticmethod
+    def cost_rate(model: Model) -> Optional[float]:
+        cost = model.cost or {}
+        if cost.get("million_tokens_in") is None or cost.get("million_tokens_out") is None:
+            return None
+        return cost["million_tokens_in"] + cost["million_tokens_out"]
+
+    @staticmethod
+    def score(model: Model, features: dict, cheapest: Optional[float]) -> float:
+        """
+        Score a model for a request: use case fit, strengths and attributes, less a cost penalty
+        that is weighted by how simple the request is.
+        """
+        complexity = features["complexity"]
+        use_cases = features["use_cases"] or {"Text Generation": 1}
+        total = sum(use_cases.values())
+        scores = {use_case.name: use_case.score or 0 for use_case in model.use_cases}
+        fit = sum(scores.get(name, 0) * hits / total for name, hits in use_cases.items())
+
+        strengths = " ".join(model.strengths or []).lower()
+        bonus = 0.05 * sum(1 for name in use_cases if name.split()[0].lower() in strengths)
+        if "fast" in strengths:
+            bonus += 0.05 * (1 - complexity)
+
+        attributes = model.attributes or {}
+        capability = attributes.get("coding", 5) if "Code Generation" in use_cases else attributes.get("reasoning", 5)
+        ability = ((1 - complexity) * attributes.get("speed", 5) + complexity * capability) / 10
+
+        penalty = 0.0
+        rate = LocalPlanner.cost_rate(model)
+        if rate is not None and cheapest:
+            penalty = 0.15 * (1 - complexity) * math.log10(rate / cheapest + 1e-9)
+        return fit + bonus + ability - penalty
+
+    @staticmethod
+    def title(query: str) -> str:
+        words = query.split()
+        title = " ".join(words[:LocalPlanner.TITLE_WORDS]).rstrip("?.!:,")
+        return (title + ("..." if len(words) > LocalPlanner.TITLE_WORDS else "")) or "Request"
+
+    def __init__(self, db: Database, settings: Settings, enabled: Optional[bool] = None):
+        self.db = db
+        self.settings = settings
+        config = settings.inference.local_planner if settings.inference else {}
+        self.enabled: bool = config.get("enabled", True) if enabled is None else enabled
+        self.min_confidence: float = config.get("min_confidence", 0.6)
+
+    def rank(self, features: dict) -> list[Tuple[str, float]]:
+        """
+        Candidate models by descending score (ties broken by catalog order).
+        """
+        models = self.settings.inference.models
+        needed = features["pipe_tokens"] + features["query_tokens"]
+        candidates = {
+            key: model for key, model in models.items()
+            if ContextBudget.input_window(model) >= needed
+        } or models
+        rates = [rate for rate in (self.cost_rate(model) for model in candidates.values()) if rate]
+        cheapest = min(rates) if rates else None
+        scored = [(key, self.score(model, features, cheapest)) for key, model in candidates.items()]
+        return sorted(scored, key=lambda entry: -entry[1])
+
+    def confidence(self, features: dict, ranked: list[Tuple[str, float]]) -> float:
+        clarity = 1.0 if features["use_cases"] or features["command"] else 0.4
+        if features["query_tokens"] > self.COMPLEX_TOKENS:
+            clarity *= 0.5
+        if len(ranked) < 2:
+            margin = 1.0
+        else:
+            margin = min(1.0, (ranked[0][1] - ranked[1][1]) / self.MARGIN_SCALE)
+        return round(0.6 * clarity + 0.4 * margin, 3)
+
+    def plan(self, kind: str, query: str, pipe: Optional[str] = None) -> Optional[Tuple[float, dict]]:
+        """
+        Plan a request locally.
+
+        Returns:
+            Optional[Tuple[float, dict]]: (confidence, plan), or None if disabled or no model is available.
+        """
+        if not self.enabled or not self.settings.inference.models:
+            return None
+        features = self.features(query, pipe)
+        ranked = self.rank(features)
+        model, score = ranked[0]
+        confidence = self.confidence(features, ranked)
+        use_case = max(features["use_cases"], key=features["use_cases"].get) if features["use_cases"] else None
+        intent = "Command" if features["command"] and use_case in (None, "Data Analysis") and pipe is None else use_case
+
+        include_settings = features["system"] or features["command"] or use_case == "Code Generation"
+        if kind == "pipe":
+            format_output = features["format"] and not features["raw"]
+        else:
+            format_output = not features["raw"]
+        plan = {
+            'title': self.title(query),
+            'model': model,
+            'reason': f"Local planner: {intent or 'general'} request, complexity {features['complexity']}, score {score:.3f}.",
+            'include_settings': include_settings,
+            'include_settings_reason': "Request concerns the operator's system." if include_settings else "Request is not system specific.",
+            'format_output': format_output,
+            'format_output_reason': "Formatted output requested." if format_output and kind == "pipe"
+                else ("Raw output requested." if features["raw"] or kind == "pipe" else "Interactive response."),
+            'instructions': self.INSTRUCTIONS.get(intent, "None"),
+        }
+        logging.info("Local Plan:\n" + yaml.dump({
+            'kind': kind,
+            'model': model,
+            'confidence': confidence,
+            'min_confidence': self.min_confidence,
+            'features': features,
+            'ranking': [{'model': key, 'score': round(value, 3)} for key, value in ranked],
+        }, sort_keys=False))
+        return confidence, plan
+
+    def confident(self, local: Optional[Tuple[float, dict]]) -> bool:
+        return local is not None and local[0] >= self.min_confidence
+
+    def record(self, local: Optional[Tuple[float, dict]], plan: Optional[dict] = None) -> None:
+        """
+        Record whether the local plan was used, and for deferred plans whether the LLM planner agreed on the model,
+        so local choices can be compared with the LLM planner's (see `smah-db plan-cache`).
+        """
+        if local is None:
+            return
+        confidence, local_plan = local
+        try:
+            if plan is None:
+                self.db.increment_setting(self.PLANS)
+                return
+            agreed = plan.get("model") == local_plan["model"]
+            logging.info(
+                f"Local Planner Deferred: local {local_plan['model']} ({confidence}), llm {plan.get('model')}"
+                f" - {'agreed' if agreed else 'disagreed'}"
+            )
+            self.db.increment_setting(self.DEFERRED)
+            if agreed:
+                self.db.increment_setting(self.AGREED)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Local planner counters unavailable: {e}")
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Generator, Iterable, TypeVar
+
+from smah.runner.tokens import Tokens
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class PipeChunker:
+    """
+    Splits pipe input that exceeds a model's context into token budgeted chunks for map-reduce processing.
+    """
+
+    @staticmethod
+    def lines(pipe: str) -> Generator[str, None, None]:
+        """
+        Lines of a string (with their line endings), without first copying the whole string into a list.
+        """
+        start = 0
+        while start < len(pipe):
+            end = pipe.find("\n", start) + 1 or len(pipe)
+            yield pipe[start:end]
+            start = end
+
+    @staticmethod
+    def chunks(pipe: str | Iterable[str], budget: int) -> Generator[str, None, None]:
+        """
+        Split input into chunks of at most `budget` (estimated) tokens on line boundaries.
+
+        Lines that on their own exceed the budget are hard split.
+
+        Args:
+            pipe (str | Iterable[str]): The input to split, or its lines (e.g. PipeInput.lines), consumed lazily.
+            budget (int): Token budget per chunk.
+
+        Yields:
+            str: Input chunks in order.
+        """
+        limit = max(budget, 1) * Tokens.CHARS_PER_TOKEN
+        chunk = []
+        size = 0
+        for line in PipeChunker.lines(pipe) if isinstance(pipe, str) else pipe:
+            if size + len(line) > limit and chunk:
+                yield "".join(chunk)
+                chunk = []
+                size = 0
+            while len(line) > limit:
+                yield line[:limit]
+                line = line[limit:]
+            if line:
+                chunk.append(line)
+                size += len(line)
+        if chunk:
+            yield "".join(chunk)
+
+    @staticmethod
+    def groups(parts: list[str], budget: int) -> list[list[str]]:
+        """
+        Group consecutive parts so the combined (estimated) token count of each group stays within budget.
+        """
+        groups = []
+        group = []
+        size = 0
+        for part in parts:
+            tokens = Tokens.estimate(part)
+            if group and size + tokens > budget:
+                groups.append(group)
+                group = []
+                size = 0
+            group.append(part)
+            size += tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def bounded_map(fn: Callable[[T], R], items: Iterable[T], concurrency: int) -> list[R]:
+        """
+        Apply fn to items on a thread pool with at most `concurrency` calls in flight, returning results in order.
+
+        Items are pulled lazily so only in-flight chunks are held in addition to the results.
+        """
+        results: dict[int, R] = {}
+        pending: dict[int, Future] = {}
+        count = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="smah-map") as executor:
+            for index, item in enumerate(items):
+                count += 1
+                pending[index] = executor.submit(fn, item)
+                if len(pending) >= concurrency:
+                    oldest = min(pending)
+                    results[oldest] = pending.pop(oldest).result()
+            for index, future in pending.items():
+                results[index] = future.result()
+        return [results[index] for index in range(count)]
\ No newline at end of file
@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+from typing import Generator, Optional, TextIO
+
+
+class PipeFollower:
+    """
+    Reads an unbounded input stream (e.g. `tail -f`) incrementally and batches lines into windows.
+
+    A reader thread feeds lines through a bounded queue, so a slow consumer applies back pressure to the
+    producer rather than buffering input. A window is closed once `interval` seconds have passed since its
+    first line, it holds `max_lines` lines or `max_chars` characters, or the stream ends.
+    Lines longer than `max_chars` are truncated, so memory use is bounded regardless of how long the stream runs.
+    """
+    TRUNCATED = " ...[truncated]\n"
+
+    def __init__(self, stream: TextIO, interval: float = 5.0, max_lines: int = 200, max_chars: int = 16384):
+        self.stream = stream
+        self.interval = interval
+        self.max_lines = max(max_lines, 1)
+        self.max_chars = max(max_chars, len(self.TRUNCATED) + 1)
+        self.queue: queue.Queue[Optional[str]] = queue.Queue(maxsize=self.max_lines * 2)
+        self.carry: Optional[str] = None
+        self.eof = False
+
+    def read(self) -> None:
+        """
+        Reader thread: push lines onto the queue followed by None at end of stream.
+        """
+        try:
+            for line in iter(self.stream.readline, ""):
+                if len(line) > self.max_chars:
+                    line = line[:self.max_chars - len(self.TRUNCATED)] + self.TRUNCATED
+                self.queue.put(line)
+        finally:
+            self.queue.put(None)
+
+    def window(self) -> Optional[str]:
+        """
+        Collect the next window of lines, blocking until at least one line is available.
+
+        Returns:
+            Optional[str]: The window content, or None once the stream has ended.
+        """
+        lines = []
+        size = 0
+        deadline = None
+        while not self.eof:
+            if self.carry is not None:
+                line, self.carry = self.carry, None
+            else:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    line = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if line is None:
+                self.eof = True
+                break
+            if lines and size + len(line) > self.max_chars:
+                self.carry = line
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.interval
+            lines.append(line)
+            size += len(line)
+            if len(lines) >= self.max_lines:
+                break
+        return "".join(lines) if lines else None
+
+    def windows(self) -> Generator[str, None, None]:
+        """
+        Yield windows of input until the stream ends.
+        """
+        threading.Thread(target=self.read, name="smah-follow", daemon=True).start()
+        while True:
+            window = self.window()
+            if window is None:
+                return
+            yield window
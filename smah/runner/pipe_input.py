@@ -0,0 +1,88 @@
+from typing import Generator, TextIO
+
+from smah.runner.pipe_chunker import PipeChunker
+
+
+class PipeInput:
+    """
+    Piped input read only as far as it is needed.
+
+    Input is buffered up to what the caller asks for (see fill): enough to plan from (preview) and to tell
+    whether it fits a single request. Larger input is never held whole: `lines` yields the buffered text and
+    then the rest of the stream, so map-reduce holds at most the chunks in flight. Lines longer than
+    LINE_CHARS are read in pieces.
+    """
+    PREVIEW_CHARS = 65536
+    LINE_CHARS = 65536
+
+    @staticmethod
+    def text(text: str) -> "PipeInput":
+        """
+        Input already read in full.
+        """
+        pipe = PipeInput(None)
+        pipe.buffer = text
+        pipe.complete = True
+        return pipe
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.buffer = ""
+        self.complete = False
+
+    def __bool__(self) -> bool:
+        self.fill(1)
+        return bool(self.buffer)
+
+    def fill(self, chars: int) -> bool:
+        """
+        Buffer at least `chars` characters (all of the input if it is shorter).
+
+        Returns:
+            bool: Whether the whole input is buffered.
+        """
+        while not self.complete and len(self.buffer) < chars:
+            data = self.stream.read(chars - len(self.buffer))
+            if data:
+                self.buffer += data
+            else:
+                self.complete = True
+        return self.complete
+
+    def preview(self) -> str:
+        """
+        The input to plan from: all of it when short, otherwise its first PREVIEW_CHARS characters.
+        """
+        self.fill(self.PREVIEW_CHARS)
+        return self.buffer[:self.PREVIEW_CHARS]
+
+    def read(self) -> str:
+        """
+        The whole input (for uses that need it all, such as interactive mode).
+        """
+        if not self.complete:
+            self.buffer += self.stream.read()
+            self.complete = True
+        return self.buffer
+
+    def lines(self) -> Generator[str, None, None]:
+        """
+        Lines of the input, the buffered text first and then the rest of the stream as it is consumed.
+        The input can only be iterated once.
+        """
+        buffer, self.buffer = self.buffer, ""
+        partial = ""
+        for line in PipeChunker.lines(buffer):
+            if line.endswith("\n"):
+                yield line
+            else:
+                partial = line
+        del buffer
+        if not self.complete:
+            while piece := self.stream.readline(self.LINE_CHARS):
+                if partial:
+                    piece, partial = partial + piece, ""
+                yield piece
+            self.complete = True
+        if partial:
+            yield partial
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import sqlite3
+from typing import Optional
+
+import yaml
+
+from smah.database import Database
+from smah.settings import Settings
+
+
+class PlanCache:
+    """
+    Persistent cache of planner (query_plan/pipe_plan) responses stored in the smah database.
+
+    Plans are keyed on the normalized request text, a fingerprint of the pipe input's shape (not its content)
+    and a hash of the model catalog, operator and system settings, so any config change invalidates prior plans.
+    Entries expire after `inference.plan_cache.ttl` seconds and are evicted least recently used once
+    `inference.plan_cache.max_entries` is exceeded.
+    """
+    HITS = "plan_cache_hits"
+    MISSES = "plan_cache_misses"
+    SHAPE_SAMPLE_LINES = 8
+    SHAPE_SAMPLE_CHARS = 4096
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def line_shape(line: str) -> str:
+        """
+        Reduce a line to its character class structure, e.g. `Oct 28 10:01:02 sshd[12]` -> `a 9 9:9:9 a[9]`.
+        """
+        line = re.sub(r"[0-9]+", "9", line)
+        line = re.sub(r"[^\W\d_]+", "a", line)
+        return re.sub(r"\s+", " ", line).strip()
+
+    @staticmethod
+    def pipe_fingerprint(pipe: Optional[str]) -> Optional[str]:
+        """
+        Fingerprint the shape of pipe input: order of magnitude of its size/line count and the structure of
+        its leading and trailing lines, read from bounded samples of its head and tail.
+        """
+        if pipe is None:
+            return None
+        sample = PlanCache.SHAPE_SAMPLE_CHARS
+        head = pipe[:sample].splitlines()[:PlanCache.SHAPE_SAMPLE_LINES]
+        tail = pipe[-sample:].splitlines()[-PlanCache.SHAPE_SAMPLE_LINES:] if len(pipe) > sample else []
+        return json.dumps({
+            'size': int(math.log2(len(pipe) + 1)),
+            'lines': int(math.log2(pipe.count("\n") + 1)),
+            'shape': [PlanCache.line_shape(line) for line in head],
+            'tail': [PlanCache.line_shape(line) for line in tail]
+        })
+
+    @staticmethod
+    def settings_digest(settings: Settings) -> str:
+        payload = yaml.dump(
+            {
+                'inference': settings.inference.to_yaml({"prompt": True}) if settings.inference else None,
+                'user': settings.user.to_yaml() if settings.user else None,
+                'system': settings.system.to_yaml() if settings.system else None,
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def __init__(self, db: Database, settings: Settings, enabled: bool = True):
+        self.db = db
+        self.settings = settings
+        self.enabled = enabled
+        config = settings.inference.plan_cache if settings.inference else {}
+        self.ttl: int = config.get("ttl", 86400)
+        self.max_entries: int = config.get("max_entries", 512)
+        self.digest: Optional[str] = None
+
+    def key(self, kind: str, query: str, planner: Optional[str] = None, pipe: Optional[str] = None) -> str:
+        if self.digest is None:
+            self.digest = self.settings_digest(self.settings)
+        payload = json.dumps([kind, planner, self.normalize(query), self.pipe_fingerprint(pipe), self.digest])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        try:
+            plan = self.db.plan_cache_get(key, self.ttl)
+            if plan and plan.get("model") not in self.settings.inference.models:
+                plan = None
+            self.db.increment_setting(self.HITS if plan else self.MISSES)
+            logging.info(f"Plan Cache {'Hit' if plan else 'Miss'}: {key}")
+            return plan
+        except sqlite3.OperationalError as e:
+            self.unavailable(e)
+            return None
+
+    def put(self, key: str, kind: str, plan: dict) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.db.plan_cache_put(key, kind, plan, self.max_entries)
+        except sqlite3.OperationalError as e:
+            self.unavailable(e)
+
+    def unavailable(self, error: sqlite3.OperationalError) -> None:
+        """
+        Disable the cache when its table is missing; other errors (a busy database) only skip this lookup or store.
+        """
+        if not Database.unmigrated(error):
+            logging.warning(f"Plan cache busy: {error}")
+            return
+        logging.warning(f"Plan cache unavailable (run `smah-db migrate`): {error}")
+        self.enabled = False
+
+    def stats(self) -> dict:
+        counters = self.db.counters([self.HITS, self.MISSES])
+        return {
+            'entries': self.db.plan_cache_size(),
+            'hits': counters[self.HITS],
+            'misses': counters[self.MISSES],
+        }
@@ -9,6 +9,7 @@ from smah.settings.inference import Inference
 class Prompts:
     MAX_PIPE_LENGTH = 2048
     PIPE_HEAD_LENGTH = 1024
+    SYSTEM_STATS_HEADING = "System Stats\n================"
 
     def __init__(self):
         pass
@@ -43,6 +44,30 @@ class Prompts:
             }
         }
 
+    @staticmethod
+    def command_tool_prompt():
+        prompt = textwrap.dedent(
+            """
+            # TOOLS
+            You may call `run_command` to run read-only diagnostic commands on the operator's system before answering.
+            - Request independent probes together in a single turn, they are run in parallel.
+            - Commands are run without a terminal under a timeout, use non-interactive forms (e.g. `ps aux`, not `top`).
+            - Commands are run without a shell, so globs (`*`) and braces are not expanded: name paths or use `find`.
+            - Only read-only commands, optionally joined by `|`, are run. Commands that change the system are refused:
+              recommend those to the operator in your answer instead.
+            - Large outputs are truncated, filter them with `grep`, `head` or `tail`.
+            When you have what you need, reply with your final answer without calling any tools.
+            ---
+            When you are ready, reply ack.
+            """)
+        return Prompts.message(content=prompt)
+
+    @staticmethod
+    def command_tool_final_request():
+        return Prompts.message(
+            content="The tool call limit has been reached. Answer now using the command results so far, without calling tools."
+        )
+
     @staticmethod
     def planner_response_format():
         """
@@ -242,15 +267,19 @@ class Prompts:
         return Prompts.message(content=template)
 
     @staticmethod
-    def select_model(inference: Inference, request: str, additional_instructions: str | None = None):
+    def select_model(inference: Inference, additional_instructions: str | None = None):
+        """
+        Model selection instructions and catalog. The request itself follows in select_model_request
+        so this (large) message stays identical across planner calls.
+        """
         models = yaml.dump(
             inference.to_yaml({"prompt": True}),
             sort_keys=False)
         message = textwrap.dedent(
-            f"""
+            """
             # MODEL SELECTION PROMPT
             You are the Model Selector.
-            Based on your operator, system settings and the specific request below you will select the best model by id from the list models to process with.
+            Based on your operator, system settings and the specific request that follows you will select the best model by id from the list models to process with.
             You are additionally to return:
                 - a concise title describing the user's request
                 - reason for model selection
@@ -266,18 +295,27 @@ class Prompts:
             ```yaml
             {models}
             ```
-            ---
+            Review and reply ack.
+            """).format(models=models, additional_instructions=additional_instructions or "")
+        return Prompts.message(content=message)
+
+    @staticmethod
+    def select_model_request(request: str):
+        message = textwrap.dedent(
+            """
+            Select a model for this request.
+            
             Request
             ===
             {request}            
-            """).format(models=models, request=request, additional_instructions=additional_instructions)
+            """).format(request=request)
         return Prompts.message(content=message)
 
     @staticmethod
     def pipe_request(request: str, pipe: str):
         if len(pipe) > Prompts.MAX_PIPE_LENGTH:
             pipe_head = pipe[:Prompts.PIPE_HEAD_LENGTH]
-            pipe_tail = pipe[Prompts.PIPE_HEAD_LENGTH:]
+            pipe_tail = pipe[-Prompts.PIPE_HEAD_LENGTH:]
             r = textwrap.dedent(
                 """
                 {request}
@@ -299,13 +337,150 @@ class Prompts:
             ).format(request=request, pipe=pipe)
         return r
 
+    @staticmethod
+    def pipe_chunk_request(request: str, instructions: str, chunk: str, index: int):
+        """
+        Map step request for one chunk of input too large to process in a single request
+        (the input is split as it is read, so the number of parts is not known up front).
+        """
+        return textwrap.dedent(
+            """\
+            {request}
+            
+            Additional Instructions:
+            
+            {instructions}
+            
+            The input is too large to process at once and has been split into parts, this is part {part}.
+            Process only this part. Your output will be merged with the output for the other parts, 
+            so include every finding/value needed for the final result and do not add introductions or closing remarks.
+            --- INPUT ---
+            {chunk}
+            """
+        ).format(
+            request=textwrap.dedent(request),
+            instructions=instructions,
+            chunk=chunk,
+            part=index + 1
+        )
+
+    @staticmethod
+    def pipe_chunk_failed(index: int):
+        """
+        Stands in for the output of a part that could not be processed, so the merged response notes the gap.
+        """
+        return f"[Part {index + 1} of the input could not be processed; note in the response that its results are missing.]"
+
+    @staticmethod
+    def pipe_reduce_request(request: str, instructions: str, partials: list[str]):
+        """
+        Reduce step request merging the outputs produced for each part of a split input.
+        """
+        parts = "\n".join(
+            f"--- PART {i + 1} OF {len(partials)} ---\n{partial}" for i, partial in enumerate(partials)
+        )
+        return textwrap.dedent(
+            """\
+            {request}
+            
+            Additional Instructions:
+            
+            {instructions}
+            
+            The input was split into parts and the request was applied to each part separately.
+            Merge the partial outputs below into a single response to the original request:
+            combine, deduplicate and aggregate (e.g. sum counts, merge tables) as the request requires.
+            --- INPUT ---
+            {parts}
+            """
+        ).format(
+            request=textwrap.dedent(request),
+            instructions=instructions,
+            parts=parts
+        )
+
+    @staticmethod
+    def compact_session_request(summary: str | None, messages: list):
+        """
+        Session compaction request summarizing older conversation turns (and any prior summary) into a checkpoint.
+        """
+        turns = "\n".join(f"--- {message['role'].upper()} ---\n{message['content']}" for message in messages)
+        return textwrap.dedent(
+            """\
+            Summarize the earlier part of this conversation between an operator and their in-terminal assistant
+            so the conversation can continue without it. Keep the operator's goals, decisions made, facts learned
+            about their system, commands that were run or recommended and any open questions. Be concise, omit
+            pleasantries and reasoning that led nowhere. Reply with the summary only.
+            
+            --- PREVIOUS SUMMARY ---
+            {summary}
+            
+            --- CONVERSATION ---
+            {turns}
+            """
+        ).format(summary=summary or "(none)", turns=turns)
+
+    @staticmethod
+    def pipe_window_request(request: str, instructions: str, window: str, summary: str | None, index: int):
+        """
+        Follow mode request for one window of a continuous input stream.
+        """
+        return textwrap.dedent(
+            """\
+            {request}
+            
+            Additional Instructions:
+            
+            {instructions}
+            
+            The input is a continuous stream (e.g. a followed log) processed in windows, this is window {window_number}.
+            Process only the new input below, use the summary of previous windows for context (recurring issues, trends) 
+            and do not repeat findings already reported unless they changed. Your output is added to the summary
+            for the next window, so keep it concise.
+            --- PREVIOUS WINDOWS ---
+            {summary}
+            --- INPUT ---
+            {window}
+            """
+        ).format(
+            request=textwrap.dedent(request),
+            instructions=instructions,
+            summary=summary or "(none)",
+            window=window,
+            window_number=index + 1
+        )
+
+    @staticmethod
+    def compact_follow_request(request: str, summary: str):
+        """
+        Follow mode request condensing the summary of previous windows once it grows past its budget.
+        """
+        return textwrap.dedent(
+            """\
+            The findings below were reported while processing a continuous input stream window by window for
+            this request:
+            
+            {request}
+            
+            Condense them into a summary to carry forward to the next windows. Keep every distinct finding, recurring
+            issue and trend with when it was last seen, merge repeated and superseded findings, and drop detail that
+            no longer matters. Reply with the summary only.
+            
+            --- FINDINGS ---
+            {summary}
+            """
+        ).format(request=textwrap.dedent(request), summary=summary)
+
     @staticmethod
     def system_settings(settings: Settings, include_system=True):
         """
         Generates a system settings prompt based on the provided settings.
+
+        Only stable details are included so the prompt prefix is identical across calls (and provider side
+        prompt caching applies), live readings are sent separately by system_stats at the end of the thread.
         """
-        operator = yaml.dump(settings.user.to_yaml({"stats": True, "prompt": True}), sort_keys=False)
-        system = yaml.dump(settings.system.to_yaml({"prompt": True, "stats": True}), sort_keys=False)
+        operator = yaml.dump(settings.user.to_yaml({"prompt": True}), sort_keys=False)
+        system = yaml.dump(settings.system.to_yaml({"prompt": True}), sort_keys=False)
         if not include_system:
             template = textwrap.dedent(
                 """
@@ -342,6 +517,29 @@ class Prompts:
                 """).strip().format(operator=operator, system=system)
         return Prompts.message(content=template)
 
+    @staticmethod
+    def system_stats(settings: Settings):
+        """
+        Generates a prompt with the current cpu, memory and disk readings of the system.
+        """
+        template = textwrap.dedent(
+            """
+            {heading}
+            Current readings for this system, review and reply ack.
+            ```yaml
+            {stats}
+            ```
+            """).strip().format(heading=Prompts.SYSTEM_STATS_HEADING, stats=yaml.dump(settings.system.readings(), sort_keys=False))
+        return Prompts.message(content=template)
+
+    @staticmethod
+    def is_system_stats(message) -> bool:
+        """
+        Whether a thread message is a system_stats prompt (whose readings differ on every call).
+        """
+        content = message.get("content") if isinstance(message, dict) else None
+        return isinstance(content, str) and content.startswith(Prompts.SYSTEM_STATS_HEADING)
+
     @staticmethod
     def query_prompt(request: str):
         prompt = textwrap.dedent(
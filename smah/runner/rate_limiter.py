@@ -0,0 +1,288 @@
+import datetime
+import email.utils
+import logging
+import random
+import sqlite3
+import time
+from typing import Callable, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+from openai import NotGiven
+from openai.types import CompletionUsage
+
+from smah.database import Database
+from smah.runner.context_budget import ContextBudget
+from smah.runner.telemetry import Telemetry
+from smah.settings.inference.provider import Provider
+from smah.settings.inference.provider.model import Model
+
+R = TypeVar("R")
+
+
+class ProviderSaturated(RuntimeError):
+    """
+    Raised when a provider's rate limit budget would hold a request longer than failover allows.
+    """
+    pass
+
+
+class Schedule:
+    """
+    The waits of one request within its rate limit budget: budget waits and retry backoff, with max_wait
+    counted across both (see RateLimiter.call).
+
+    Its methods read and update the shared buckets but never sleep, so Runner sleeps on them and AsyncRunner
+    runs them on its database thread and awaits the delays.
+    """
+
+    def __init__(self, limiter: "RateLimiter", model: Model, tokens: int, max_wait: Optional[float] = None):
+        self.limiter = limiter
+        self.model = model
+        self.tokens = tokens
+        self.max_wait = max_wait
+        self.attempt = 0
+        self.waited = 0.0
+
+    def remaining(self) -> Optional[float]:
+        return None if self.max_wait is None else self.max_wait - self.waited
+
+    def wait(self) -> float:
+        """
+        Try to take a request slot, returning 0 when granted or the seconds to wait before trying again.
+
+        Raises:
+            ProviderSaturated: If the budget is exhausted for longer than the remaining max_wait.
+        """
+        delay = self.limiter.wait(self.model, self.tokens)
+        if delay <= 0:
+            return 0.0
+        self.limiter.saturated(self.model, delay, self.remaining())
+        logging.info(f"Rate limit budget exhausted for {self.model.model}, waiting {delay:.2f}s")
+        delay += random.uniform(0, 0.05)
+        self.waited += delay
+        return delay
+
+    def retry(self, error: Exception) -> Optional[float]:
+        """
+        Seconds to wait before retrying a failed request, None if it should not be retried (see RateLimiter.retry_delay).
+        """
+        delay = self.limiter.retry_delay(self.model, self.attempt, error, self.remaining())
+        if delay is not None:
+            self.waited += delay
+            self.attempt += 1
+        return delay
+
+
+class RateLimiter:
+    """
+    Client side request scheduler for a provider's rate limits.
+
+    Requests take from per-model requests-per-minute and tokens-per-minute buckets before they are sent.
+    Limits come from the account tier (`--openai-api-tier` or the provider `tier` setting) or explicit per-model
+    overrides, and the buckets live in the smah database so every smah process on the host draws from the same
+    budget. Failed requests (429, 5xx, connection errors) are retried with jittered exponential backoff,
+    honoring Retry-After, and a 429 drains the shared request bucket so concurrent processes back off as well.
+
+    ```yaml
+    providers:
+      openai:
+        settings:
+          tier: 2
+          retries: 5
+          rate_limits:
+            gpt-4o: {rpm: 5000, tpm: 450000}
+    ```
+
+    Without a tier or overrides requests are not throttled, but are still retried.
+    """
+    TIERS = {
+        "gpt-4o-mini": {1: (500, 200_000), 2: (5_000, 2_000_000), 3: (5_000, 4_000_000), 4: (10_000, 10_000_000), 5: (30_000, 150_000_000)},
+        "gpt-4o": {1: (500, 30_000), 2: (5_000, 450_000), 3: (5_000, 800_000), 4: (10_000, 2_000_000), 5: (10_000, 30_000_000)},
+        "gpt-4-turbo": {1: (500, 30_000), 2: (5_000, 450_000), 3: (5_000, 600_000), 4: (10_000, 800_000), 5: (10_000, 2_000_000)},
+        "o1-mini": {1: (500, 200_000), 2: (5_000, 2_000_000), 3: (5_000, 4_000_000), 4: (10_000, 10_000_000), 5: (30_000, 150_000_000)},
+        "o1-preview": {1: (500, 30_000), 2: (5_000, 450_000), 3: (5_000, 800_000), 4: (10_000, 2_000_000), 5: (10_000, 30_000_000)},
+    }
+    DEFAULT_TIER_LIMITS = TIERS["gpt-4o"]
+    RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+    DEFAULT_RETRIES = 5
+    BACKOFF_BASE = 1.0
+    BACKOFF_CAP = 60.0
+    LOCKED_RETRY = 0.05
+
+    @staticmethod
+    def tier_limits(model: str, tier: int) -> Tuple[int, int]:
+        family = max((f for f in RateLimiter.TIERS if model.startswith(f)), key=len, default=None)
+        limits = RateLimiter.TIERS[family] if family else RateLimiter.DEFAULT_TIER_LIMITS
+        return limits[min(max(tier, 1), 5)]
+
+    @staticmethod
+    def cost(request: dict) -> int:
+        """
+        Tokens a request counts against TPM: prompt estimate plus the requested output limit.
+        """
+        output = request.get("max_completion_tokens")
+        if output is None or isinstance(output, NotGiven):
+            output = request.get("max_tokens")
+        if output is None or isinstance(output, NotGiven):
+            output = 0
+        return ContextBudget.tokens(request["messages"]) + output
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        response: Optional[httpx.Response] = getattr(error, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("retry-after-ms")
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+        value = response.headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=datetime.timezone.utc)
+            return max(date.timestamp() - time.time(), 0.0)
+        return None
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before a retry: Retry-After plus jitter when given, otherwise exponential backoff with equal jitter.
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, RateLimiter.BACKOFF_BASE)
+        delay = min(RateLimiter.BACKOFF_CAP, RateLimiter.BACKOFF_BASE * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def __init__(self, db: Database, provider: Optional[Provider], args):
+        self.db = db
+        settings = (provider.settings if provider else None) or {}
+        self.identifier = provider.identifier if provider else "openai"
+        self.tier: Optional[int] = (getattr(args, "openai_api_tier", None) if self.identifier == "openai" else None) or settings.get("tier")
+        self.overrides: dict = settings.get("rate_limits") or {}
+        self.retries: int = settings.get("retries", self.DEFAULT_RETRIES)
+        self.enabled = True
+
+    def limits(self, model: Model) -> Optional[Tuple[int, int]]:
+        """
+        (rpm, tpm) for a model, or None when unthrottled.
+        """
+        if model.provider != self.identifier:
+            return None
+        override = self.overrides.get(model.model) or self.overrides.get(model.name)
+        if override:
+            return override.get("rpm"), override.get("tpm")
+        if self.tier:
+            return self.tier_limits(model.model, int(self.tier))
+        return None
+
+    def buckets(self, model: Model, tokens: int) -> list[Tuple[str, float, float]]:
+        limits = self.limits(model) if self.enabled else None
+        if not limits:
+            return []
+        rpm, tpm = limits
+        buckets = []
+        if rpm:
+            buckets.append((f"{self.identifier}.{model.model}.rpm", float(rpm), 1.0))
+        if tpm:
+            buckets.append((f"{self.identifier}.{model.model}.tpm", float(tpm), float(tokens)))
+        return buckets
+
+    def wait(self, model: Model, tokens: int) -> float:
+        """
+        Try to take a request slot, returning 0 when granted or the seconds to wait before trying again.
+        """
+        buckets = self.buckets(model, tokens)
+        if not buckets:
+            return 0.0
+        try:
+            return self.db.rate_limit_acquire(buckets, time.time())
+        except sqlite3.OperationalError as e:
+            if not Database.unmigrated(e):
+                # another process held the buckets past the busy timeout, try again shortly.
+                logging.debug(f"Rate limiter busy: {e}")
+                return self.LOCKED_RETRY
+            logging.warning(f"Rate limiter unavailable (run `smah-db migrate`): {e}")
+            self.enabled = False
+            return 0.0
+
+    def adjust(self, model: Model, kind: str, delta: float, ceiling: Optional[float] = None) -> None:
+        for bucket, capacity, _ in self.buckets(model, 0):
+            if bucket.endswith(f".{kind}"):
+                try:
+                    self.db.rate_limit_adjust(bucket, capacity, delta, time.time(), ceiling=ceiling)
+                except sqlite3.OperationalError as e:
+                    if not Database.unmigrated(e):
+                        logging.warning(f"Rate limiter busy, skipped adjusting {bucket}: {e}")
+                        continue
+                    logging.warning(f"Rate limiter unavailable (run `smah-db migrate`): {e}")
+                    self.enabled = False
+
+    def release(self, model: Model, estimated: int, usage: Optional[CompletionUsage]) -> None:
+        """
+        Reconcile the estimated token cost with actual usage once a response completes.
+        """
+        if usage and usage.total_tokens is not None and estimated != usage.total_tokens:
+            self.adjust(model, "tpm", estimated - usage.total_tokens)
+
+    def penalize(self, model: Model, seconds: float) -> None:
+        """
+        Drain the shared request bucket so that every process holds off for about `seconds`.
+        """
+        limits = self.limits(model)
+        if limits and limits[0]:
+            self.adjust(model, "rpm", 0, ceiling=-(limits[0] / 60) * seconds)
+
+    @staticmethod
+    def saturated(model: Model, delay: float, max_wait: Optional[float]) -> None:
+        if max_wait is not None and delay > max_wait:
+            raise ProviderSaturated(f"Rate limit budget for {model.provider}.{model.name} exhausted for {delay:.2f}s")
+
+    def retry_delay(self, model: Model, attempt: int, error: Exception, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Delay before retrying a failed request, or None if it should not be retried
+        (or the delay would exceed max_wait, so the caller can fail over instead).
+        """
+        if attempt >= self.retries or not isinstance(error, self.RETRYABLE):
+            return None
+        delay = self.backoff(attempt, self.retry_after(error))
+        if isinstance(error, openai.RateLimitError):
+            self.penalize(model, delay)
+        if max_wait is not None and delay > max_wait:
+            return None
+        logging.warning(f"{type(error).__name__} from {model.model}, retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+        return delay
+
+    def schedule(self, model: Model, tokens: int, max_wait: Optional[float] = None) -> Schedule:
+        return Schedule(self, model, tokens, max_wait)
+
+    def call(self, model: Model, tokens: int, fn: Callable[[], R], telemetry: Optional[Telemetry] = None, max_wait: Optional[float] = None) -> R:
+        """
+        Run a request within the rate limit budget, retrying retryable failures.
+
+        With max_wait (when a fallback model is available) the request gives up rather than waiting, in total,
+        longer than max_wait seconds for rate limit budget or retry backoff.
+        """
+        schedule = self.schedule(model, tokens, max_wait)
+        while True:
+            while (delay := schedule.wait()) > 0:
+                time.sleep(delay)
+            if telemetry:
+                telemetry.send()
+            try:
+                return fn()
+            except Exception as e:
+                delay = schedule.retry(e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
@@ -1,8 +1,11 @@
+import re
 import textwrap
 from enum import Enum
 from typing import Optional
 from lxml import etree
 
+from smah.runner.conditions import ConditionError, Conditions
+
 html_tags = [
     "a",
     "abbr",
@@ -121,13 +124,42 @@ class ThoughtType(Enum):
     TANGENT = 5
 
 class TagBase(etree.ElementBase):
+    """
+    Child lookups use precompiled XPath selectors (the expressions cssselect translates the tags to).
+
+    Elements keep no state of their own, as lxml may discard and recreate an element's proxy. Callers reading
+    several children extract them in one walk with extract_children and keep the result (see ParsedResponse).
+    """
+    CHILDREN = ("title", "purpose", "command", "prompt")
+    SELECTORS: dict[str, etree.XPath] = {
+        tag: etree.XPath(f"descendant-or-self::{tag}") for tag in CHILDREN
+    }
+    CHOICES = etree.XPath("descendant-or-self::choices/descendant::choice")
+
+    def selector(self, tag: str) -> etree.XPath:
+        selector = TagBase.SELECTORS.get(tag)
+        if selector is None:
+            selector = TagBase.SELECTORS.setdefault(tag, etree.XPath(f"descendant-or-self::{tag}"))
+        return selector
+
     def extract_child(self, tag: str):
-        child = self.cssselect(tag)
+        child = self.selector(tag)(self)
         if len(child) > 0:
-            child = child[0]
-            return ResponseParser.unescape_response(child.text.strip())
+            return ResponseParser.unescape_response((child[0].text or "").strip())
         return None
 
+    def extract_children(self) -> dict[str, Optional[str]]:
+        """
+        The text of the first title, purpose, command and prompt element (as extract_child reads each).
+        """
+        children = dict.fromkeys(self.CHILDREN)
+        seen = set()
+        for child in self.iter(*self.CHILDREN):
+            if child.tag not in seen:
+                seen.add(child.tag)
+                children[child.tag] = ResponseParser.unescape_response((child.text or "").strip())
+        return children
+
 class SetConditionTag(TagBase):
     @property
     def name(self):
@@ -145,7 +177,7 @@ class SetConditionTag(TagBase):
     @property
     def choices(self):
         choices = []
-        x = self.cssselect("choices choice")
+        x = self.CHOICES(self)
         if len(x) > 0:
             for c in x:
                 c_value = ResponseParser.unescape_response(c.get("value"))
@@ -238,10 +270,17 @@ class ExecTag(TagBase):
 
     @property
     def markdown(self):
-        title = self.extract_child("title") or "Run Command"
+        return self.render_markdown()
+
+    def render_markdown(self, children: Optional[dict] = None) -> str:
+        """
+        The exec block as a code block, from children as extract_children returns them if given.
+        """
+        children = children or self.extract_children()
+        title = children["title"] or "Run Command"
         title = textwrap.indent(title, "# ")
         shell = self.get("shell")
-        command = self.extract_child("command") or ""
+        command = children["command"] or ""
 
         template = textwrap.dedent(
             """
@@ -270,143 +309,498 @@ class SmahLookup(etree.CustomElementClassLookup):
                 return SetConditionTag
         return None
 
+def trie_pattern(words: list[str]) -> str:
+    """
+    Regex alternation matching any of words, factored by common prefix so each position is tried once per branch.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node: dict) -> str:
+        if "" in node:
+            # a shorter word is a prefix of the longer ones (prefix matches are sufficient)
+            return ""
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return pattern(trie)
+
+
 class ResponseParser:
+    SMAH_TAGS = ["smah-", "cot", "exec", "prompt", "title", "command", "set-condition", "choices", "choice"]
+    ESCAPES = {"<": ":_smah_lt_:", "&amp;": ":_smah_amp_amp_:", "&": ":_smah_amp_:"}
+    # `<` not opening or closing a known tag (prefix match), and `&` (`&amp;` kept distinct).
+    ESCAPE = re.compile("<(?!/?" + trie_pattern(SMAH_TAGS + html_tags) + ")|&(?:amp;)?")
+
     def __init__(self):
         pass
 
     @staticmethod
-    def replace_tag(elem: any, replace: Optional[str] = None, tail: Optional[str] = None):
-        ps = elem.getprevious()
-        p = elem.getparent()
-        if ps is not None:
-            t = (ps.tail or "")
-            l = t.split("\n")
-            if len(l) > 0:
-                r = len(l[-1])
-                if replace:
-                    t += textwrap.indent(replace, " " * r).lstrip()
-                t += (tail or "")
-            else:
-                t += ((replace or "").lstrip() + (tail or ""))
-            ps.tail = t
-
-        elif p is not None:
-            t = (p.text or "")
-            l = t.split("\n")
-            if len(l) > 0:
-                r = len(l[-1])
-                if replace:
-                    t += textwrap.indent(replace, " " * r).lstrip()
-                t += (tail or "")
-            else:
-                t += ((replace or "").lstrip() + (tail or ""))
-            p.text = t
-        if p is not None:
-            p.remove(elem)
-
+    def replacement(replace: str, column: int) -> str:
+        """
+        A tag's replacement markdown, continuation lines indented to the column the tag started at.
+        """
+        return textwrap.indent(replace, " " * column).lstrip()
 
     @staticmethod
-    def extract_conditions(response: str, options: Optional[dict] = None) -> Optional[list]:
-        options = options or {}
-        parser = etree.XMLPullParser(recover=True)
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-        response = ResponseParser.escape_response(response)
-        parser.feed("<smah-msg>" + response + "</smah-msg>")
-        response = []
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, SetConditionTag):
-                    c = {
-                        'name': ResponseParser.unescape_response(elem.name),
-                        'prompt': ResponseParser.unescape_response(elem.prompt),
-                        'choices': elem.choices
-                    }
-                    response.append(c)
-        return response
+    def advance(column: int, text: str) -> int:
+        """
+        The column after writing text at column.
+        """
+        newline = text.rfind("\n")
+        return len(text) - newline - 1 if newline >= 0 else column + len(text)
 
     @staticmethod
-    def extract_commands(response: str, options: Optional[dict] = None) -> Optional[list]:
-        options = options or {}
-        parser = etree.XMLPullParser(recover=True)
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-
-        response = ResponseParser.escape_response(response)
-        parser.feed("<smah-msg>" + response + "</smah-msg>")
-        commands = []
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, ExecTag):
-                    conditions = options.get("conditions") or {}
-                    # include operator and system
-                    c = elem.exec_if
-                    c = ResponseParser.unescape_response(c)
-                    if c is None or eval(c, conditions):
-                        c = {
-                            'title': ResponseParser.unescape_response(elem.title),
-                            'purpose': ResponseParser.unescape_response(elem.purpose),
-                            'command': ResponseParser.unescape_response(elem.command),
-                            'shell': ResponseParser.unescape_response(elem.shell)
-                        }
-                        commands.append(c)
-                    else:
-                        print(f"Skipping command: {elem.title} due to falsy condition: {c}")
-        return commands
+    def parse(response: str, options: Optional[dict] = None) -> "ParsedResponse":
+        """
+        Parse a response once for rendering and extraction (see ParsedResponse).
+        """
+        return ParsedResponse(response, options)
 
     @staticmethod
-    def escape_response(response: str) -> str:
-        response = response.replace("<", ":_smah_lt_:")
-        response = response.replace("&amp;", ":_smah_amp_amp_:")
-        response = response.replace("&", ":_smah_amp_:")
+    def extract_conditions(response: str, options: Optional[dict] = None) -> Optional[list]:
+        return list(ResponseParser.parse(response, options).conditions)
 
-        for tag in ["smah-", "cot", "exec", "prompt", "title", "command", "set-condition", "choices", "choice"]:
-            response = response.replace(f":_smah_lt_:{tag}", f"<{tag}")
-            response = response.replace(f":_smah_lt_:/{tag}", f"</{tag}")
+    @staticmethod
+    def condition(elem: SetConditionTag) -> dict:
+        return {
+            'name': ResponseParser.unescape_response(elem.name),
+            'prompt': ResponseParser.unescape_response(elem.prompt),
+            'choices': elem.choices
+        }
 
-        for tag in html_tags:
-            response = response.replace(f":_smah_lt_:{tag}", f"<{tag}")
-            response = response.replace(f":_smah_lt_:/{tag}", f"</{tag}")
+    @staticmethod
+    def command(elem: ExecTag, conditions: Optional[dict] = None, children: Optional[dict] = None) -> Optional[dict]:
+        """
+        The command of an exec tag, None if its exec-if condition is falsy or not a valid condition (see Conditions).
+        Children are read from children (as extract_children returns them) if given.
+        """
+        children = children or elem.extract_children()
+        title = children["title"] or "Run Command"
+        # include operator and system
+        c = elem.exec_if
+        c = ResponseParser.unescape_response(c)
+        try:
+            run = c is None or Conditions.evaluate(c, conditions or {})
+        except ConditionError as e:
+            print(f"Skipping command: {title} due to invalid condition: {e}")
+            return None
+        if run:
+            return {
+                'title': ResponseParser.unescape_response(title),
+                'purpose': ResponseParser.unescape_response(children["purpose"] or "No Purpose Provided"),
+                'command': ResponseParser.unescape_response(children["command"]),
+                'shell': ResponseParser.unescape_response(elem.shell)
+            }
+        print(f"Skipping command: {title} due to falsy condition: {c}")
+        return None
 
+    @staticmethod
+    def extract_commands(response: str, options: Optional[dict] = None) -> Optional[list]:
+        return list(ResponseParser.parse(response, options).commands)
 
-        return response
+    @staticmethod
+    def escape_response(response: str) -> str:
+        """
+        Escape markup the XML parser must not see, in a single pass: `<` unless it opens or closes a smah or
+        html tag, and `&`. (Inputs containing the escape markers themselves are not round tripped.)
+        """
+        escapes = ResponseParser.ESCAPES
+        return ResponseParser.ESCAPE.sub(lambda m: escapes[m.group()], response)
 
     @staticmethod
     def unescape_response(response: Optional[str]) -> Optional[str]:
-        if response is None:
-            return None
+        if response is None or ":_smah_" not in response:
+            return response
+        # three C level replaces outperform a regex callback here.
         response = response.replace(":_smah_lt_:", "<")
         response = response.replace(":_smah_amp_amp_:", "&amp;")
-        response = response.replace(":_smah_amp_:", "&")
-
-        return response
+        return response.replace(":_smah_amp_:", "&")
 
     @staticmethod
     def to_markdown(response: str, options: Optional[dict] = None) -> str:
+        return ResponseParser.parse(response, options).markdown()
+
+
+class ParsedResponse:
+    """
+    A response parsed into a single tree, queried for its markdown, commands, conditions and thoughts.
+
+    Each result is computed from the tree on first access and cached, so rendering a response and extracting
+    its commands escape and parse it once. Results are returned as tuples and should not be modified.
+
+    Options:
+        strip-cot (bool): omit cot tags from markdown() unless strip_cot is given (default True).
+        conditions (dict): exec-if condition namespace for commands.
+    """
+    WRAP = ("<smah-msg>\n", "\n</smah-msg>")
+    PLACEHOLDER = "smah-body"
+
+    def __init__(self, response: str, options: Optional[dict] = None):
         options = options or {}
-        parser = etree.XMLPullParser(recover=True, encoding="utf-8")
-        parser.set_element_class_lookup(SmahLookup())
-        events = parser.read_events()
-        response = ResponseParser.escape_response(response)
+        self._response = response
+        self._strip_cot: bool = options.get("strip-cot", True)
+        self._conditions: Optional[dict] = options.get("conditions")
+        self._root = None
+        self._elements: Optional[tuple] = None
+        self._children: dict[ExecTag, dict] = {}
+        self._markdown: dict[bool, str] = {}
+        self._commands: Optional[tuple] = None
+        self._conditions_set: Optional[tuple] = None
+        self._thoughts: Optional[tuple] = None
+
+    @property
+    def response(self) -> str:
+        return self._response
+
+    @property
+    def root(self):
+        if self._root is None:
+            # parsed through the feed interface, as StreamingResponseParser parses, so both recover alike.
+            parser = etree.XMLParser(recover=True)
+            parser.set_element_class_lookup(SmahLookup())
+            parser.feed(self.WRAP[0] + ResponseParser.escape_response(self._response) + self.WRAP[1])
+            self._root = parser.close()
+        return self._root
 
+    @property
+    def elements(self) -> tuple:
+        """
+        The exec, set-condition and cot elements, in closing order.
+
+        Each exec element's children are extracted once here for both markdown and commands (the tuple keeps
+        the elements' proxies alive, so they stay valid keys).
+        """
+        if self._elements is None:
+            self._elements = tuple(
+                elem for _, elem in etree.iterwalk(self.root, events=("end",))
+                if isinstance(elem, (ExecTag, SetConditionTag, ThoughtTag))
+            )
+            self._children = {elem: elem.extract_children() for elem in self._elements if isinstance(elem, ExecTag)}
+        return self._elements
+
+    def markdown(self, strip_cot: Optional[bool] = None) -> str:
+        """
+        The response with exec tags rendered as code blocks, cot tags rendered (or stripped) and set-condition
+        tags removed. Other markup is kept as is.
+        """
+        strip_cot = self._strip_cot if strip_cot is None else strip_cot
+        if strip_cot not in self._markdown:
+            buffer: list[str] = []
+            self.render(self.root, strip_cot, self.enclosing(self.elements), self._children, buffer)
+            response = "".join(buffer)
+            # drop the newlines the wrapper added.
+            response = response[1:] if response.startswith("\n") else response
+            self._markdown[strip_cot] = response[:-1] if response.endswith("\n") else response
+        return self._markdown[strip_cot]
 
+    @staticmethod
+    def enclosing(elements) -> set:
+        """
+        The ancestors of elements. Only these are walked when rendering, other subtrees are serialized whole.
+        """
+        enclosing = set()
+        for elem in elements:
+            parent = elem.getparent()
+            while parent is not None and parent not in enclosing:
+                enclosing.add(parent)
+                parent = parent.getparent()
+        return enclosing
 
-        parser.feed("<smah-msg>\n" + response + "\n</smah-msg>")
-        for action, elem in events:
-            if action == "end":
-                if isinstance(elem, ExecTag):
-                    ResponseParser.replace_tag(elem, replace=elem.markdown, tail=elem.tail)
-                elif isinstance(elem, SetConditionTag):
-                    ResponseParser.replace_tag(elem, replace=None, tail=elem.tail)
-                elif isinstance(elem, ThoughtTag):
-                    ResponseParser.replace_tag(elem, replace=(None if options.get("strip-cot", True) else elem.markdown), tail=elem.tail)
+    @staticmethod
+    def render(node, strip_cot: bool, enclosing: set, children: dict, buffer: list[str]) -> None:
+        """
+        Write a node's content (text and children with their tails) to buffer in one pass.
+
+        A replacement is indented to its tag's column on the current run of text, the text since the parent's
+        start or the previous kept element.
+        """
+        unescape = ResponseParser.unescape_response
+        text = unescape(node.text or "")
+        buffer.append(text)
+        column = ResponseParser.advance(0, text)
+        for child in node:
+            column = ParsedResponse.render_child(child, column, strip_cot, enclosing, children, buffer)
+            tail = unescape(child.tail or "")
+            buffer.append(tail)
+            column = ResponseParser.advance(column, tail)
 
-        root = parser.close()
-        response = etree.tostring(root, pretty_print=True).decode()
-        response = ResponseParser.unescape_response(response)
+    @staticmethod
+    def render_child(child, column: int, strip_cot: bool, enclosing: set, children: dict, buffer: list[str]) -> int:
+        """
+        Write a child element (without its tail) to buffer, starting at column. Returns the column after it.
+        """
+        if isinstance(child, (ExecTag, SetConditionTag, ThoughtTag)):
+            replace = None
+            if isinstance(child, ExecTag):
+                replace = child.render_markdown(children.get(child))
+            elif isinstance(child, ThoughtTag) and not strip_cot:
+                replace = child.markdown
+            if replace:
+                replace = ResponseParser.replacement(replace, column)
+                buffer.append(replace)
+                column = ResponseParser.advance(column, replace)
+            return column
+        unescape = ResponseParser.unescape_response
+        if child in enclosing:
+            # the tags of a kept element, split around a placeholder body.
+            shell = etree.Element(child.tag, child.attrib, child.nsmap)
+            shell.text = ParsedResponse.PLACEHOLDER
+            start, end = etree.tostring(shell, encoding="unicode").split(ParsedResponse.PLACEHOLDER)
+            buffer.append(unescape(start))
+            ParsedResponse.render(child, strip_cot, enclosing, children, buffer)
+            buffer.append(end)
+        else:
+            buffer.append(unescape(etree.tostring(child, encoding="unicode", with_tail=False)))
+        return 0
 
+    @property
+    def commands(self) -> tuple:
+        """
+        Commands of the exec tags whose exec-if condition holds.
+        """
+        if self._commands is None:
+            commands = (
+                ResponseParser.command(elem, self._conditions, self._children.get(elem))
+                for elem in self.elements if isinstance(elem, ExecTag)
+            )
+            self._commands = tuple(c for c in commands if c is not None)
+        return self._commands
 
-        return response[len("<smah-msg>\n"):-(len("\n</smah-msg>") + 1)]
+    @property
+    def conditions(self) -> tuple:
+        if self._conditions_set is None:
+            self._conditions_set = tuple(ResponseParser.condition(elem) for elem in self.elements if isinstance(elem, SetConditionTag))
+        return self._conditions_set
 
+    @property
+    def thoughts(self) -> tuple:
+        if self._thoughts is None:
+            self._thoughts = tuple(
+                {'thought_type': elem.type, 'thought': elem.thought, 'markdown': elem.markdown}
+                for elem in self.elements if isinstance(elem, ThoughtTag)
+            )
+        return self._thoughts
+
+
+class StreamingResponseParser:
+    """
+    Incremental parser for streamed responses.
+
+    Chunks are escaped and fed to a pull parser building the tree ParsedResponse parses, and structured events
+    are returned as soon as they are complete:
+
+        {'type': "text", 'text': str}: rendered text and markup between smah tags.
+        {'type': "cot-start", 'thought_type': ThoughtType}: a cot tag opened.
+        {'type': "cot", 'thought_type': ThoughtType, 'thought': str, 'markdown': str}: a cot tag closed.
+        {'type': "exec", 'command': Optional[dict], 'markdown': str}: an exec block closed
+            (command as extract_commands returns it, None if its exec-if condition is falsy).
+        {'type': "set-condition", 'condition': dict}: a set-condition block closed (as extract_conditions returns it).
+
+    `markdown` holds the markdown of the finished part of the response, each top level element rendered by
+    ParsedResponse.render_child once it closes (so the closed parser's markdown is to_markdown's), and `pending`
+    the text received but not yet rendered, so a display can render a response while it streams.
+
+    Options:
+        strip-cot (bool): omit cot tags from markdown (default True).
+        conditions (dict): exec-if condition namespace.
+    """
+    OPEN = re.compile(r"<(cot|exec|set-condition)(?=[\s>/])")
+    # longest prefix that must be held back before it can be escaped: `</set-condition` + 1.
+    LOOKAHEAD = len("</set-condition") + 1
+
+    def __init__(self, options: Optional[dict] = None):
+        options = options or {}
+        self.strip_cot: bool = options.get("strip-cot", True)
+        self.conditions: Optional[dict] = options.get("conditions")
+        self.parser = etree.XMLPullParser(events=("start", "end"), recover=True)
+        self.parser.set_element_class_lookup(SmahLookup())
+        self.parser.feed(ParsedResponse.WRAP[0])
+        self.root = None
+        # raw text held back until it can be escaped, escaped text not yet fed (an unfinished tag).
+        self.hold = ""
+        self.buffer = ""
+        # escaped text fed since the last rendered element, and since the last tag started.
+        self.unsettled = ""
+        self.since_tag = ""
+        self.started = False
+        self.last = None
+        self.elements: list = []
+        self.children: dict[ExecTag, dict] = {}
+        self.segments: list[str] = []
+        self.texts: list[str] = []
+        self.line = 0
+        self.commands: list[dict] = []
+        self.conditions_set: list[dict] = []
+        self.thoughts: list[dict] = []
 
+    @property
+    def markdown(self) -> str:
+        return "".join(self.segments)
 
+    @property
+    def pending(self) -> str:
+        """
+        Text received but not yet rendered, up to the first smah tag in it (an unfinished smah tag is not included).
+        """
+        text = self.unsettled + self.buffer
+        match = self.OPEN.search(text)
+        if match:
+            return ResponseParser.unescape_response(text[:match.start()])
+        # a held back `<` may still open a smah tag.
+        return ResponseParser.unescape_response(text) + ("" if self.hold.startswith("<") else self.hold)
+
+    def write(self, pieces: list[str], text: bool) -> None:
+        for piece in pieces:
+            if piece:
+                self.segments.append(piece)
+                if text:
+                    self.texts.append(piece)
+
+    def flush(self) -> list[dict]:
+        """
+        The text written since the last event, as one text event.
+        """
+        text = "".join(self.texts)
+        self.texts = []
+        return [{'type': "text", 'text': text}] if text else []
+
+    def settle(self) -> None:
+        """
+        Write the text before the next top level element: the root's text or the last element's tail.
+        """
+        if not self.started:
+            self.started = True
+            text = ResponseParser.unescape_response(self.root.text or "")
+            self.line = ResponseParser.advance(self.line, text)
+            self.write([text[1:] if text.startswith("\n") else text], True)
+        elif self.last is not None:
+            text = ResponseParser.unescape_response(self.last.tail or "")
+            self.line = ResponseParser.advance(self.line, text)
+            self.write([text], True)
+            self.last = None
+
+    def render(self, elem) -> None:
+        """
+        Write a closed top level element.
+        """
+        buffer: list[str] = []
+        enclosing = ParsedResponse.enclosing(self.elements)
+        self.line = ParsedResponse.render_child(elem, self.line, self.strip_cot, enclosing, self.children, buffer)
+        self.write(buffer, not isinstance(elem, (ExecTag, SetConditionTag, ThoughtTag)))
+        self.elements = []
+        self.children = {}
+        self.last = elem
+
+    def event(self, elem) -> dict:
+        if isinstance(elem, ExecTag):
+            children = elem.extract_children()
+            self.children[elem] = children
+            event = {
+                'type': "exec",
+                'command': ResponseParser.command(elem, self.conditions, children),
+                'markdown': elem.render_markdown(children)
+            }
+            if event['command'] is not None:
+                self.commands.append(event['command'])
+        elif isinstance(elem, SetConditionTag):
+            event = {'type': "set-condition", 'condition': ResponseParser.condition(elem)}
+            self.conditions_set.append(event['condition'])
+        else:
+            event = {'type': "cot", 'thought_type': elem.type, 'thought': elem.thought, 'markdown': elem.markdown}
+            self.thoughts.append(event)
+        return event
+
+    def read(self) -> list[dict]:
+        """
+        Events for the elements the parser opened and closed since the last read.
+        """
+        events = []
+        for action, elem in self.parser.read_events():
+            if self.root is None:
+                self.root = elem
+                continue
+            if elem is self.root:
+                continue
+            top = elem.getparent() is self.root
+            if action == "start":
+                if top:
+                    self.settle()
+                    self.unsettled = self.since_tag
+                if isinstance(elem, ThoughtTag):
+                    events.extend(self.flush())
+                    events.append({'type': "cot-start", 'thought_type': elem.type})
+                continue
+            if isinstance(elem, (ExecTag, SetConditionTag, ThoughtTag)):
+                self.elements.append(elem)
+                events.extend(self.flush())
+                events.append(self.event(elem))
+            if top:
+                self.render(elem)
+                self.unsettled = ""
+        return events
+
+    def scan(self, final: bool = False) -> list[dict]:
+        """
+        Feed the escaped buffer to the parser a text run or a whole tag at a time, so elements are known to
+        start at the last tag fed.
+        """
+        events = []
+        while self.buffer:
+            if self.buffer.startswith("<"):
+                cut = self.buffer.find(">") + 1
+                if cut == 0:
+                    if not final:
+                        break
+                    cut = len(self.buffer)
+            else:
+                cut = self.buffer.find("<")
+                cut = len(self.buffer) if cut < 0 else cut
+            piece = self.buffer[:cut]
+            self.buffer = self.buffer[cut:]
+            self.parser.feed(piece)
+            self.unsettled += piece
+            self.since_tag = piece if piece.startswith("<") else self.since_tag + piece
+            events.extend(self.read())
+        events.extend(self.flush())
+        return events
+
+    def feed(self, chunk: str) -> list[dict]:
+        """
+        Add a chunk of the response, returning the events it completed.
+        """
+        text = self.hold + chunk
+        # `<` and `&` are escaped by what follows them, hold back any that could still be followed by more.
+        cut = text.rfind("<", max(len(text) - self.LOOKAHEAD, 0))
+        cut = -1 if ">" in text[cut:] else cut
+        amp = text.rfind("&", max(len(text) - 5, 0))
+        if amp >= 0 and "&amp;".startswith(text[amp:]):
+            cut = max(cut, amp) if cut >= 0 else amp
+        self.hold = text[cut:] if cut >= 0 else ""
+        text = text[:cut] if cut >= 0 else text
+        self.buffer += ResponseParser.escape_response(text)
+        return self.scan()
+
+    def close(self) -> list[dict]:
+        """
+        Finish the response, returning the remaining events (unclosed tags are closed as ParsedResponse closes them).
+        """
+        self.buffer += ResponseParser.escape_response(self.hold)
+        self.hold = ""
+        events = self.scan(final=True)
+        self.parser.feed(ParsedResponse.WRAP[1])
+        self.parser.close()
+        events.extend(self.read())
+        self.settle()
+        self.unsettled = ""
+        # drop the newline the wrapper added.
+        if self.segments and self.segments[-1].endswith("\n"):
+            if self.texts and self.texts[-1] is self.segments[-1]:
+                self.texts[-1] = self.texts[-1][:-1]
+            self.segments[-1] = self.segments[-1][:-1]
+        events.extend(self.flush())
+        return events
@@ -1,27 +1,57 @@
 import json
 import logging
+import os
+import queue
+import sqlite3
 import subprocess
+import sys
 import textwrap
+import time
 
 import rich.box
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Generator, Iterable, Optional, TextIO, Tuple
 
 import yaml
 from openai import OpenAI, NotGiven, NOT_GIVEN
 from openai.types.chat import ChatCompletion
+from openai.types import CompletionUsage
+from prompt_toolkit import PromptSession
+from prompt_toolkit.history import FileHistory
+from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.prompt import Prompt, Confirm
 
 from smah.console import std_console, err_console
-from smah.runner.response_parser import ResponseParser
+from smah.runner.backends import Backend
+from smah.runner.command_tool import CommandTool
+from smah.runner.completion_cache import CompletionCache
+from smah.runner.completion_call import CompletionCall
+from smah.runner.context_budget import ContextBudget, Section, Thread
+from smah.runner.hedger import Hedger, HedgeLeg
+from smah.runner.local_planner import LocalPlanner
+from smah.runner.pipe_chunker import PipeChunker
+from smah.runner.pipe_follower import PipeFollower
+from smah.runner.pipe_input import PipeInput
+from smah.runner.plan_cache import PlanCache
+from smah.runner.rate_limiter import RateLimiter
+from smah.runner.response_parser import ResponseParser, StreamingResponseParser
+from smah.runner.session_compactor import SessionCompactor
 from smah.settings.inference.provider.model import Model
 from smah.runner.prompts import Prompts
+from smah.runner.tokens import Tokens
 from smah.database import Database
 
 class Runner:
     MAX_PIPE_LENGTH = 2048
     PIPE_HEAD_LENGTH = 1024
+    LIVE_REFRESH_INTERVAL = 0.125
+    FAILOVERS = "failovers"
+    PROMPT_TOKENS = "prompt_tokens"
+    CACHED_PROMPT_TOKENS = "cached_prompt_tokens"
+    PIPE_CHUNK_MARGIN = 0.1
+    FOLLOW_SUMMARY_TOKENS = 1024
 
 
     @staticmethod
@@ -102,6 +132,52 @@ class Runner:
                 box=rich.box.ROUNDED)
             )
 
+    @staticmethod
+    def log_openai_completion_stream(
+            content: str,
+            usage: Optional[CompletionUsage] = None,
+            level: int = logging.INFO,
+            show: bool = False
+    ) -> None:
+        payload = yaml.dump(
+            {
+                'usage': usage.to_dict() if usage else False,
+                'content': content
+            },
+            sort_keys=False
+        )
+        logging.log(level, f"OpenAI Completion Stream:\n{payload}")
+        if show:
+            err_console.print(Panel(
+                Markdown("```yaml\n" + payload + "\n```\n"),
+                title="OpenAI Completion Stream",
+                style="bold white",
+                box=rich.box.ROUNDED)
+            )
+
+    @staticmethod
+    def completion_limits(model: Model, options: dict) -> Tuple[int | NotGiven, int | NotGiven]:
+        """
+        Determine max_tokens/max_completion_tokens for a completion request.
+
+        Args:
+            model (Model): The model the request is sent to.
+            options (dict): Per call overrides (max_tokens, max_completion_tokens).
+
+        Returns:
+            Tuple[int | NotGiven, int | NotGiven]: max_tokens, max_completion_tokens.
+        """
+        model_settings = model.settings or {}
+        max_output_tokens = model.context.get("out", 4096)
+        max_tokens = options.get("max_tokens", model_settings.get("max_tokens", max_output_tokens))
+        max_completion_tokens = options.get("max_completion_tokens", model_settings.get("max_completion_tokens", max_tokens))
+
+        if model_settings.get("max_completion_tokens"):
+            max_tokens = NOT_GIVEN
+        else:
+            max_completion_tokens = NOT_GIVEN
+        return max_tokens, max_completion_tokens
+
     @staticmethod
     def planner_response(response: ChatCompletion) -> Tuple[bool, dict] | None:
         plan = json.loads(response.choices[0].message.content)
@@ -114,20 +190,77 @@ class Runner:
             logging.error(f"Missing keys: {missing_keys}")
             return None
 
-    def __init__(self, args, settings):
-        self.args = args
-        self.settings = settings
-        self.db = Database(args)
-
+    @staticmethod
+    def rate_limiter_factory(db: Database, args, settings) -> dict[str, RateLimiter]:
+        """
+        A rate limiter per configured provider.
+        """
+        providers = settings.inference.providers if settings.inference else {}
+        return {identifier: RateLimiter(db, provider, args) for identifier, provider in providers.items()}
 
+    @staticmethod
+    def backend_factory(settings) -> dict[str, Backend]:
+        """
+        The backend serving each supported provider.
+        """
+        providers = settings.inference.providers if settings.inference else {}
+        backends = {identifier: Backend.resolve(provider) for identifier, provider in providers.items()}
+        return {identifier: backend for identifier, backend in backends.items() if backend}
 
+    @staticmethod
+    def completion_cache_factory(db: Database, args, settings) -> CompletionCache:
+        enabled = args.completion_cache
+        if enabled is None:
+            enabled = settings.inference.completion_cache.get("enabled", False)
+        return CompletionCache(db, settings, enabled=bool(enabled), replay=args.replay)
 
-    def openai_client(self):
-        api_key = self.settings.inference.providers['openai'].api_key(self.args)
-        client = OpenAI(
-            api_key=api_key
+    def __init__(self, args, settings):
+        self.args = args
+        self.settings = settings
+        self.db = Database(args, check_same_thread=False)
+        self.plan_cache = PlanCache(self.db, settings, enabled=args.plan_cache)
+        self.local_planner = LocalPlanner(self.db, settings, enabled=getattr(args, "local_planner", None))
+        self.session_compactor = SessionCompactor(self.db, settings)
+        self.completion_cache = self.completion_cache_factory(self.db, args, settings)
+        self.rate_limiters = self.rate_limiter_factory(self.db, args, settings)
+        self.backends = self.backend_factory(settings)
+        self.hedger = Hedger(self.db, settings, enabled=getattr(args, "hedge", None))
+        self.command_tool = CommandTool(settings, enabled=getattr(args, "tools", None))
+
+
+
+
+    def backend(self, model: Model) -> Optional[Backend]:
+        """
+        The backend serving a model's provider, None if the provider is not supported.
+        """
+        return self.backends.get(model.provider)
+
+    def rate_limiter(self, model: Model) -> RateLimiter:
+        limiter = self.rate_limiters.get(model.provider)
+        if limiter is None:
+            limiter = self.rate_limiters[model.provider] = RateLimiter(self.db, self.settings.inference.providers.get(model.provider), self.args)
+        return limiter
+
+    def openai_client(self, model: Model) -> OpenAI:
+        return self.backend(model).client(self.args)
+
+    def failover_wait(self) -> Optional[float]:
+        """
+        Longest a request waits on a saturated or failing provider before failing over to the next model.
+        """
+        failover = self.settings.inference.failover
+        return failover.get("max_wait") if failover.get("enabled", True) else None
+
+    def log_failover(self, model: Model, fallback: Model, error: Exception) -> None:
+        logging.warning(
+            f"Failing over from {model.provider}.{model.name} to {fallback.provider}.{fallback.name}: "
+            f"{type(error).__name__}: {error}"
         )
-        return client
+        try:
+            self.db.increment_setting(self.FAILOVERS)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Failover counter unavailable: {e}")
 
     @staticmethod
     def replace_exec_tags(content: str):
@@ -152,7 +285,7 @@ class Runner:
             }
             style = styles.get(message['role'], styles.get('default','bold green'))
             content = message['content']
-            content = ResponseParser.to_markdown(content, {'strip-cot': strip_cot})
+            content = ResponseParser.parse(content).markdown(strip_cot)
             std_console.print(
                 Panel(Markdown(content, style="white"), title=message['role'], style=style, box=rich.box.ROUNDED)
             )
@@ -160,6 +293,76 @@ class Runner:
             std_console.print(f"\n\n--- {message['role']} ---")
             std_console.print(message['content'])
 
+    @staticmethod
+    def print_stream(
+            deltas: Iterable[str],
+            role: Optional[str] = "assistant",
+            format: bool = False,
+            strip_cot = True,
+            styles: Optional[dict] = None,
+            parser: Optional[StreamingResponseParser] = None
+    ) -> str:
+        """
+        Render a completion as it streams in and return the assembled content.
+
+        In format mode the message is redrawn through a rich Live display (as a panel if role is set,
+        or bare markdown otherwise). In raw mode deltas are written to stdout unmodified as they arrive
+        so downstream programs in a pipe can start consuming output immediately.
+
+        Deltas are fed to a StreamingResponseParser as they arrive, so live redraws only render the new
+        segments and the response's commands are available from the parser once the stream ends.
+
+        Args:
+            deltas (Iterable[str]): Content fragments in arrival order.
+            role (Optional[str]): Message role used for the panel title/header, None for bare output.
+            format (bool): Render as rich markdown.
+            strip_cot (bool): Strip cot tags when rendering markdown.
+            styles (Optional[dict]): Panel styles by role.
+            parser (Optional[StreamingResponseParser]): Parser to feed the deltas to.
+
+        Returns:
+            str: The full message content.
+        """
+        content = []
+        parser = parser or StreamingResponseParser({'strip-cot': strip_cot})
+        if format:
+            styles = styles or {
+                'assistant': 'bold white',
+                'user': 'bold blue',
+                'default': 'bold green'
+            }
+            style = styles.get(role, styles.get('default', 'bold green'))
+
+            def render():
+                body = parser.markdown + parser.pending
+                if role:
+                    return Panel(Markdown(body, style="white"), title=role, style=style, box=rich.box.ROUNDED)
+                return Markdown(body)
+
+            with Live(render(), console=std_console, auto_refresh=False, vertical_overflow="visible") as live:
+                rendered = time.monotonic()
+                for delta in deltas:
+                    content.append(delta)
+                    parser.feed(delta)
+                    now = time.monotonic()
+                    if now - rendered >= Runner.LIVE_REFRESH_INTERVAL:
+                        live.update(render(), refresh=True)
+                        rendered = now
+                parser.close()
+                live.update(render(), refresh=True)
+        else:
+            if role:
+                std_console.print(f"\n\n--- {role} ---")
+            for delta in deltas:
+                content.append(delta)
+                parser.feed(delta)
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+            parser.close()
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+        return "".join(content)
+
 
 
     def resume(self, id: int, title: str, plan: dict, pipe: str, messages: list) -> None:
@@ -173,19 +376,11 @@ class Runner:
         )
         std_console.print(Markdown(open) if self.args.rich else open)
 
-        thread = [
-            Prompts.conventions(),
-            Prompts.ack(),
-            Prompts.system_settings(self.settings, include_system=plan['include_settings']),
-            Prompts.ack(),
+        system_settings = Prompts.system_settings(self.settings, include_system=plan['include_settings'])
+        history = self.compact_session(id, model) or [
+            Prompts.message(content=message['content'], role=message['role']) for message in messages
         ]
-
-        if pipe:
-            thread.append(Prompts.message(content=f"--- INPUT ---\n{pipe}"))
-            thread.append(Prompts.ack())
-
-        for message in messages:
-            thread.append(Prompts.message(content=message['content'], role=message['role']))
+        for message in history:
             self.print_message(message, format=self.args.rich)
 
         query = Prompt.ask("[bold green]Message[/bold green]: (type 'exit' or enter to end session)")
@@ -195,166 +390,684 @@ class Runner:
             self.print_message(query_message, format=self.args.rich, strip_cot=False)
 
             # Query with Instructions
-            thread.append(Prompts.query_prompt(request=query))
-            response = self.run(model, thread)
+            thread = self.resume_thread(plan, pipe, history, Prompts.query_prompt(request=query), system_settings)
+            parser = StreamingResponseParser()
+            content = self.print_stream(self.stream(model, thread, phase="resume", fallbacks=self.fallback_models(model, "query")), role="assistant", format=self.args.rich, parser=parser)
 
             # Response
-            message = Prompts.message(role=response.choices[0].message.role, content=response.choices[0].message.content)
-            self.print_message(message, format=self.args.rich)
+            message = Prompts.message(role="assistant", content=content)
+            history.extend([query_message, message])
 
             # Extract Commands
-            commands = ResponseParser.extract_commands(response.choices[0].message.content) or []
-            for command in commands:
-                std_console.print(
-                    Panel(
-                        Markdown(
-                            textwrap.dedent(
-                                """
-                                `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
-                                
-                                title: 
-                                {title}
-                                
-                                purpose: 
-                                {purpose}
-    
-                                ```{shell} 
-                                {command} 
-                                ```                       
-                                """
-                            ).format(
-                                title=command['title'],
-                                purpose=command['purpose'],
-                                command=command['command'],
-                                shell=command['shell']
-                            ),
-                            style="white"
-                        ),
-                        title="EXEC COMMAND",
-                        style="bold red",
-                        box=rich.box.ROUNDED
-                    )
-                )
-                c = Confirm.ask("[bold green]execute?[/bold green]")
-                if c:
-                    # This is dangerous
-                    subprocess.run(command['command'], shell=True)
+            self.confirm_commands(parser.commands)
 
             # Update Chat History
             self.db.append_to_chat(id, [query_message, message])
+            history = self.compact_session(id, model) or history
 
             # Continue
             query = Prompt.ask("[bold green]Message[/bold green]: (type 'exit' or enter to end session)")
 
         exit(0)
 
+    def compact_session(self, session_id: int, model: Model) -> Optional[list]:
+        """
+        Summarize the older turns of a session into a checkpoint once it exceeds the compaction threshold.
+
+        Returns:
+            Optional[list]: The compacted history (summary and recent tail), None if the session was not compacted.
+        """
+        pending = self.session_compactor.pending(session_id)
+        if pending is None:
+            return None
+        message_id, thread = self.session_compactor.request(*pending)
+        limit = SessionCompactor.SUMMARY_MAX_TOKENS
+        response = self.run(model, thread, options={'max_tokens': limit, 'max_completion_tokens': limit}, phase="compact")
+        content = (response.choices[0].message.content if response else None) or ""
+        if not content.strip():
+            logging.warning(f"Session #{session_id} compaction returned an empty summary")
+            return None
+        return self.session_compactor.save(session_id, message_id, content)
+
     def run(self,
             model: Model,
             thread: list,
             response_format: dict | NotGiven = NOT_GIVEN,
             tools: dict | NotGiven = NOT_GIVEN,
             options: Optional[dict] = None,
-            show: bool = False
+            show: bool = False,
+            phase: str = "query",
+            fallbacks: Optional[list[Model]] = None
             ):
-        options = options or {}
-        if model.provider == "openai":
-            self.log_openai_completion_request(
-                model=model,
-                thread=thread,
-                response_format=response_format,
-                options=options,
-                show=show
+        """
+        Run a completion, failing over to the fallback models in order when a provider errors or is saturated
+        (see `inference.failover`).
+        """
+        for candidate, fallback, max_wait in self.failover_candidates(model, fallbacks):
+            try:
+                return self.run_model(
+                    candidate,
+                    thread,
+                    response_format=response_format,
+                    tools=tools,
+                    options=options,
+                    show=show,
+                    phase=phase,
+                    max_wait=max_wait
                 )
+            except Backend.FAILOVER_ERRORS as e:
+                if fallback is None:
+                    raise
+                self.log_failover(candidate, fallback, e)
+        return None
 
-            client = self.openai_client()
-            model_settings = model.settings or {}
-
-            max_output_tokens = model.context.get("out", 4096)
-            max_tokens = options.get("max_tokens", model_settings.get("max_tokens", max_output_tokens))
-            max_completion_tokens = options.get("max_completion_tokens", model.settings.get("max_completion_tokens", max_tokens))
+    def run_model(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            max_wait: Optional[float] = None
+            ):
+        call = self.completion_call(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase)
+        if call is None:
+            return None
+        response = call.cached()
+        if response:
+            return response
 
-            if model_settings.get("max_completion_tokens"):
-                max_tokens = NOT_GIVEN
-            else:
-                max_completion_tokens = NOT_GIVEN
-
-            response = client.chat.completions.create(
-                model=model.model,
-                messages=thread,
-                max_completion_tokens=max_completion_tokens,
-                max_tokens=max_tokens,
-                response_format=response_format,
-                tools=tools
+        client = self.openai_client(model)
+        try:
+            response = call.send(lambda: client.chat.completions.create(**call.request), max_wait=max_wait)
+        except Exception as e:
+            call.failed(e)
+            raise
+        return call.completed(response)
+
+    def record_usage(self, model: Model, usage: Optional[CompletionUsage]) -> None:
+        """
+        Record prompt tokens served from the provider's prompt cache (usage.prompt_tokens_details.cached_tokens),
+        see `smah-db prompt-cache` for the running hit rate.
+        """
+        if not usage:
+            return
+        details = usage.prompt_tokens_details
+        cached = (details.cached_tokens if details else None) or 0
+        logging.info(f"Prompt Cache: {cached}/{usage.prompt_tokens} prompt tokens cached ({model.provider}.{model.name})")
+        try:
+            self.db.increment_setting(self.PROMPT_TOKENS, usage.prompt_tokens)
+            self.db.increment_setting(self.CACHED_PROMPT_TOKENS, cached)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Prompt cache counters unavailable: {e}")
+
+    def completion_request(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None
+            ) -> dict:
+        """
+        Chat completion request arguments (also the completion cache key payload).
+        """
+        max_tokens, max_completion_tokens = self.completion_limits(model, options or {})
+        max_output = max_completion_tokens if isinstance(max_tokens, NotGiven) else max_tokens
+        budget = ContextBudget(model, max_output=None if isinstance(max_output, NotGiven) else max_output)
+        messages = budget.fit(thread)
+        budget.log(show=self.args.verbose >= 3)
+        return self.backend(model).request({
+            'model': model.model,
+            'messages': messages,
+            'max_completion_tokens': max_completion_tokens,
+            'max_tokens': max_tokens,
+            'response_format': response_format,
+            'tools': tools,
+            **({'tool_choice': options['tool_choice']} if options and 'tool_choice' in options else {})
+        })
+
+    def completion_call(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            streamed: bool = False
+            ) -> Optional[CompletionCall]:
+        """
+        Prepare (and log) a completion request to a single model, None if its provider is not supported.
+        """
+        if not self.backend(model):
+            return None
+        options = options or {}
+        request = self.completion_request(model, thread, response_format=response_format, tools=tools, options=options)
+        self.log_openai_completion_request(
+            model=model,
+            thread=request['messages'],
+            response_format=response_format,
+            options=options,
+            show=show
             )
-            self.log_openai_completion_response(response, show=show)
+        return CompletionCall(self, model, request, phase, streamed=streamed, show=show)
+
+    def failover_candidates(self, model: Model, fallbacks: Optional[list[Model]] = None) -> list[Tuple[Model, Optional[Model], Optional[float]]]:
+        """
+        The models a request is tried against in order (see `inference.failover`), each with the model it fails over
+        to (None for the last) and the longest it waits on a saturated or failing provider before doing so.
+        """
+        candidates = [model, *(fallbacks or [])]
+        return [
+            (candidate, fallback, None if fallback is None else self.failover_wait())
+            for candidate, fallback in zip(candidates, [*candidates[1:], None])
+        ]
 
-            return response
+    def streaming(self, model: Model) -> bool:
+        """
+        Whether completions for the given model should be streamed.
 
+        Streaming is on unless disabled with --no-stream or by a `stream: false` model setting
+        (for models that do not support streamed responses).
+        """
+        return bool(self.args.stream) and (model.settings or {}).get("stream", True) is not False
 
+    def stream(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            fallbacks: Optional[list[Model]] = None
+            ) -> Generator[str, None, Optional[str]]:
+        """
+        Run a completion yielding content deltas as they arrive.
+
+        Fails over to the fallback models in order when a provider errors or is saturated before
+        the first delta arrives (see `inference.failover`), and hedges stalled requests when enabled
+        (see `inference.hedging`).
+
+        Returns:
+            Optional[str]: The assembled content (as the generator return value).
+        """
+        delay = self.hedger.delay(model, phase) if self.streaming(model) else None
+        for index, (candidate, fallback, max_wait) in enumerate(self.failover_candidates(model, fallbacks)):
+            started = False
+            try:
+                request = {
+                    'response_format': response_format,
+                    'tools': tools,
+                    'options': options,
+                    'show': show,
+                    'phase': phase,
+                    'max_wait': max_wait
+                }
+                if index == 0 and delay is not None:
+                    deltas = self.hedged_stream(candidate, self.hedger.target(candidate, fallbacks), delay, thread, **request)
+                else:
+                    deltas = self.stream_model(candidate, thread, **request)
+                while True:
+                    try:
+                        delta = next(deltas)
+                    except StopIteration as done:
+                        return done.value
+                    started = True
+                    yield delta
+            except Backend.FAILOVER_ERRORS as e:
+                if fallback is None or started:
+                    raise
+                self.log_failover(candidate, fallback, e)
+        return None
 
-    def inference_model(self, task: str) -> Optional[Model]:
-        model = None
+    def hedged_stream(self,
+            model: Model,
+            hedge: Model,
+            delay: float,
+            thread: list,
+            **request
+            ) -> Generator[str, None, Optional[str]]:
+        """
+        Stream a completion from model, sending a duplicate request to hedge if no delta arrives within delay seconds.
+
+        Both requests run on their own threads; the first to produce a delta (or complete) wins and the other is cancelled.
+
+        Returns:
+            Optional[str]: The assembled content (as the generator return value).
+        """
+        events: queue.Queue = queue.Queue()
+
+        def launch(name: str, target: Model) -> HedgeLeg:
+            return HedgeLeg(name, target, lambda leg: self.stream_model(target, thread, leg=leg, **request), events).launch()
+
+        self.hedger.record(Hedger.ARMED)
+        legs = [launch("primary", model)]
+        racing = list(legs)
+        deadline = time.monotonic() + delay
+        winner = None
+        try:
+            while True:
+                timeout = max(deadline - time.monotonic(), 0) if winner is None and len(legs) == 1 else None
+                try:
+                    leg, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    logging.info(
+                        f"No response from {model.provider}.{model.name} after {delay:.2f}s, "
+                        f"hedging with {hedge.provider}.{hedge.name}"
+                    )
+                    self.hedger.record(Hedger.HEDGED)
+                    legs.append(launch("hedge", hedge))
+                    racing.append(legs[-1])
+                    continue
+                if winner is None:
+                    if kind == "error":
+                        racing.remove(leg)
+                        if racing:
+                            logging.warning(f"Hedge {leg.name} request failed: {type(value).__name__}: {value}")
+                            continue
+                        raise value
+                    winner = leg
+                    for other in legs:
+                        if other is not winner:
+                            other.cancel()
+                    if winner.name == "hedge":
+                        self.hedger.record(Hedger.WINS)
+                    logging.info(f"Hedge {winner.name} request to {winner.model.provider}.{winner.model.name} responded first")
+                if leg is not winner:
+                    continue
+                if kind == "delta":
+                    yield value
+                elif kind == "done":
+                    return value
+                else:
+                    raise value
+        finally:
+            for leg in legs:
+                if leg.thread.is_alive():
+                    leg.cancel()
+
+    def stream_model(self,
+            model: Model,
+            thread: list,
+            response_format: dict | NotGiven = NOT_GIVEN,
+            tools: dict | NotGiven = NOT_GIVEN,
+            options: Optional[dict] = None,
+            show: bool = False,
+            phase: str = "query",
+            max_wait: Optional[float] = None,
+            leg: Optional[HedgeLeg] = None
+            ) -> Generator[str, None, Optional[str]]:
+        """
+        Run a completion against a single model yielding content deltas as they arrive.
+
+        Falls back to a single blocking request (yielding the full content once) when streaming is disabled.
+        A hedged request (leg) stops at its next chunk once cancelled.
+
+        Returns:
+            Optional[str]: The assembled content (as the generator return value).
+        """
+        if not self.streaming(model):
+            response = self.run_model(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase, max_wait=max_wait)
+            if response is None:
+                return None
+            content = response.choices[0].message.content or ""
+            yield content
+            return content
+
+        call = self.completion_call(model, thread, response_format=response_format, tools=tools, options=options, show=show, phase=phase, streamed=True)
+        if call is None:
+            return None
+        cached = call.cached()
+        if cached:
+            content = cached.choices[0].message.content or ""
+            yield content
+            return content
+
+        client = self.openai_client(model)
+        try:
+            response = call.send(
+                lambda: client.chat.completions.create(
+                    **call.request,
+                    stream=True,
+                    stream_options=self.backend(model).stream_options()
+                ),
+                max_wait=max_wait
+            )
+            if leg is not None:
+                leg.attach(response)
+            with response:
+                for chunk in response:
+                    if leg is not None:
+                        leg.check()
+                    delta = call.chunk(chunk)
+                    if delta:
+                        yield delta
+        except Exception as e:
+            call.failed(e)
+            raise
+        return call.streamed()
+
+    def inference_models(self, task: str) -> list[Model]:
+        """
+        Models for a task in order of preference: the command line override, then the model picker's
+        entries for the task (or its default entries). Models without a supported backend are skipped.
+        """
+        override = None
         if task == 'query':
-            model = self.settings.inference.models.get(self.args.model_query or self.args.model)
+            override = self.args.model_query or self.args.model
         if task == 'pipe':
-            model = self.settings.inference.models.get(self.args.model_pipe or self.args.model)
+            override = self.args.model_pipe or self.args.model
         if task == 'interactive':
-            model = self.settings.inference.models.get(self.args.model_interactive or self.args.model)
+            override = self.args.model_interactive or self.args.model
         if task == 'edit':
-            model = self.settings.inference.models.get(self.args.model_edit or self.args.model)
+            override = self.args.model_edit or self.args.model
         if task == 'review':
-            model = self.settings.inference.models.get(self.args.model_review or self.args.model)
+            override = self.args.model_review or self.args.model
 
-        if model:
-            return model
+        picker = self.settings.inference.model_picker
+        keys = [override] + (picker.get(task) or picker.get('default') or [])
+        models = []
+        for key in keys:
+            model = self.settings.inference.models.get(key) if key else None
+            if model and model not in models and self.backend(model):
+                models.append(model)
+        return models
 
-        l = self.settings.inference.model_picker.get(task) or self.settings.inference.model_picker.get('default') or []
-        for key in l:
-            if key in self.settings.inference.models:
-                return self.settings.inference.models[key]
-        return None
+    def inference_model(self, task: str) -> Optional[Model]:
+        models = self.inference_models(task)
+        return models[0] if models else None
+
+    def fallback_models(self, model: Optional[Model], task: str = 'default') -> list[Model]:
+        """
+        Models to fail over to when a request to model fails (see `inference.failover`).
+        """
+        if model is None or not self.settings.inference.failover.get("enabled", True):
+            return []
+        return [candidate for candidate in self.inference_models(task) if candidate is not model]
+
+    @staticmethod
+    def query_request(query: str, plan: dict) -> str:
+        return textwrap.dedent(
+            """\
+            {request}
+            
+            Additional Instructions:
+            
+            {instructions}
+            """).format(request=query, instructions=plan["instructions"])
+
+    @staticmethod
+    def pipe_input_request(query: str, pipe: str, plan: dict) -> str:
+        return textwrap.dedent(
+            """\
+            {query}
+            
+            Additional Instructions:
+            
+            {instructions}
+            --- INPUT ---
+            {pipe}
+            """
+        ).format(
+            query=textwrap.dedent(query),
+            pipe=pipe,
+            instructions=plan["instructions"]
+        )
+
+    @staticmethod
+    def pipe_history_request(query: str, plan: dict) -> str:
+        return textwrap.dedent(
+            """\
+            {request}                
+
+            Additional Instructions:
+            
+            {instructions}
+            """).format(request=query, instructions=plan["instructions"])
+
+    def settings_section(self, include_system: bool, system_settings: Optional[dict] = None) -> Section:
+        return Section(
+            "settings",
+            [
+                system_settings or Prompts.system_settings(self.settings, include_system=include_system),
+                Prompts.ack()
+            ],
+            priority=1,
+            strategy="trim"
+        )
+
+    def stats_section(self, include_system: bool, system_stats: Optional[dict] = None) -> Section:
+        """
+        Live system readings. Placed after all stable sections, just before the request, so the thread prefix
+        is identical between calls and provider side prompt caching applies.
+        """
+        return Section(
+            "stats",
+            [system_stats or Prompts.system_stats(self.settings), Prompts.ack()] if include_system else [],
+            strategy="drop"
+        )
+
+    def query_plan_thread(self, query: str, system_settings: Optional[dict] = None, system_stats: Optional[dict] = None) -> Thread:
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(True, system_settings),
+            Section("models", [Prompts.select_model(self.settings.inference), Prompts.ack()]),
+            self.stats_section(True, system_stats),
+            Section("request", [Prompts.select_model_request(query)], priority=2, strategy="trim"),
+        ])
+
+    def pipe_plan_thread(self, query: str, pipe: str, system_settings: Optional[dict] = None, system_stats: Optional[dict] = None) -> Thread:
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(True, system_settings),
+            Section(
+                "models",
+                [
+                    Prompts.select_model(
+                        self.settings.inference,
+                        additional_instructions="This is a pipe input processing request. Unless asked for formatted output assume desired output is to be raw terminal output."
+                    ),
+                    Prompts.ack()
+                ]
+            ),
+            self.stats_section(True, system_stats),
+            Section("request", [Prompts.select_model_request(Prompts.pipe_request(query, pipe))], priority=2, strategy="trim"),
+        ])
+
+    def query_thread(self, request: str, plan: dict, system_settings: Optional[dict] = None, system_stats: Optional[dict] = None) -> Thread:
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(plan["include_settings"], system_settings),
+            self.stats_section(plan["include_settings"], system_stats),
+            Section("request", [Prompts.query_prompt(request=request)], priority=2, strategy="trim"),
+        ])
+
+    def pipe_thread(self, request: str, plan: dict, system_settings: Optional[dict] = None, system_stats: Optional[dict] = None) -> Thread:
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(plan["include_settings"], system_settings),
+            Section("instructions", [Prompts.pipe_prompt(), Prompts.ack()]),
+            self.stats_section(plan["include_settings"], system_stats),
+            Section("request", [Prompts.message(content=request)], priority=2, strategy="trim"),
+        ])
+
+    def resume_thread(self,
+            plan: dict,
+            pipe: Optional[str],
+            history: list,
+            request: dict,
+            system_settings: Optional[dict] = None,
+            system_stats: Optional[dict] = None
+            ) -> Thread:
+        """
+        Thread for a resumed session turn. Older history is summarized first, then the original pipe input trimmed.
+        """
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(plan["include_settings"], system_settings),
+            Section(
+                "input",
+                [Prompts.message(content=f"--- INPUT ---\n{pipe}"), Prompts.ack()] if pipe else [],
+                priority=1,
+                strategy="trim"
+            ),
+            Section("history", history, priority=0, strategy="summarize"),
+            self.stats_section(plan["include_settings"], system_stats),
+            Section("request", [request], priority=2, strategy="trim"),
+        ])
 
     def query_plan(self, query: str) -> Optional[Tuple[bool, dict]]:
         self.log_mode("Query Plan", show=self.args.verbose >= 1)
         planner = self.inference_model("query")
+        cache_key = self.plan_cache.key("query", query, planner=f"{planner.provider}.{planner.name}")
+        plan = self.plan_cache.get(cache_key)
+        if plan:
+            return True, plan
+        local = self.local_planner.plan("query", query)
+        if self.local_planner.confident(local):
+            self.local_planner.record(local)
+            return True, local[1]
         response = self.run(
             model=planner,
-            thread=[
-                Prompts.conventions(),
-                Prompts.ack(),
-                Prompts.system_settings(self.settings),
-                Prompts.ack(),
-                Prompts.select_model(self.settings.inference, request=query),
-            ],
-            response_format=Prompts.planner_response_format()
+            thread=self.query_plan_thread(query),
+            response_format=Prompts.planner_response_format(),
+            phase="plan",
+            fallbacks=self.fallback_models(planner, "query")
         )
-        return self.planner_response(response)
+        plan = self.planner_response(response)
+        if plan:
+            self.local_planner.record(local, plan[1])
+            self.plan_cache.put(cache_key, "query", plan[1])
+        return plan
 
     def pipe_plan(self, query: str, pipe: str) -> Optional[Tuple[bool, dict]]:
         self.log_mode("Pipe Plan", show=self.args.verbose >= 1)
         planner = self.inference_model("pipe")
-        request = Prompts.pipe_request(query, pipe)
-
-        thread = [
-            Prompts.conventions(),
-            Prompts.ack(),
-            Prompts.system_settings(self.settings),
-            Prompts.ack(),
-            Prompts.select_model(
-                self.settings.inference,
-                request=request,
-                additional_instructions="This is a pipe input processing request. Unless asked for formatted output assume desired output is to be raw terminal output."
-            )
-        ]
+        cache_key = self.plan_cache.key("pipe", query, planner=f"{planner.provider}.{planner.name}", pipe=pipe)
+        plan = self.plan_cache.get(cache_key)
+        if plan:
+            return True, plan
+        local = self.local_planner.plan("pipe", query, pipe)
+        if self.local_planner.confident(local):
+            self.local_planner.record(local)
+            return True, local[1]
         response = self.run(
             model=planner,
-            thread=thread,
-            response_format=Prompts.planner_response_format()
+            thread=self.pipe_plan_thread(query, pipe),
+            response_format=Prompts.planner_response_format(),
+            phase="plan",
+            fallbacks=self.fallback_models(planner, "pipe")
         )
-        return self.planner_response(response)
+        plan = self.planner_response(response)
+        if plan:
+            self.local_planner.record(local, plan[1])
+            self.plan_cache.put(cache_key, "pipe", plan[1])
+        return plan
 
+    @staticmethod
+    def confirm_commands(commands: list) -> None:
+        for command in commands:
+            std_console.print(
+                Panel(
+                    Markdown(
+                        textwrap.dedent(
+                            """
+                            `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
+                            
+                            title: 
+                            {title}
+
+                            purpose: 
+                            {purpose}
+
+                            ```{shell} 
+                            {command} 
+                            ```                       
+                            """
+                        ).format(
+                            title=command['title'],
+                            purpose=command['purpose'],
+                            command=command['command'],
+                            shell=command['shell']
+                        ),
+                        style="white"
+                    ),
+                    title="EXEC COMMAND",
+                    style="bold red",
+                    box=rich.box.ROUNDED
+                )
+            )
+            c = Confirm.ask("[bold green]execute?[/bold green]")
+            if c:
+                # This is dangerous
+                subprocess.run(command['command'], shell=True)
+
+    def tool_thread(self, request: str, plan: dict, exchange: list, system_settings: dict, system_stats: dict) -> Thread:
+        """
+        Query thread for the tool loop: tool instructions before the request, then the tool calls and results so far.
+        """
+        return Thread([
+            Section("conventions", [Prompts.conventions(), Prompts.ack()]),
+            self.settings_section(plan["include_settings"], system_settings),
+            Section("tools", [Prompts.command_tool_prompt(), Prompts.ack()]),
+            self.stats_section(plan["include_settings"], system_stats),
+            Section("request", [Prompts.query_prompt(request=request)], priority=2, strategy="trim"),
+            Section("tool results", exchange, priority=1, strategy="trim"),
+        ])
 
+    @staticmethod
+    def log_tool_round(index: int, results: list[dict]) -> None:
+        lines = "\n".join(
+            f"- `{result['command']}` ({result['status']}, {result['elapsed']:.2f}s)" for result in results
+        )
+        err_console.print(Panel(
+            Markdown(lines),
+            title=f"Commands (round {index + 1})",
+            style="bold yellow",
+            box=rich.box.ROUNDED)
+        )
 
+    def tool_loop(self, model: Model, request: str, plan: dict, fallbacks: Optional[list[Model]] = None) -> str:
+        """
+        Answer a query letting the model run read-only diagnostic commands (see CommandTool).
+
+        Each round the model's run_command calls are executed concurrently and returned as tool results,
+        until it replies without tool calls or `max_rounds` is reached (then it is asked to answer without tools).
+
+        Returns:
+            str: The final answer.
+        """
+        tools = [Prompts.run_command_tool()]
+        system_settings = Prompts.system_settings(self.settings, include_system=plan["include_settings"])
+        system_stats = Prompts.system_stats(self.settings) if plan["include_settings"] else None
+        exchange = []
+        for index in range(self.command_tool.max_rounds + 1):
+            final = index == self.command_tool.max_rounds
+            if final:
+                exchange.append(Prompts.command_tool_final_request())
+            response = self.run(
+                model,
+                self.tool_thread(request, plan, exchange, system_settings, system_stats),
+                tools=tools,
+                options={'tool_choice': "none"} if final else None,
+                fallbacks=fallbacks
+            )
+            if response is None:
+                return ""
+            message = response.choices[0].message
+            if final or not message.tool_calls:
+                return message.content or ""
+            exchange.append({
+                'role': "assistant",
+                'content': message.content,
+                'tool_calls': [call.model_dump() for call in message.tool_calls]
+            })
+            results = self.command_tool.run(message.tool_calls)
+            self.log_tool_round(index, results)
+            exchange.extend(result['message'] for result in results)
+        return ""
 
     def query(self, query: str) -> Optional[str]:
         self.log_mode("Query", show=self.args.verbose >= 1)
@@ -363,72 +1076,24 @@ class Runner:
             _, p = plan
             self.log_query_plan(p, show=self.args.verbose >= 2)
 
-            request = textwrap.dedent(
-                """\
-                {request}
-                
-                Additional Instructions:
-                
-                {instructions}
-                """).format(request=query, instructions=p["instructions"])
+            request = self.query_request(query, p)
             model = self.settings.inference.models[p["model"]]
             print(query)
             self.print_message(Prompts.message(content=request), format=self.args.rich, strip_cot=False)
 
-            response = self.run(
-                model=model,
-                thread=[
-                    Prompts.conventions(),
-                    Prompts.ack(),
-                    Prompts.system_settings(self.settings, include_system=p["include_settings"]),
-                    Prompts.ack(),
-                    Prompts.query_prompt(request=request)
-                ]
-            )
-
-
-            msg = {'role': 'assistant', 'content': response.choices[0].message.content}
-            self.print_message(msg, format=self.args.rich)
-
-            # Extract Commands
-            commands = ResponseParser.extract_commands(response.choices[0].message.content) or []
-            for command in commands:
-                std_console.print(
-                    Panel(
-                        Markdown(
-                            textwrap.dedent(
-                                """
-                                `RUNNING SHELL COMMANDS MAY BE DANGEROUS: BE CAREFUL`
-                                
-                                title: 
-                                {title}
-
-                                purpose: 
-                                {purpose}
-
-                                ```{shell} 
-                                {command} 
-                                ```                       
-                                """
-                            ).format(
-                                title=command['title'],
-                                purpose=command['purpose'],
-                                command=command['command'],
-                                shell=command['shell']
-                            ),
-                            style="white"
-                        ),
-                        title="EXEC COMMAND",
-                        style="bold red",
-                        box=rich.box.ROUNDED
-                    )
+            if self.command_tool.enabled:
+                deltas = iter([self.tool_loop(model, request, p, fallbacks=self.fallback_models(model, "query"))])
+            else:
+                deltas = self.stream(
+                    model=model,
+                    thread=self.query_thread(request, p),
+                    fallbacks=self.fallback_models(model, "query")
                 )
-                c = Confirm.ask("[bold green]execute?[/bold green]")
-                if c:
-                    # This is dangerous
-                    subprocess.run(command['command'], shell=True)
-
+            parser = StreamingResponseParser()
+            content = self.print_stream(deltas, role="assistant", format=self.args.rich, parser=parser)
 
+            # Extract Commands
+            self.confirm_commands(parser.commands)
 
             self.db.save_chat(
                 p["title"],
@@ -436,78 +1101,285 @@ class Runner:
                 p,
                 [
                     Prompts.message(content=request),
-                    {'role': 'assistant', 'content': response.choices[0].message.content}
+                    {'role': 'assistant', 'content': content}
                 ]
             )
 
 
 
-            return response.choices[0].message.content
+            return content
         return None
 
 
-    def pipe(self, query: str, pipe: str) -> str | None:
-        plan = self.pipe_plan(query,pipe)
+    def pipe_chunk_budget(self, query: str, plan: dict, model: Model, system_settings: dict) -> int:
+        """
+        Token budget available for input in each map-reduce request.
+        """
+        request = Prompts.pipe_chunk_request(query, plan["instructions"], "", 0)
+        overhead = ContextBudget.tokens(self.pipe_thread(request, plan, system_settings))
+        budget = int((ContextBudget.input_window(model) - overhead) * (1 - self.PIPE_CHUNK_MARGIN))
+        if self.args.pipe_chunk_tokens:
+            budget = min(budget, self.args.pipe_chunk_tokens)
+        return max(budget, 1)
+
+    def map_reduce_pipe(self, query: str, pipe: str | Iterable[str], plan: dict, model: Model, system_settings: dict, budget: int) -> Generator[str, None, None]:
+        """
+        Process input too large for a single request.
+
+        The input (or its lines, read lazily) is split into token budgeted chunks on line boundaries as it is read,
+        which are processed concurrently (up to --pipe-concurrency requests in flight). Partial outputs are then
+        merged using the plan's instructions, in multiple rounds if the partials do not fit one request, with the
+        final merge streamed. A chunk that fails is skipped and noted in the merge.
+
+        Yields:
+            str: Content deltas of the final merged output.
+        """
+        fallbacks = self.fallback_models(model, "pipe")
+        self.log_mode("Map Reduce Pipe", show=self.args.verbose >= 1)
+
+        def map_chunk(item):
+            index, chunk = item
+            request = Prompts.pipe_chunk_request(query, plan["instructions"], chunk, index)
+            try:
+                response = self.run(model=model, thread=self.pipe_thread(request, plan, system_settings), phase="pipe", fallbacks=fallbacks)
+            except Exception as e:
+                logging.warning(f"Pipe part {index + 1} failed, skipping it: {type(e).__name__}: {e}")
+                response = None
+            if response is None:
+                return Prompts.pipe_chunk_failed(index)
+            return response.choices[0].message.content or ""
+
+        def reduce_group(group):
+            request = Prompts.pipe_reduce_request(query, plan["instructions"], group)
+            response = self.run(model=model, thread=self.pipe_thread(request, plan, system_settings), phase="pipe", fallbacks=fallbacks)
+            return (response.choices[0].message.content if response else None) or ""
+
+        partials = PipeChunker.bounded_map(map_chunk, enumerate(PipeChunker.chunks(pipe, budget)), self.args.pipe_concurrency)
+        logging.info(f"Mapped {len(partials)} pipe parts")
+        while True:
+            groups = PipeChunker.groups(partials, budget)
+            if len(groups) == 1:
+                break
+            if len(groups) == len(partials):
+                # each partial fills the budget on its own, merge pairwise.
+                groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+            logging.info(f"Reducing {len(partials)} partial outputs in {len(groups)} groups")
+            partials = PipeChunker.bounded_map(reduce_group, groups, self.args.pipe_concurrency)
+
+        if len(partials) == 1:
+            yield partials[0]
+        else:
+            request = Prompts.pipe_reduce_request(query, plan["instructions"], partials)
+            yield from self.stream(model=model, thread=self.pipe_thread(request, plan, system_settings), phase="pipe", fallbacks=fallbacks)
+
+    def pipe(self, query: str, pipe: str | PipeInput) -> str | None:
+        """
+        Pipe mode. Input is only read as far as needed: planning uses its preview, and input larger than
+        a single request is streamed through map-reduce rather than read whole.
+        """
+        pipe = pipe if isinstance(pipe, PipeInput) else PipeInput.text(pipe)
+        plan = self.pipe_plan(query, pipe.preview())
         if plan:
             _, p = plan
             self.log_pipe_plan(p, show=self.args.verbose >= 2)
 
-            request = textwrap.dedent(
-                """\
-                {query}
-                
-                Additional Instructions:
-                
-                {instructions}
-                --- INPUT ---
-                {pipe}
-                """
-            ).format(
-                query=textwrap.dedent(query),
-                pipe=pipe,
-                instructions=p["instructions"]
-            )
-
             model = self.settings.inference.models[p["model"]]
-            response = self.run(
-                model=model,
-                thread=[
-                    Prompts.conventions(),
-                    Prompts.ack(),
-                    Prompts.system_settings(self.settings, include_system=p["include_settings"]),
-                    Prompts.ack(),
-                    Prompts.pipe_prompt(),
-                    Prompts.ack(),
-                    Prompts.message(content=request),
-                ]
-            )
-            response_body = response.choices[0].message.content
-            if p["format_output"] and self.args.rich:
-                std_console.print(Markdown(response_body))
+            system_settings = Prompts.system_settings(self.settings, include_system=p["include_settings"])
+            budget = self.pipe_chunk_budget(query, p, model, system_settings)
+            if not pipe.fill(budget * Tokens.CHARS_PER_TOKEN + 1) or Tokens.estimate(pipe.buffer) > budget:
+                deltas = self.map_reduce_pipe(query, pipe.lines(), p, model, system_settings, budget)
+                # Oversized input is not retained for resume as it can not fit a follow up request.
+                saved_pipe = None
             else:
-                print(response_body)
-
-            request = textwrap.dedent(
-                """\
-                {request}                
+                request = self.pipe_input_request(query, pipe.buffer, p)
+                deltas = self.stream(
+                    model=model,
+                    thread=self.pipe_thread(request, p, system_settings),
+                    phase="pipe",
+                    fallbacks=self.fallback_models(model, "pipe")
+                )
+                saved_pipe = pipe.buffer
+            content = self.print_stream(deltas, role=None, format=bool(p["format_output"] and self.args.rich))
 
-                Additional Instructions:
-                
-                {instructions}
-                """).format(request=query, instructions=p["instructions"])
             self.db.save_chat(
                 p["title"],
                 self.args,
                 p,
                 [
-                    Prompts.message(content=request),
-                    {'role': 'assistant', 'content': response.choices[0].message.content}
+                    Prompts.message(content=self.pipe_history_request(query, p)),
+                    {'role': 'assistant', 'content': content}
                 ],
-                pipe=pipe
+                pipe=saved_pipe
             )
-            return response.choices[0].message.content
+            return content
         return None
 
 
-    def interactive(self, query: Optional[str] = None, pipe: Optional[str] = None) -> None:
-        self.log_mode("Interactive", show=self.args.verbose >= 1)
\ No newline at end of file
+    def follow(self, query: str, stream: TextIO) -> str | None:
+        """
+        Follow mode: process an unbounded input stream (e.g. `tail -f ... | smah --follow -q ...`) window by window.
+
+        The plan is made from the first window and reused. Each window is sent with a rolling summary of the
+        previous windows' output (see follow_summary), and output is emitted per window.
+        The session is recorded with the final summary once the stream ends or is interrupted.
+        """
+        follower = PipeFollower(
+            stream,
+            interval=self.args.follow_interval,
+            max_lines=self.args.follow_lines
+        )
+        windows = follower.windows()
+        window = next(windows, None)
+        if window is None:
+            return None
+        plan = self.pipe_plan(query, window)
+        if not plan:
+            return None
+        _, p = plan
+        self.log_mode("Follow Pipe", show=self.args.verbose >= 1)
+        self.log_pipe_plan(p, show=self.args.verbose >= 2)
+
+        model = self.settings.inference.models[p["model"]]
+        system_settings = Prompts.system_settings(self.settings, include_system=p["include_settings"])
+        budget = self.pipe_chunk_budget(query, p, model, system_settings) - self.FOLLOW_SUMMARY_TOKENS
+        follower.max_chars = min(follower.max_chars, max(budget, 1) * Tokens.CHARS_PER_TOKEN)
+        format = bool(p["format_output"] and self.args.rich)
+        fallbacks = self.fallback_models(model, "pipe")
+
+        summary = None
+        index = 0
+        try:
+            while window is not None:
+                logging.info(f"Follow Window {index + 1}: {window.count(chr(10))} lines")
+                if format:
+                    std_console.rule(f"Window {index + 1} - {time.strftime('%H:%M:%S')}")
+                request = Prompts.pipe_window_request(query, p["instructions"], window, summary, index)
+                content = self.print_stream(
+                    self.stream(model=model, thread=self.pipe_thread(request, p, system_settings), phase="pipe", fallbacks=fallbacks),
+                    role=None,
+                    format=format
+                )
+                summary = self.follow_summary(model, query, summary, content, index, fallbacks)
+                index += 1
+                window = next(windows, None)
+        except KeyboardInterrupt:
+            logging.info("Follow mode interrupted")
+
+        if summary:
+            self.db.save_chat(
+                p["title"],
+                self.args,
+                p,
+                [
+                    Prompts.message(content=self.pipe_history_request(query, p)),
+                    {'role': 'assistant', 'content': summary}
+                ]
+            )
+        return summary
+
+    def follow_summary(self, model: Model, query: str, summary: Optional[str], content: str, index: int, fallbacks: list[Model]) -> str:
+        """
+        Fold a window's output into the follow mode summary, condensing it with the model once it exceeds
+        FOLLOW_SUMMARY_TOKENS (its head and tail are kept if that fails).
+        """
+        summary = (summary + "\n\n" if summary else "") + f"--- Window {index + 1} ({time.strftime('%H:%M:%S')}) ---\n{content.strip()}"
+        excess = Tokens.estimate(summary) - self.FOLLOW_SUMMARY_TOKENS
+        if excess <= 0:
+            return summary
+        limit = self.FOLLOW_SUMMARY_TOKENS
+        thread = [Prompts.message(content=Prompts.compact_follow_request(query, summary))]
+        response = self.run(model, thread, options={'max_tokens': limit, 'max_completion_tokens': limit}, phase="compact", fallbacks=fallbacks)
+        compacted = (response.choices[0].message.content if response else None) or ""
+        if not compacted.strip():
+            logging.warning("Follow summary compaction returned an empty summary")
+            return ContextBudget.trim_content(summary, excess)
+        return compacted.strip()
+
+    def interactive_prompt(self) -> Callable[[], Optional[str]]:
+        """
+        Line reader for the REPL (prompt_toolkit with history stored beside the database).
+
+        Returns:
+            Callable[[], Optional[str]]: Reads the next message, None on Ctrl-D/Ctrl-C.
+        """
+        database = self.args.database or Database.default_database()
+        session = PromptSession(history=FileHistory(os.path.join(os.path.dirname(database), "interactive_history")))
+
+        def ask() -> Optional[str]:
+            try:
+                return session.prompt("message> ")
+            except (EOFError, KeyboardInterrupt):
+                return None
+        return ask
+
+    def interactive(self, query: Optional[str] = None, pipe: Optional[str] = None) -> Optional[int]:
+        """
+        Interactive session (REPL).
+
+        Settings, the client pool and the conventions/settings thread prefix are prepared once and reused by
+        every turn, system readings for the next turn are collected in the background while the operator types,
+        and each turn is appended to the stored session as it completes, so a follow up costs one request.
+
+        Returns:
+            Optional[int]: The session id, None if no message was sent.
+        """
+        self.log_mode("Interactive", show=self.args.verbose >= 1)
+        model = self.inference_model("interactive")
+        if model is None:
+            logging.error("No interactive model available, configure `model_picker` or pass --model-interactive")
+            return None
+        key = f"{model.provider}.{model.name}"
+        fallbacks = self.fallback_models(model, "interactive")
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="smah-prefetch") as prefetch:
+            system_settings = prefetch.submit(Prompts.system_settings, self.settings, include_system=True)
+            system_stats = prefetch.submit(Prompts.system_stats, self.settings)
+            if self.backend(model):
+                self.openai_client(model)
+            ask = self.interactive_prompt()
+
+            plan = None
+            session_id = None
+            history = []
+            query = query if query else ask()
+            while query is not None and query.strip() and query.strip() != "exit":
+                query = query.strip()
+                if plan is None:
+                    plan = {
+                        'title': LocalPlanner.title(query),
+                        'model': key,
+                        'reason': "Interactive model",
+                        'include_settings': True,
+                        'include_settings_reason': "Interactive sessions may request commands for the operator's system.",
+                        'format_output': bool(self.args.rich),
+                        'format_output_reason': "Interactive response.",
+                        'instructions': "None",
+                    }
+                query_message = Prompts.message(content=query, role='user')
+                thread = self.resume_thread(
+                    plan,
+                    pipe,
+                    history,
+                    Prompts.query_prompt(request=query),
+                    system_settings.result(),
+                    system_stats.result()
+                )
+                parser = StreamingResponseParser()
+                content = self.print_stream(
+                    self.stream(model, thread, phase="interactive", fallbacks=fallbacks),
+                    role="assistant",
+                    format=self.args.rich,
+                    parser=parser
+                )
+                message = Prompts.message(role="assistant", content=content)
+                history.extend([query_message, message])
+                system_stats = prefetch.submit(Prompts.system_stats, self.settings)
+
+                self.confirm_commands(parser.commands)
+
+                if session_id is None:
+                    session_id = self.db.save_chat(plan['title'], self.args, plan, [query_message, message], pipe=pipe)
+                else:
+                    self.db.append_to_chat(session_id, [query_message, message])
+                history = self.compact_session(session_id, model) or history
+                query = ask()
+        return session_id
\ No newline at end of file
@@ -0,0 +1,114 @@
+import logging
+import sqlite3
+from typing import Optional, Tuple
+
+from smah.database import Database
+from smah.runner.context_budget import ContextBudget
+from smah.runner.prompts import Prompts
+from smah.settings import Settings
+
+
+class SessionCompactor:
+    """
+    Keeps resumed sessions at a flat per-turn cost.
+
+    Once the messages a session would send (its latest checkpoint summary plus the messages after it) exceed
+    `inference.session_compaction.max_tokens`, everything but the most recent turns (up to `keep_tokens`) is
+    summarized into a checkpoint stored in the smah database. Resume then loads the checkpoint and the recent
+    tail instead of the full conversation; the original messages are kept.
+
+    ```yaml
+    inference:
+      session_compaction:
+        enabled: true
+        max_tokens: 8000
+        keep_tokens: 2000
+    ```
+    """
+    SUMMARY_HEADER = "--- SESSION SUMMARY ---\n"
+    SUMMARY_MAX_TOKENS = 1024
+
+    @staticmethod
+    def load(db: Database, session_id: Optional[int] = None) -> Optional[dict]:
+        """
+        Load a session for resume (the last session if no id is given), compacted when checkpoints are available.
+        """
+        try:
+            return db.session(session_id, compacted=True) if session_id else db.last_session(compacted=True)
+        except sqlite3.OperationalError as e:
+            if not Database.unmigrated(e):
+                raise
+            logging.warning(f"Session checkpoints unavailable (run `smah-db migrate`): {e}")
+            return db.session(session_id) if session_id else db.last_session()
+
+    @staticmethod
+    def summary_message(content: str) -> dict:
+        return Prompts.message(content=SessionCompactor.SUMMARY_HEADER + content, role="user")
+
+    @staticmethod
+    def split(messages: list[Tuple[int, dict]], keep_tokens: int) -> Tuple[list[Tuple[int, dict]], list[Tuple[int, dict]]]:
+        """
+        Split (id, message) pairs into older messages to summarize and a recent tail of whole turns
+        (starting with a user message) within keep_tokens. At least the last turn is kept.
+        """
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index][1].get("role") != "user":
+                continue
+            if start < len(messages) and ContextBudget.tokens([m for _, m in messages[index:]]) > keep_tokens:
+                break
+            start = index
+        return messages[:start], messages[start:]
+
+    def __init__(self, db: Database, settings: Settings):
+        self.db = db
+        config = settings.inference.session_compaction if settings.inference else {}
+        self.enabled: bool = config.get("enabled", True)
+        self.max_tokens: int = config.get("max_tokens", 8000)
+        self.keep_tokens: int = config.get("keep_tokens", 2000)
+
+    def pending(self, session_id: int) -> Optional[Tuple[Optional[dict], list[Tuple[int, dict]]]]:
+        """
+        The session's latest checkpoint and the messages after it, when they exceed max_tokens and
+        there are older turns to summarize; otherwise None.
+        """
+        if not self.enabled:
+            return None
+        try:
+            checkpoint = self.db.session_checkpoint(session_id)
+        except sqlite3.OperationalError as e:
+            if not Database.unmigrated(e):
+                logging.warning(f"Session checkpoints busy: {e}")
+                return None
+            logging.warning(f"Session checkpoints unavailable (run `smah-db migrate`): {e}")
+            self.enabled = False
+            return None
+        messages = self.db.session_messages(session_id, after=checkpoint["message_id"] if checkpoint else 0)
+        current = ([checkpoint["message"]] if checkpoint else []) + [message for _, message in messages]
+        if ContextBudget.tokens(current) <= self.max_tokens:
+            return None
+        older, _ = self.split(messages, self.keep_tokens)
+        if not older:
+            return None
+        return checkpoint, messages
+
+    def request(self, checkpoint: Optional[dict], messages: list[Tuple[int, dict]]) -> Tuple[int, list]:
+        """
+        The message id the new checkpoint will cover and the summarization thread.
+        """
+        older, _ = self.split(messages, self.keep_tokens)
+        summary = checkpoint["message"]["content"][len(self.SUMMARY_HEADER):] if checkpoint else None
+        thread = [Prompts.message(content=Prompts.compact_session_request(summary, [message for _, message in older]))]
+        return older[-1][0], thread
+
+    def save(self, session_id: int, message_id: int, content: str) -> list:
+        """
+        Store a checkpoint and return the compacted history (summary followed by the recent tail).
+        """
+        message = self.summary_message(content)
+        tail = [m for _, m in self.db.session_messages(session_id, after=message_id)]
+        self.db.save_session_checkpoint(session_id, message_id, message, ContextBudget.tokens([message]))
+        logging.info(
+            f"Session #{session_id} compacted: messages up to #{message_id} summarized, {len(tail)} recent messages kept"
+        )
+        return [message] + tail
@@ -0,0 +1,138 @@
+import logging
+import sqlite3
+import time
+from typing import Optional
+
+from openai.types import CompletionUsage
+
+from smah.database import Database
+from smah.settings.inference.provider.model import Model
+
+
+class Telemetry:
+    """
+    Timing, token usage and cost of a single inference call, stored in the `inference_telemetry` table.
+
+    All timings are seconds from the start of the call:
+        queue_wait: until the request was sent (rate limit waits and retry backoff).
+        first_token: until the first content delta arrived (streamed calls) or the response (blocking calls).
+        latency: until the response completed.
+
+    Cost is computed from the model's `cost` settings (`million_tokens_in`, `million_tokens_out` and optionally
+    `million_tokens_cached_in` for prompt tokens served from the provider's prompt cache).
+    See `smah-db stats` for percentiles by model and phase.
+    """
+    PHASES = ("plan", "query", "pipe", "resume", "interactive", "compact")
+    CANCELLED = "HedgeCancelled"
+    PERCENTILES = (50, 95, 99)
+
+    @staticmethod
+    def cost(model: Model, usage: Optional[CompletionUsage]) -> Optional[float]:
+        rates = model.cost or {}
+        if not usage or rates.get("million_tokens_in") is None or rates.get("million_tokens_out") is None:
+            return None
+        details = usage.prompt_tokens_details
+        cached = (details.cached_tokens if details else None) or 0
+        cached_rate = rates.get("million_tokens_cached_in", rates["million_tokens_in"])
+        return (
+            (usage.prompt_tokens - cached) * rates["million_tokens_in"]
+            + cached * cached_rate
+            + usage.completion_tokens * rates["million_tokens_out"]
+        ) / 1_000_000
+
+    @staticmethod
+    def percentile(values: list[float], p: float) -> Optional[float]:
+        """
+        Nearest rank percentile of values (None when empty).
+        """
+        if not values:
+            return None
+        ordered = sorted(values)
+        rank = max(int(-(-p * len(ordered) // 100)), 1)
+        return ordered[rank - 1]
+
+    @staticmethod
+    def summary(rows: list[dict]) -> list[dict]:
+        """
+        Group telemetry rows by model and phase with call counts, error counts, cancelled (hedge losing) calls,
+        token/cost totals and latency percentiles of successful calls.
+        """
+        groups: dict[tuple, list[dict]] = {}
+        for row in rows:
+            groups.setdefault((row["model"], row["phase"]), []).append(row)
+        summary = []
+        for (model, phase), group in sorted(groups.items()):
+            ok = [row for row in group if row["status"] == "ok"]
+            entry = {
+                'model': model,
+                'phase': phase,
+                'calls': len(group),
+                'errors': sum(1 for row in group if row["status"] not in ("ok", Telemetry.CANCELLED)),
+                'cancelled': sum(1 for row in group if row["status"] == Telemetry.CANCELLED),
+                'prompt_tokens': sum(row["prompt_tokens"] or 0 for row in ok),
+                'completion_tokens': sum(row["completion_tokens"] or 0 for row in ok),
+                'cached_tokens': sum(row["cached_tokens"] or 0 for row in ok),
+                'cost': sum(row["cost"] or 0 for row in ok),
+            }
+            for metric in ("queue_wait", "first_token", "latency"):
+                values = [row[metric] for row in ok if row[metric] is not None]
+                entry[metric] = {f"p{p}": Telemetry.percentile(values, p) for p in Telemetry.PERCENTILES}
+            summary.append(entry)
+        return summary
+
+    def __init__(self, model: Model, phase: str, streamed: bool = False):
+        self.model = model
+        self.phase = phase
+        self.streamed = streamed
+        self.started = time.monotonic()
+        self.sent: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.usage: Optional[CompletionUsage] = None
+        self.status = "ok"
+
+    def send(self) -> None:
+        """
+        Mark the request as sent (called before each attempt, so retries count as queue time).
+        """
+        self.sent = time.monotonic()
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def finish(self, usage: Optional[CompletionUsage] = None, error: Optional[Exception] = None) -> None:
+        self.finished = time.monotonic()
+        self.usage = usage
+        if error is not None:
+            self.status = type(error).__name__
+        elif self.first_token is None:
+            self.first_token = self.finished
+
+    def elapsed(self, mark: Optional[float]) -> Optional[float]:
+        return None if mark is None else mark - self.started
+
+    def to_record(self) -> dict:
+        details = self.usage.prompt_tokens_details if self.usage else None
+        return {
+            'provider': self.model.provider,
+            'model': self.model.name,
+            'phase': self.phase,
+            'streamed': self.streamed,
+            'status': self.status,
+            'queue_wait': self.elapsed(self.sent),
+            'first_token': self.elapsed(self.first_token),
+            'latency': self.elapsed(self.finished),
+            'prompt_tokens': self.usage.prompt_tokens if self.usage else None,
+            'completion_tokens': self.usage.completion_tokens if self.usage else None,
+            'cached_tokens': ((details.cached_tokens if details else None) or 0) if self.usage else None,
+            'cost': self.cost(self.model, self.usage),
+        }
+
+    def record(self, db: Database) -> None:
+        record = self.to_record()
+        logging.debug(f"Inference Telemetry: {record}")
+        try:
+            db.telemetry_record(record)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Inference telemetry unavailable (run `smah-db migrate`): {e}")
@@ -0,0 +1,15 @@
+import math
+
+
+class Tokens:
+    """
+    Fast local token count approximation.
+    """
+    CHARS_PER_TOKEN = 4
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """
+        Estimate the token count of text (~4 characters per token for English/log text).
+        """
+        return math.ceil(len(text) / Tokens.CHARS_PER_TOKEN)
\ No newline at end of file
@@ -7,6 +7,44 @@ from .provider import Provider
 
 class Inference:
     CONFIG_VSN: str = "0.0.1"
+    PLAN_CACHE_DEFAULTS: dict = {
+        "ttl": 86400,
+        "max_entries": 512,
+    }
+    COMPLETION_CACHE_DEFAULTS: dict = {
+        "enabled": False,
+        "max_bytes": 64 * 1024 * 1024,
+    }
+    LOCAL_PLANNER_DEFAULTS: dict = {
+        "enabled": True,
+        "min_confidence": 0.6,
+    }
+    SESSION_COMPACTION_DEFAULTS: dict = {
+        "enabled": True,
+        "max_tokens": 8000,
+        "keep_tokens": 2000,
+    }
+    FAILOVER_DEFAULTS: dict = {
+        "enabled": True,
+        "max_wait": 10,
+    }
+    TOOLS_DEFAULTS: dict = {
+        "enabled": False,
+        "max_rounds": 6,
+        "timeout": 15,
+        "concurrency": 4,
+        "max_output_tokens": 1000,
+        "allow": [],
+    }
+    HEDGING_DEFAULTS: dict = {
+        "enabled": False,
+        "percentile": 95,
+        "min_samples": 20,
+        "min_delay": 0.5,
+        "max_delay": 30,
+        "target": "fallback",
+        "phases": ["query", "interactive", "resume"],
+    }
 
     @staticmethod
     def config_vsn() -> str:
@@ -27,6 +65,13 @@ class Inference:
         self.vsn = config_data.get("vsn", self.config_vsn())
         self.instructions: Optional[str] = config_data.get("instructions")
         self.model_picker = config_data.get("model_picker") or {"default": ["openai.gpt-4o-mini"]}
+        self.plan_cache: dict = {**self.PLAN_CACHE_DEFAULTS, **(config_data.get("plan_cache") or {})}
+        self.completion_cache: dict = {**self.COMPLETION_CACHE_DEFAULTS, **(config_data.get("completion_cache") or {})}
+        self.local_planner: dict = {**self.LOCAL_PLANNER_DEFAULTS, **(config_data.get("local_planner") or {})}
+        self.session_compaction: dict = {**self.SESSION_COMPACTION_DEFAULTS, **(config_data.get("session_compaction") or {})}
+        self.failover: dict = {**self.FAILOVER_DEFAULTS, **(config_data.get("failover") or {})}
+        self.hedging: dict = {**self.HEDGING_DEFAULTS, **(config_data.get("hedging") or {})}
+        self.tools: dict = {**self.TOOLS_DEFAULTS, **(config_data.get("tools") or {})}
         self.providers: dict[str,Provider] = {}
         providers = config_data.get("providers", {})
         for k, v in providers.items():
@@ -78,6 +123,13 @@ class Inference:
             'vsn': self.config_vsn(),
             'instructions': self.instructions,
             'model_picker': self.model_picker,
+            'plan_cache': self.plan_cache,
+            'completion_cache': self.completion_cache,
+            'local_planner': self.local_planner,
+            'session_compaction': self.session_compaction,
+            'failover': self.failover,
+            'hedging': self.hedging,
+            'tools': self.tools,
             'providers': providers
         }
 
@@ -85,6 +137,13 @@ class Inference:
             pass
         else:
             o.pop('model_picker')
+            o.pop('plan_cache')
+            o.pop('completion_cache')
+            o.pop('local_planner')
+            o.pop('session_compaction')
+            o.pop('failover')
+            o.pop('hedging')
+            o.pop('tools')
             o.pop('vsn')
         return o
 
@@ -41,17 +41,22 @@ class Provider:
         return True
 
     def api_key(self, args):
-        if self.identifier == "openai":
-            k = args.openai_api_key or self.settings.get("api_key")
-            if k:
-                if k.startswith("$"):
-                    k = k.lstrip("$").lstrip("{").rstrip("}")
-                    return os.environ.get(k)
-                else:
-                    return k
+        """
+        The provider's api key: `--openai-api-key` (openai only), the `api_key` setting (`$VAR`/`${VAR}` reads
+        an environment variable), then `SMAH_<IDENTIFIER>_API_KEY` (and `OPENAI_API_KEY` for openai).
+        """
+        k = getattr(args, "openai_api_key", None) if self.identifier == "openai" else None
+        k = k or self.settings.get("api_key")
+        if k:
+            if k.startswith("$"):
+                k = k.lstrip("$").lstrip("{").rstrip("}")
+                return os.environ.get(k)
             else:
-                return os.environ.get("SMAH_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
-        return None
+                return k
+        environment = f"SMAH_{self.identifier.upper().replace('-', '_')}_API_KEY"
+        if self.identifier == "openai":
+            return os.environ.get(environment) or os.environ.get("OPENAI_API_KEY")
+        return os.environ.get(environment)
 
     def to_yaml(self, options = None):
         options = options or {}
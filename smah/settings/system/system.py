@@ -84,9 +84,7 @@ class System:
                 "vsn": self.config_vsn(),
                 "shell": self.shell,
                 "operating_system": self.operating_system.to_yaml(options=options) if self.operating_system else None,
-                "cpu": self.cpu.readings(),
-                "memory": self.cpu.readings(),
-                "disk": self.disk.readings()
+                **self.readings()
             }
         else:
             return {
@@ -95,6 +93,19 @@ class System:
                 "operating_system": self.operating_system.to_yaml(options=options) if self.operating_system else None,
             }
 
+    def readings(self) -> dict:
+        """
+        Current cpu, memory and disk readings.
+
+        Returns:
+            dict: The readings by resource.
+        """
+        return {
+            "cpu": self.cpu.readings(),
+            "memory": self.memory.readings(),
+            "disk": self.disk.readings()
+        }
+
     def show(self, options=None):
         options = options or {}
         o = self.operating_system.show(options=options) if self.operating_system else None
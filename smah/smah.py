@@ -23,7 +23,10 @@ Note:
 Ensure the environment is set up with the necessary dependencies before executing this script.
 """
 
+import asyncio
 import logging
+import os
+import sys
 import textwrap
 from typing import Optional
 
@@ -31,7 +34,8 @@ from rich.prompt import Prompt
 
 import smah.console
 from smah.database import Database
-from smah.runner import Runner
+from smah.runner import Runner, AsyncRunner, ClientPool
+from smah.runner.session_compactor import SessionCompactor
 from smah.settings import Settings, configurator
 import smah.logs
 import smah.args
@@ -71,10 +75,7 @@ def resume_session(args, session: Optional[int] = None):
         args (argparse.Namespace): The parsed command-line arguments.
     """
     db = Database(args)
-    if session:
-        session = db.session(session)
-    else:
-        session = db.last_session()
+    session = SessionCompactor.load(db, session)
 
     if session:
         args = smah.args.merge_args(args, session['args'])
@@ -92,6 +93,30 @@ def resume_session(args, session: Optional[int] = None):
         print("No previous session found.")
         exit(1)
 
+def run_batch(args, settings: Settings) -> None:
+    """
+    Runs the jobs in a JSONL batch file, writing JSONL results to stdout.
+
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments.
+        settings (Settings): The loaded settings shared by every job.
+    """
+    runner = AsyncRunner(args, settings)
+
+    async def batch(jobs) -> dict:
+        try:
+            return await runner.batch(jobs, sys.stdout, concurrency=args.batch_concurrency)
+        finally:
+            await runner.close()
+
+    if args.batch == "-":
+        counts = asyncio.run(batch(sys.stdin))
+    else:
+        with open(os.path.expanduser(args.batch), 'r') as jobs:
+            counts = asyncio.run(batch(jobs))
+    if counts['error']:
+        exit(1)
+
 def main():
     """
     The primary function that sets up application configuration and executes user-specified queries.
@@ -106,6 +131,7 @@ def main():
     # Configure logging
     smah.logs.configure()
 
+    args = None
     try:
         args, pipe = smah.args.extract_args()
 
@@ -125,13 +151,22 @@ def main():
                 settings.log(print=True, format=True)
             else:
                 settings.log(print=(args.verbose >= 3), format=True)
+            if args.batch:
+                run_batch(args, settings)
+                return
+
             runner = Runner(args, settings)
 
 
             query = __with_query(args)
 
-            if args.interactive or not query:
-                runner.interactive(query=query, pipe=pipe)
+            if args.follow:
+                if query and not sys.stdin.isatty():
+                    runner.follow(query=query, stream=sys.stdin)
+                else:
+                    logging.error("--follow requires a query and piped input")
+            elif args.interactive or not query:
+                runner.interactive(query=query, pipe=pipe.read() if pipe is not None else None)
             else:
                 if pipe:
                     runner.pipe(query=query, pipe=pipe)
@@ -139,6 +174,8 @@ def main():
                     runner.query(query=query)
     except Exception as e:
         logging.error("An unexpected error occurred in main: %s", str(e), exc_info=True)
+    finally:
+        ClientPool.log_stats(show=args is not None and args.verbose >= 2)
 
 
 def __with_query(args) -> Optional[str]:
@@ -1,5 +1,7 @@
 from smah.database import Database, Migration
+from smah.runner.telemetry import Telemetry
 import argparse
+import datetime
 
 
 def parse_arguments():
@@ -34,6 +36,29 @@ def parse_arguments():
     create_migration_parser = subparsers.add_parser("create", help="Show the current migration status")
     create_migration_parser.add_argument(dest="name", type=str, help="Name of the migration")
 
+    # Plan cache command
+    plan_cache_parser = subparsers.add_parser("plan-cache", help="Show or clear the plan cache")
+    plan_cache_parser.add_argument("--clear",
+                                action=argparse.BooleanOptionalAction,
+                                help="Remove all cached plans",
+                                default=False)
+
+    # Completion cache command
+    completion_cache_parser = subparsers.add_parser("completion-cache", help="Show or clear the completion cache")
+    completion_cache_parser.add_argument("--clear",
+                                action=argparse.BooleanOptionalAction,
+                                help="Remove all cached completions",
+                                default=False)
+
+    # Prompt cache command
+    subparsers.add_parser("prompt-cache", help="Show the provider prompt cache hit rate")
+
+    # Stats command
+    stats_parser = subparsers.add_parser("stats", help="Show inference latency, token and cost percentiles by model and phase")
+    stats_parser.add_argument("--days", type=float, help="Only include calls from the last DAYS days")
+    stats_parser.add_argument("--model", type=str, help="Only include calls to a model (e.g. openai.gpt-4o)")
+    stats_parser.add_argument("--phase", type=str, choices=Telemetry.PHASES, help="Only include calls for a phase")
+
     # database argument
     parser.add_argument("--database", type=str, help="Path to the database file")
 
@@ -51,7 +76,83 @@ def main():
         Migration.status(database)
     elif args.command == "create":
         Migration.create(args.name)
+    elif args.command == "plan-cache":
+        plan_cache(database, args)
+    elif args.command == "completion-cache":
+        completion_cache(database, args)
+    elif args.command == "prompt-cache":
+        prompt_cache(database)
+    elif args.command == "stats":
+        stats(database, args)
+
+
+def plan_cache(database: Database, args):
+    if args.clear:
+        database.plan_cache_clear()
+        print("Plan Cache Cleared")
+    counters = database.counters(["plan_cache_hits", "plan_cache_misses"])
+    lookups = counters["plan_cache_hits"] + counters["plan_cache_misses"]
+    rate = (counters["plan_cache_hits"] / lookups * 100) if lookups else 0.0
+    print(f"Plan Cache: {database.plan_cache_size()} entries, {counters['plan_cache_hits']} hits, {counters['plan_cache_misses']} misses ({rate:.1f}% hit rate)")
+    counters = database.counters(["local_planner_plans", "local_planner_deferred", "local_planner_agreed"])
+    deferred = counters["local_planner_deferred"]
+    agreement = (counters["local_planner_agreed"] / deferred * 100) if deferred else 0.0
+    print(f"Local Planner: {counters['local_planner_plans']} planned locally, {deferred} deferred to the LLM planner ({agreement:.1f}% same model)")
+
+def completion_cache(database: Database, args):
+    if args.clear:
+        database.completion_cache_clear()
+        print("Completion Cache Cleared")
+    counters = database.counters(["completion_cache_hits", "completion_cache_misses"])
+    lookups = counters["completion_cache_hits"] + counters["completion_cache_misses"]
+    rate = (counters["completion_cache_hits"] / lookups * 100) if lookups else 0.0
+    entries, size = database.completion_cache_size()
+    print(f"Completion Cache: {entries} entries ({size} bytes), {counters['completion_cache_hits']} hits, {counters['completion_cache_misses']} misses ({rate:.1f}% hit rate)")
+
+def prompt_cache(database: Database):
+    counters = database.counters(["prompt_tokens", "cached_prompt_tokens"])
+    rate = (counters["cached_prompt_tokens"] / counters["prompt_tokens"] * 100) if counters["prompt_tokens"] else 0.0
+    print(f"Prompt Cache: {counters['cached_prompt_tokens']} of {counters['prompt_tokens']} prompt tokens cached by the provider ({rate:.1f}% hit rate)")
+
+def stats(database: Database, args):
+    since = None
+    if args.days:
+        since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=args.days)).strftime("%Y-%m-%d %H:%M:%S")
+    summary = Telemetry.summary(database.telemetry(since=since, model=args.model, phase=args.phase))
+    if not summary:
+        print("No inference telemetry recorded")
+        return
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}"
 
+    columns = ["model", "phase", "calls", "errors", "cancelled", "queue p50/p95/p99", "ttft p50/p95/p99", "latency p50/p95/p99", "tokens in/cached/out", "cost"]
+    rows = [
+        [
+            entry["model"],
+            entry["phase"],
+            str(entry["calls"]),
+            str(entry["errors"]),
+            str(entry["cancelled"]),
+            *("/".join(seconds(v) for v in entry[metric].values()) for metric in ("queue_wait", "first_token", "latency")),
+            f"{entry['prompt_tokens']}/{entry['cached_tokens']}/{entry['completion_tokens']}",
+            f"${entry['cost']:.4f}",
+        ]
+        for entry in summary
+    ]
+    widths = [max(len(row[i]) for row in [columns, *rows]) for i in range(len(columns))]
+    for row in [columns, *rows]:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+    counters = database.counters(["failovers", "hedge_armed", "hedge_sent", "hedge_wins"])
+    if counters["failovers"]:
+        print(f"\nFailovers: {counters['failovers']} requests failed over to a fallback model")
+    if counters["hedge_armed"]:
+        rate = counters["hedge_sent"] / counters["hedge_armed"] * 100
+        wins = (counters["hedge_wins"] / counters["hedge_sent"] * 100) if counters["hedge_sent"] else 0.0
+        print(
+            f"Hedging: {counters['hedge_sent']} of {counters['hedge_armed']} requests hedged ({rate:.1f}% hedge rate), "
+            f"hedge responded first in {counters['hedge_wins']} ({wins:.1f}%)"
+        )
 
 
 if __name__ == "__main__":
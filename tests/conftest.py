@@ -0,0 +1,132 @@
+import argparse
+import contextlib
+import io
+import os
+
+import pytest
+import yaml
+
+from smah.database import Database, Migration
+from smah.settings import Settings
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False, help="run wall clock benchmark comparisons")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: wall clock comparison, skipped unless --benchmark is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark: run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def database(tmp_path) -> Database:
+    """
+    A migrated sqlite smah database in a temporary directory.
+    """
+    db = Database(argparse.Namespace(database=str(tmp_path / "smah.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        Migration.migrate(db, argparse.Namespace(to=None, count=None, reset_checksums=False))
+    return db
+
+
+@pytest.fixture
+def settings(tmp_path) -> Settings:
+    """
+    Settings using the default inference catalog and a fixed operator/system.
+    """
+    defaults = os.path.join(os.path.dirname(__file__), "..", "smah", "settings", "inference", "inference_defaults.yaml")
+    with open(defaults) as file:
+        inference = yaml.safe_load(file)
+    config = tmp_path / "config.yaml"
+    config.write_text(yaml.dump({
+        "vsn": "0.0.1",
+        "user": {
+            "vsn": "0.0.1",
+            "name": "Test Operator",
+            "system_admin_experience": "Intermediate",
+            "role": "Administrator",
+            "about": "Prefers concise answers."
+        },
+        "system": {
+            "vsn": "0.0.1",
+            "operating_system": {"type": "Linux", "name": "posix", "version": "1", "release": "6.0", "vsn": "0.0.1"}
+        },
+        "inference": inference
+    }))
+    return Settings(config=str(config))
+
+@pytest.fixture
+def fake_settings(tmp_path) -> Settings:
+    """
+    Settings with only the in-process fake provider configured.
+    """
+    config = tmp_path / "fake-config.yaml"
+    config.write_text(yaml.dump({
+        "vsn": "0.0.1",
+        "user": {"vsn": "0.0.1", "name": "Test Operator", "system_admin_experience": "Intermediate", "role": "Administrator"},
+        "system": {
+            "vsn": "0.0.1",
+            "operating_system": {"type": "Linux", "name": "posix", "version": "1", "release": "6.0", "vsn": "0.0.1"}
+        },
+        "inference": {
+            "vsn": "0.0.1",
+            "model_picker": {"default": ["fake.fake"]},
+            "providers": {
+                "fake": {
+                    "name": "Fake",
+                    "enabled": True,
+                    "settings": {
+                        "responses": [
+                            {"match": "disk usage", "content": "Use `du -sh *` to list directory sizes."}
+                        ]
+                    },
+                    "models": [
+                        {"name": "fake", "model": "fake", "enabled": True, "context": {"window": 16384, "out": 1024}}
+                    ]
+                }
+            }
+        }
+    }))
+    return Settings(config=str(config))
+
+
+@pytest.fixture
+def runner_args(tmp_path):
+    """
+    Factory for runner arguments using the temporary database.
+    """
+    def factory(**kwargs) -> argparse.Namespace:
+        defaults = {
+            'database': str(tmp_path / "smah.db"),
+            'plan_cache': True,
+            'local_planner': False,
+            'completion_cache': True,
+            'replay': False,
+            'stream': True,
+            'verbose': 0,
+            'rich': True,
+            'model': None,
+            'model_picker': None,
+            'model_query': None,
+            'model_pipe': None,
+            'model_interactive': None,
+            'model_review': None,
+            'model_edit': None,
+            'pipe_concurrency': 4,
+            'pipe_chunk_tokens': None,
+            'openai_api_tier': None,
+            'openai_api_key': None,
+            'openai_api_org': None,
+        }
+        defaults.update(kwargs)
+        return argparse.Namespace(**defaults)
+    return factory
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from openai import NOT_GIVEN
+
+from smah.runner import ClientPool, Runner
+from smah.runner.async_runner import AsyncRunner
+from smah.runner.backends import Backend, OpenAIBackend, OpenAICompatibleBackend
+from smah.settings.inference import Inference
+from smah.settings.inference.provider import Provider
+
+
+def local_provider(**settings) -> dict:
+    return {
+        "name": "Local",
+        "enabled": True,
+        "settings": {"base_url": "http://127.0.0.1:9/v1", "connect_timeout": 0.5, "retries": 0, **settings},
+        "models": [{"name": "local", "model": "local", "enabled": True, "context": {"window": 16384, "out": 1024}}]
+    }
+
+
+@pytest.fixture
+def failover_settings(fake_settings):
+    """
+    An unreachable openai compatible provider preferred over the fake provider.
+    """
+    inference = fake_settings.inference
+    fake = inference.to_yaml({'save': True})["providers"]["fake"]
+    fake_settings.inference = Inference({
+        "model_picker": {"default": ["local.local", "fake.fake"]},
+        "providers": {"local": local_provider(), "fake": fake}
+    })
+    return fake_settings
+
+
+def test_resolve():
+    assert isinstance(Backend.resolve(Provider("openai", {"name": "OpenAI"})), OpenAIBackend)
+    assert isinstance(Backend.resolve(Provider("fake", {"name": "Fake"})), OpenAIBackend)
+    assert isinstance(Backend.resolve(Provider("local", local_provider())), OpenAICompatibleBackend)
+    assert isinstance(Backend.resolve(Provider("vllm", {"settings": {"backend": "openai-compatible"}})), OpenAICompatibleBackend)
+    assert Backend.resolve(Provider("anthropic", {"name": "Anthropic"})) is None
+
+
+def test_incomplete_backend():
+    class Incomplete(Backend):
+        def client(self, args):
+            return None
+
+    with pytest.raises(TypeError, match="async_client"):
+        Backend.register("incomplete", Incomplete)
+    with pytest.raises(TypeError):
+        Incomplete(Provider("incomplete", {"name": "Incomplete"}))
+    assert "incomplete" not in Backend.registry
+
+
+def test_openai_compatible_request():
+    backend = Backend.resolve(Provider("local", local_provider(json_schema=False, stream_usage=False)))
+    request = backend.request({
+        'model': "local",
+        'max_completion_tokens': 128,
+        'max_tokens': NOT_GIVEN,
+        'response_format': {"type": "json_schema", "json_schema": {"name": "plan"}}
+    })
+    assert request["max_tokens"] == 128 and request["max_completion_tokens"] is NOT_GIVEN
+    assert request["response_format"] == {"type": "json_object"}
+    assert backend.stream_options() is NOT_GIVEN
+
+
+def test_failover(database, failover_settings, runner_args):
+    runner = Runner(runner_args(completion_cache=False), failover_settings)
+    try:
+        local = failover_settings.inference.models["local.local"]
+        assert [f"{m.provider}.{m.name}" for m in runner.inference_models("query")] == ["local.local", "fake.fake"]
+        fallbacks = runner.fallback_models(local, "query")
+        thread = runner.query_thread("How do I check disk usage?", {"include_settings": False, "instructions": "None"})
+        response = runner.run(local, thread, fallbacks=fallbacks)
+        assert "du -sh" in response.choices[0].message.content
+        assert "du -sh" in "".join(runner.stream(local, thread, fallbacks=fallbacks))
+    finally:
+        ClientPool.close()
+
+    rows = database.telemetry()
+    assert [(row["model"], row["status"]) for row in rows] == [
+        ("local.local", "APIConnectionError"), ("fake.fake", "ok"),
+        ("local.local", "APIConnectionError"), ("fake.fake", "ok"),
+    ]
+    assert database.counters([Runner.FAILOVERS]) == {Runner.FAILOVERS: 2}
+
+
+def test_async_failover(database, failover_settings, runner_args):
+    runner = AsyncRunner(runner_args(), failover_settings)
+
+    async def complete():
+        local = failover_settings.inference.models["local.local"]
+        thread = runner.query_thread("How do I check disk usage?", {"include_settings": False, "instructions": "None"})
+        return await runner.complete(local, thread, fallbacks=runner.fallback_models(local, "query"))
+
+    try:
+        assert "du -sh" in asyncio.run(complete())
+    finally:
+        ClientPool.close()
+
+
+def test_failover_disabled(database, failover_settings, runner_args):
+    failover_settings.inference.failover["enabled"] = False
+    runner = Runner(runner_args(), failover_settings)
+    local = failover_settings.inference.models["local.local"]
+    assert runner.fallback_models(local, "query") == []
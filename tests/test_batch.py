@@ -0,0 +1,60 @@
+import asyncio
+import io
+import json
+
+from smah.runner import AsyncRunner
+
+
+def test_batch(tmp_path, monkeypatch, database, settings, runner_args):
+    pipe = tmp_path / "input.log"
+    pipe.write_text("error: disk full\n")
+    jobs = io.StringIO("\n".join([
+        json.dumps({"id": "a", "query": "slow"}),
+        "# comment",
+        json.dumps({"id": "b", "query": "summarize", "pipe": str(pipe)}),
+        "not json",
+        json.dumps({"query": "fast"}),
+    ]))
+    state = {'active': 0, 'peak': 0}
+
+    async def session(query, pipe=None):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.05 if query == "slow" else 0.01)
+        state['active'] -= 1
+        content = f"{query}:{pipe or ''}"
+        return {
+            'title': query,
+            'plan': {'model': "openai.gpt-4o-mini"},
+            'messages': [{'role': "user", 'content': query}, {'role': "assistant", 'content': content}],
+            'pipe': pipe,
+            'content': content
+        }
+
+    async def query_session(self, query, system_settings=None, model=None, planner=None):
+        return await session(query)
+
+    async def pipe_session(self, query, pipe, system_settings=None, model=None, planner=None):
+        return await session(query, pipe)
+
+    async def system_settings(self, include_system=True):
+        return {'role': "user", 'content': "settings"}
+
+    monkeypatch.setattr(AsyncRunner, "query_session", query_session)
+    monkeypatch.setattr(AsyncRunner, "pipe_session", pipe_session)
+    monkeypatch.setattr(AsyncRunner, "system_settings", system_settings)
+
+    out = io.StringIO()
+    runner = AsyncRunner(runner_args(), settings)
+    counts = asyncio.run(runner.batch(jobs, out, concurrency=2))
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert counts == {'ok': 3, 'error': 1}
+    assert state['peak'] == 2
+    # completion order: the slow job finishes last
+    assert results[-1]['id'] == "a"
+    assert {r['id']: r.get('content') for r in results if r['status'] == "ok"} == {
+        "a": "slow:", "b": "summarize:error: disk full\n", 5: "fast:"
+    }
+    assert [r for r in results if r['status'] == "error"][0]['id'] == 4
+    assert len(database.history()) == 3
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from smah.runner.client_pool import ClientPool
+from smah.settings.inference.provider import Provider
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "test",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ack"}}]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_client_reuse():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        provider = Provider("openai", {
+            "name": "OpenAI",
+            "enabled": True,
+            "settings": {
+                "api_key": "test-pool",
+                "base_url": f"http://127.0.0.1:{server.server_port}/v1",
+                "pool_size": 2
+            }
+        })
+        args = argparse.Namespace(openai_api_key=None, openai_api_org=None)
+        client = ClientPool.client(provider, args)
+        for _ in range(3):
+            assert ClientPool.client(provider, args) is client
+            response = client.chat.completions.create(model="test", messages=[{"role": "user", "content": "hi"}])
+            assert response.choices[0].message.content == "ack"
+
+        stats = ClientPool.stats[ClientPool.key(provider, ClientPool.credentials(provider, args), "sync")].to_yaml()
+        assert stats['requests'] == 3
+        assert stats['connections'] == 1
+        assert stats['reused'] == 2
+    finally:
+        ClientPool.close()
+        server.shutdown()
+
+
+def test_async_clients_per_loop():
+    provider = Provider("fake", {"name": "Fake", "enabled": True, "settings": {}})
+    args = argparse.Namespace(openai_api_key=None, openai_api_org=None)
+
+    async def lookup(close: bool):
+        client = ClientPool.async_client(provider, args)
+        assert ClientPool.async_client(provider, args) is client
+        if close:
+            await ClientPool.aclose()
+        return client
+
+    try:
+        closed = asyncio.run(lookup(True))
+        assert closed.is_closed() and not ClientPool.clients
+        # a client left on an ended loop is not reused on the next one, and is dropped
+        left = asyncio.run(lookup(False))
+        assert asyncio.run(lookup(True)) is not left
+        assert not ClientPool.clients
+    finally:
+        ClientPool.close()
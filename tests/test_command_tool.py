@@ -0,0 +1,108 @@
+import json
+import time
+from types import SimpleNamespace
+
+from smah.runner import ClientPool, Runner
+from smah.runner.command_tool import CommandTool
+
+
+def call(command: str, index: int = 0):
+    arguments = json.dumps({"command": command, "title": command, "purpose": "test"})
+    return SimpleNamespace(id=f"call-{index}", function=SimpleNamespace(name="run_command", arguments=arguments))
+
+
+def test_refusal(fake_settings):
+    tool = CommandTool(fake_settings)
+    for command in ("df -h", "ps aux | grep python | head -n 5", "systemctl status nginx", "grep -E 'a|b;c' /var/log/syslog", "find /var/log -name '*.log'"):
+        assert tool.refusal(command) is None, command
+    for command in (
+        "rm -rf /tmp/x", "df -h; rm -rf /", "ls && reboot", "cat /etc/hosts > /tmp/hosts", "echo $(id)", "cat `which ls`",
+        "find / -delete", "find . -exec rm {} +", "systemctl restart nginx", "sort -o /etc/passwd x", "echo $HOME", "",
+    ):
+        assert tool.refusal(command) is not None, command
+
+
+def test_refusal_option_forms(fake_settings):
+    tool = CommandTool(fake_settings)
+    for command in ("sort -rn in.txt", "git log --oneline -n 5", "journalctl -u nginx --since today -n 50", "dmesg -T", "ss -tulpn"):
+        assert tool.refusal(command) is None, command
+    for command in (
+        # clustered short options and abbreviated or valued long options
+        "sort -uo /tmp/pwn in.txt", "sort --outp=/tmp/pwn in.txt", "sort --output /tmp/pwn in.txt",
+        "git diff --out=/tmp/pwn", "git log --o=/tmp/pwn", "dmesg -rC", "dmesg --console-off", "ss -tK", "ss --ki",
+        "journalctl --vacuum-size=1M", "journalctl -fu nginx", "find . -execdir rm {} +", "find . -fprintf /tmp/pwn %p",
+        "ps aux | sort -o /tmp/pwn",
+    ):
+        assert tool.refusal(command) is not None, command
+
+
+def test_execute_without_shell(fake_settings, tmp_path):
+    (tmp_path / "a.txt").write_text("one\ntwo\n")
+    fake_settings.inference.tools["allow"] = ["smah-missing-command"]
+    tool = CommandTool(fake_settings)
+    result = tool.execute(f"cat {tmp_path}/a.txt | wc -l")
+    assert result['status'] == "exit 0" and result['output'].strip() == "2"
+    # words are run as validated: no globbing or brace expansion
+    assert tool.execute(f"ls {tmp_path}/*.txt")['status'] != "exit 0"
+    assert tool.execute(f"ls {tmp_path}/{{a,b}}.txt")['status'] != "exit 0"
+    # stderr of every command in the pipeline is captured
+    result = tool.execute(f"ls {tmp_path}/missing | cat")
+    assert result['status'] == "exit 0" and "missing" in result['output']
+    result = tool.execute("smah-missing-command -h")
+    assert result['status'] == "exit 127" and "smah-missing-command" in result['output']
+
+
+def test_execute_output_limit(fake_settings):
+    fake_settings.inference.tools["max_output_tokens"] = 100
+    tool = CommandTool(fake_settings)
+    started = time.monotonic()
+    result = tool.execute("cat /dev/zero")
+    assert time.monotonic() - started < 5
+    assert result['status'] == f"truncated after {tool.max_output_bytes} bytes"
+    assert len(result['output']) == tool.max_output_bytes == 1600
+    assert tool.execute("cat /dev/zero | head -c 10")['status'] == "exit 0"
+
+
+def test_run(fake_settings):
+    fake_settings.inference.tools.update({"allow": ["sleep"], "timeout": 0.5})
+    tool = CommandTool(fake_settings)
+    started = time.monotonic()
+    results = tool.run([call("sleep 0.3", 0), call("sleep 0.3", 1), call("sleep 5", 2), call("reboot", 3)])
+    assert time.monotonic() - started < 1.5
+    assert [result['status'] for result in results] == ["exit 0", "exit 0", "timed out after 0.5s", "refused"]
+    assert [result['message']['tool_call_id'] for result in results] == ["call-0", "call-1", "call-2", "call-3"]
+    assert "not an approved read-only command" in results[3]['message']['content']
+
+
+def test_summarize(fake_settings):
+    fake_settings.inference.tools["max_output_tokens"] = 50
+    tool = CommandTool(fake_settings)
+    output = "\n".join(f"line {i}" for i in range(1000))
+    summary = tool.summarize(output)
+    assert summary.startswith("[output truncated: 1000 lines")
+    assert "line 0" in summary and "line 999" in summary and len(summary) < 400
+    assert tool.summarize("short") == "short"
+
+
+def test_tool_loop(database, fake_settings, runner_args):
+    fake_settings.inference.providers["fake"].settings["responses"] = [
+        {"match": "why is my machine slow", "tool_calls": [
+            {"command": "uptime", "title": "Load", "purpose": "Check load"},
+            {"command": "ps aux | head -n 3", "title": "Processes", "purpose": "Check processes"},
+            {"command": "kill -9 1", "title": "Kill", "purpose": "Not allowed"},
+        ]},
+        {"match": "why is my machine slow", "content": "Load average is normal."},
+    ]
+    runner = Runner(runner_args(tools=True), fake_settings)
+    model = fake_settings.inference.models["fake.fake"]
+    rounds = []
+    run = runner.command_tool.run
+    runner.command_tool.run = lambda calls: rounds.append(run(calls)) or rounds[-1]
+    try:
+        content = runner.tool_loop(model, "why is my machine slow?", {"include_settings": False, "instructions": "None"})
+    finally:
+        ClientPool.close()
+
+    assert content == "Load average is normal."
+    assert [[result['status'] for result in results] for results in rounds] == [["exit 0", "exit 0", "refused"]]
+    assert len(database.telemetry()) == 2
@@ -0,0 +1,63 @@
+import pytest
+
+from smah.runner import ClientPool, Runner
+from smah.runner.completion_cache import CompletionCache, ReplayMiss
+from smah.runner.prompts import Prompts
+
+
+def test_key(settings):
+    request = {'model': "gpt-4o-mini", 'messages': [{'role': "user", 'content': "hi"}], 'max_tokens': 10}
+    assert CompletionCache.key("openai", request) == CompletionCache.key("openai", dict(reversed(list(request.items()))))
+    assert CompletionCache.key("openai", request) != CompletionCache.key("openai", {**request, 'max_tokens': 11})
+    assert CompletionCache.key("openai", request) != CompletionCache.key("other", request)
+    # live system readings differ on every call and are left out of the key
+    stats = {'role': "user", 'content': Prompts.system_stats(settings)['content']}
+    assert CompletionCache.key("openai", {**request, 'messages': [stats, *request['messages']]}) == CompletionCache.key("openai", request)
+
+
+def test_size_bounded(database, settings):
+    cache = CompletionCache(database, settings, enabled=True)
+    completion = cache.streamed_completion("gpt-4o-mini", "x" * 1000)
+    size = len(completion.model_dump_json())
+    cache.max_bytes = size * 2
+    for i in range(3):
+        cache.put(f"key-{i}", "openai", "gpt-4o-mini", completion)
+    assert database.completion_cache_size() == (2, size * 2)
+    assert cache.get("key-0") is None
+    assert cache.get("key-2").choices[0].message.content == "x" * 1000
+    # key-2 was just used, so key-1 is the least recently used entry
+    cache.put("key-3", "openai", "gpt-4o-mini", completion)
+    assert cache.get("key-1") is None and cache.get("key-2") is not None
+
+
+def test_replay(database, settings, runner_args):
+    record = Runner(runner_args(), settings)
+    model = settings.inference.models["openai.gpt-4o-mini"]
+    thread = [{'role': "user", 'content': "hi"}]
+    key = record.completion_cache.key(model.provider, record.completion_request(model, thread))
+    record.completion_cache.put(key, model.provider, model.model, record.completion_cache.streamed_completion(model.model, "hello"))
+
+    replay = Runner(runner_args(completion_cache=False, replay=True), settings)
+    assert replay.run(model, thread).choices[0].message.content == "hello"
+    assert "".join(replay.stream(model, thread)) == "hello"
+    with pytest.raises(ReplayMiss):
+        replay.run(model, [{'role': "user", 'content': "unrecorded"}])
+
+
+def test_hit_with_system_stats(database, fake_settings, runner_args, monkeypatch):
+    # readings are only refreshed when stale, make sure each run sees new ones
+    readings = iter([{'cpu': {'time': "2026-01-01 00:00:00", 'percent': 10.0}}, {'cpu': {'time': "2026-01-01 00:00:05", 'percent': 55.0}}])
+    monkeypatch.setattr(fake_settings.system, "readings", lambda: next(readings))
+    runner = Runner(runner_args(), fake_settings)
+    model = fake_settings.inference.models["fake.fake"]
+    plan = {"include_settings": True, "instructions": None}
+    try:
+        threads = []
+        for _ in range(2):
+            threads.append(runner.query_thread(runner.query_request("How do I check disk usage?", plan), plan))
+            assert runner.run(model, threads[-1]).choices[0].message.content == "Use `du -sh *` to list directory sizes."
+        stats = [[m for m in thread if Prompts.is_system_stats(m)] for thread in threads]
+        assert stats[0] and stats[1] and stats[0] != stats[1]
+        assert runner.completion_cache.stats()['hits'] == 1 and runner.completion_cache.stats()['misses'] == 1
+    finally:
+        ClientPool.close()
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from smah.runner.conditions import ConditionError, Conditions
+from smah.runner.response_parser import ResponseParser
+
+
+def test_evaluate():
+    namespace = {'os': "Linux", 'cores': 8, 'shell': "zsh", 'sudo': False, 'home': None}
+    for source, expected in (
+        ("os == 'Linux'", True),
+        ("os != 'Linux' or cores >= 8", True),
+        ("not sudo and 2 < cores <= 8", True),
+        ("shell in ('bash', 'zsh')", True),
+        ("shell not in ['bash', 'zsh']", False),
+        ("home is None", True),
+        ("cores > -1 and 'in' in 'Linux'", True),
+        ("cores < 4 and undefined", False),
+    ):
+        assert Conditions.evaluate(source, namespace) is expected, source
+
+
+def test_rejected():
+    for source in (
+        "__import__('os').system('id')", "os.name == 'posix'", "open('/etc/passwd')", "cores + 1 > 2",
+        "[c for c in 'abc']", "lambda: 1", "x[0] == 1", "f'{os}'", "os ==", "b'x' == b'x'", "cores @ 2",
+    ):
+        with pytest.raises(ConditionError):
+            Conditions.evaluate(source, {'os': "Linux", 'cores': 8, 'x': [1]})
+    with pytest.raises(ConditionError, match="undefined name `arch`"):
+        Conditions.evaluate("arch == 'arm64'", {})
+    with pytest.raises(ConditionError, match="cannot evaluate"):
+        Conditions.evaluate("cores < 'a'", {'cores': 8})
+
+
+def test_compile_cache():
+    assert Conditions.compile("apple == 5") is Conditions.compile("apple == 5")
+
+
+@pytest.mark.benchmark
+def test_compile_cache_benchmark():
+    source = "os == 'Linux' and cores >= 4 and shell in ('bash', 'zsh')"
+    namespace = {'os': "Linux", 'cores': 8, 'shell': "zsh"}
+    started = time.perf_counter()
+    for _ in range(2000):
+        eval(source, dict(namespace))
+    legacy = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(2000):
+        Conditions.evaluate(source, namespace)
+    current = time.perf_counter() - started
+    print(f"\nexec-if x2000: eval {legacy * 1000:.1f}ms, compiled {current * 1000:.1f}ms")
+    assert current < legacy
+
+
+def test_exec_if():
+    message = '<exec shell="sh" exec-if="__import__(\'os\').getpid()"><title>T</title><command>ls</command></exec>'
+    assert ResponseParser.extract_commands(message, {'conditions': {}}) == []
+    message = '<exec shell="sh" exec-if="os == \'Linux\'"><title>T</title><command>ls</command></exec>'
+    assert len(ResponseParser.extract_commands(message, {'conditions': {'os': "Linux"}})) == 1
+    assert ResponseParser.extract_commands(message, {'conditions': {'os': "Darwin"}}) == []
@@ -0,0 +1,46 @@
+from smah.runner.context_budget import ContextBudget, Section, Thread
+from smah.settings.inference.provider.model import Model
+
+
+def model(window: int, out: int = 0) -> Model:
+    return Model("openai", {"name": "test", "model": "test", "context": {"window": window, "out": out}})
+
+
+def message(content: str, role: str = "user") -> dict:
+    return {'role': role, 'content': content}
+
+
+def test_fits_unchanged():
+    thread = Thread([Section("request", [message("hello")], strategy="trim")])
+    budget = ContextBudget(model(1000, 100))
+    assert budget.window == 900
+    assert budget.fit(thread) == list(thread)
+    assert not budget.reduced()
+
+
+def test_reduce_by_priority():
+    history = [message(f"turn {i} " + "x" * 400, role="user" if i % 2 else "assistant") for i in range(20)]
+    thread = Thread([
+        Section("conventions", [message("c" * 400)]),
+        Section("settings", [message("s" * 2000)], priority=1, strategy="trim"),
+        Section("history", history, priority=0, strategy="summarize"),
+        Section("request", [message("what next?")], priority=2, strategy="trim"),
+    ])
+    budget = ContextBudget(model(2500, 500))
+    messages = budget.fit(thread)
+    assert ContextBudget.tokens(messages) <= 2000
+    assert messages[0]['content'] == "c" * 400
+    assert messages[-1]['content'] == "what next?"
+    assert "earlier messages omitted" in messages[2]['content']
+    # the most recent turns are retained
+    assert messages[-2] == history[-1]
+    assert budget.to_yaml()['sections']['history']['action'].startswith("summarized")
+
+
+def test_trim_keeps_head_and_tail():
+    content = "HEAD" + "x" * 8000 + "TAIL"
+    budget = ContextBudget(model(600, 0))
+    messages = budget.fit(Thread([Section("request", [message(content)], strategy="trim")]))
+    assert messages[0]['content'].startswith("HEAD") and messages[0]['content'].endswith("TAIL")
+    assert "tokens omitted" in messages[0]['content']
+    assert budget.total <= budget.window
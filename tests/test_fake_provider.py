@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from smah.runner import AsyncRunner, ClientPool, Runner
+from smah.runner.fake_provider import FakeProvider
+
+
+def test_query(database, fake_settings, runner_args):
+    runner = Runner(runner_args(rich=False), fake_settings)
+    try:
+        _, plan = runner.query_plan("How do I check disk usage?")
+        assert plan["model"] == "fake.fake"
+        model = fake_settings.inference.models[plan["model"]]
+        thread = runner.query_thread(runner.query_request("How do I check disk usage?", plan), plan)
+        assert runner.run(model, thread).choices[0].message.content == "Use `du -sh *` to list directory sizes."
+        assert "".join(runner.stream(model, thread)) == "Use `du -sh *` to list directory sizes."
+    finally:
+        ClientPool.close()
+
+
+def test_token_rate(database, fake_settings, runner_args):
+    provider = fake_settings.inference.providers["fake"]
+    provider.settings.update({"latency": 0.05, "tokens_per_second": 400, "default_tokens": 40})
+    runner = Runner(runner_args(), fake_settings)
+    try:
+        model = fake_settings.inference.models["fake.fake"]
+        started = time.monotonic()
+        deltas = list(runner.stream(model, [{'role': "user", 'content': "anything"}]))
+        elapsed = time.monotonic() - started
+        assert "".join(deltas) == FakeProvider.filler(40)
+        assert len(deltas) == 40
+        assert 0.15 <= elapsed < 1.0
+    finally:
+        ClientPool.close()
+
+
+def test_async(database, fake_settings, runner_args):
+    runner = AsyncRunner(runner_args(), fake_settings)
+    # everything but the database executor comes from Runner.__init__
+    assert runner.hedger and runner.command_tool and runner.session_compactor
+
+    async def query():
+        try:
+            return await runner.query("How do I check disk usage?")
+        finally:
+            await runner.close()
+
+    content = asyncio.run(query())
+    assert content == "Use `du -sh *` to list directory sizes."
+    assert not ClientPool.clients
+    assert database.history()[0]['title'] == "fake title"
+    # completions are recorded as Runner records them
+    assert {row['phase'] for row in database.telemetry()} == {"plan", "query"}
+    assert database.counters(["prompt_tokens"])["prompt_tokens"] > 0
+
+
+def test_prompt_cache(database, fake_settings, runner_args):
+    fake_settings.inference.providers["fake"].settings["prompt_cache_min_tokens"] = 256
+    runner = Runner(runner_args(), fake_settings)
+    try:
+        plan = {"model": "fake.fake", "include_settings": True, "instructions": None}
+        model = fake_settings.inference.models["fake.fake"]
+        first = runner.query_thread("How do I check disk usage?", plan)
+        second = runner.query_thread("How do I list open ports?", plan)
+        stable = sum(len(s.messages) for s in first.sections[:[s.name for s in first.sections].index("stats")])
+        assert first[:stable] == second[:stable]
+        assert first[stable:] != second[stable:]
+        runner.run(model, first)
+        runner.run(model, second)
+        counters = database.counters(["prompt_tokens", "cached_prompt_tokens"])
+        assert 0 < counters["cached_prompt_tokens"] < counters["prompt_tokens"]
+    finally:
+        ClientPool.close()
+
+
+def test_map_reduce_skips_failed_part(database, fake_settings, runner_args, monkeypatch):
+    fake_settings.inference.providers["fake"].settings["default_tokens"] = 5
+    runner = Runner(runner_args(pipe_concurrency=2), fake_settings)
+    model = fake_settings.inference.models["fake.fake"]
+    plan = {"include_settings": False, "instructions": "Count the lines"}
+    run = runner.run
+    reduced = []
+
+    def flaky(model, thread, **kwargs):
+        if "this is part 2." in thread[-1]['content']:
+            raise RuntimeError("provider unavailable")
+        return run(model, thread, **kwargs)
+
+    def stream(model, thread, **kwargs):
+        reduced.append(thread[-1]['content'])
+        yield "merged"
+
+    monkeypatch.setattr(runner, "run", flaky)
+    monkeypatch.setattr(runner, "stream", stream)
+    try:
+        lines = iter(f"line {i}\n" for i in range(300))
+        assert "".join(runner.map_reduce_pipe("Count the lines", lines, plan, model, None, 200)) == "merged"
+        assert "Part 2 of the input could not be processed" in reduced[0]
+        assert "PART 3 OF" in reduced[0]
+    finally:
+        ClientPool.close()
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from smah.runner import ClientPool, Runner
+from smah.runner.hedger import Hedger
+from smah.runner.telemetry import Telemetry
+from smah.settings.inference import Inference
+
+
+@pytest.fixture
+def hedge_settings(fake_settings):
+    """
+    A stalling fake backed provider preferred over the fake provider, with hedging enabled.
+    """
+    fake = fake_settings.inference.to_yaml({'save': True})["providers"]["fake"]
+    slow = {
+        **fake,
+        "name": "Slow",
+        "settings": {**fake["settings"], "backend": "fake", "latency": 2.0},
+        "models": [{"name": "slow", "model": "slow", "enabled": True, "context": {"window": 16384, "out": 1024}}]
+    }
+    fake_settings.inference = Inference({
+        "model_picker": {"default": ["slow.slow", "fake.fake"]},
+        "hedging": {"enabled": True, "min_samples": 5, "min_delay": 0.05},
+        "providers": {"slow": slow, "fake": fake}
+    })
+    return fake_settings
+
+
+def seed(database, provider: str, model: str, first_tokens: list[float]):
+    for first_token in first_tokens:
+        database.telemetry_record({
+            'provider': provider, 'model': model, 'phase': "query", 'streamed': True, 'status': "ok",
+            'queue_wait': 0.0, 'first_token': first_token, 'latency': first_token + 0.1,
+        })
+
+
+def test_delay(database, hedge_settings):
+    hedger = Hedger(database, hedge_settings)
+    slow = hedge_settings.inference.models["slow.slow"]
+    fake = hedge_settings.inference.models["fake.fake"]
+    seed(database, "slow", "slow", [0.1] * 4)
+    assert hedger.delay(slow, "query") is None
+    seed(database, "fake", "fake", [0.01, 0.2, 0.2, 0.3, 0.4, 1.0])
+    assert hedger.delay(fake, "query") == 1.0
+    assert hedger.delay(fake, "pipe") is None
+    assert hedger.target(slow, [fake]) is fake
+    assert Hedger(database, hedge_settings, enabled=False).delay(fake, "query") is None
+
+
+def test_hedged_stream(database, hedge_settings, runner_args):
+    seed(database, "slow", "slow", [0.1] * 5)
+    runner = Runner(runner_args(completion_cache=False), hedge_settings)
+    slow = hedge_settings.inference.models["slow.slow"]
+    thread = runner.query_thread("How do I check disk usage?", {"include_settings": False, "instructions": "None"})
+    try:
+        started = time.monotonic()
+        content = "".join(runner.stream(slow, thread, fallbacks=runner.fallback_models(slow, "query")))
+        elapsed = time.monotonic() - started
+    finally:
+        ClientPool.close()
+
+    assert "du -sh" in content
+    assert elapsed < 1.0
+    assert database.counters([Hedger.ARMED, Hedger.HEDGED, Hedger.WINS]) == {Hedger.ARMED: 1, Hedger.HEDGED: 1, Hedger.WINS: 1}
+
+    # the stalled request stops at its first chunk and is recorded as cancelled.
+    deadline = time.monotonic() + 5
+    while len(database.telemetry()) < 7 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    rows = database.telemetry()[5:]
+    assert sorted((row["model"], row["status"]) for row in rows) == [("fake.fake", "ok"), ("slow.slow", Telemetry.CANCELLED)]
+    summary = {entry["model"]: entry for entry in Telemetry.summary(rows)}
+    assert summary["slow.slow"]["cancelled"] == 1 and summary["slow.slow"]["errors"] == 0
@@ -0,0 +1,26 @@
+from smah.runner import ClientPool, Runner
+
+
+def test_interactive(database, fake_settings, runner_args):
+    runner = Runner(runner_args(rich=False), fake_settings)
+    messages = iter(["How do I check disk usage?", "and for one directory?", "exit"])
+    runner.interactive_prompt = lambda: lambda: next(messages)
+    try:
+        session_id = runner.interactive()
+    finally:
+        ClientPool.close()
+
+    session = database.session(session_id)
+    assert session['title'] == "How do I check disk usage"
+    assert session['plan']['model'] == "fake.fake"
+    assert [message['role'] for message in session['messages']] == ["user", "assistant", "user", "assistant"]
+    assert session['messages'][1]['content'] == "Use `du -sh *` to list directory sizes."
+    # one request per turn, no planner round trip
+    assert [row["phase"] for row in database.telemetry()] == ["interactive", "interactive"]
+
+
+def test_interactive_exit(database, fake_settings, runner_args):
+    runner = Runner(runner_args(rich=False), fake_settings)
+    runner.interactive_prompt = lambda: lambda: None
+    assert runner.interactive() is None
+    assert database.history() == []
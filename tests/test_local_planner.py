@@ -0,0 +1,43 @@
+from smah.runner import ClientPool, Runner
+from smah.runner.local_planner import LocalPlanner
+
+
+def test_plan(database, settings):
+    planner = LocalPlanner(database, settings)
+    confidence, plan = planner.plan("query", "How do I check disk usage?")
+    assert confidence >= planner.min_confidence
+    assert plan["model"] == "openai.gpt-4o-mini"
+    assert plan["include_settings"] is True
+    assert set(plan) == {"title", "model", "reason", "include_settings", "include_settings_reason", "format_output",
+                         "format_output_reason", "instructions"}
+
+    _, plan = planner.plan("query", "Why does nginx return 502 intermittently and how should I diagnose the root cause?")
+    assert plan["model"] == "openai.gpt-4o"
+
+    _, plan = planner.plan("pipe", "count errors", "Oct 28 10:01:02 sshd[12]: error\n" * 10)
+    assert plan["format_output"] is False
+
+    confidence, _ = planner.plan("query", "hello")
+    assert confidence < planner.min_confidence
+
+
+def test_context_window(database, settings):
+    settings.inference.models["openai.gpt-4o-mini"].context = {"window": 4096, "out": 1024}
+    _, plan = LocalPlanner(database, settings).plan("pipe", "count errors", "error line\n" * 20000)
+    assert plan["model"] != "openai.gpt-4o-mini"
+
+
+def test_runner(database, fake_settings, runner_args):
+    fake_settings.inference.local_planner["min_confidence"] = 0.7
+    runner = Runner(runner_args(local_planner=True), fake_settings)
+    try:
+        _, plan = runner.query_plan("How do I check disk usage?")
+        assert plan["reason"].startswith("Local planner")
+        _, plan = runner.query_plan("hello")
+        assert plan["title"] == "fake title"
+    finally:
+        ClientPool.close()
+    assert database.counters([LocalPlanner.PLANS, LocalPlanner.DEFERRED, LocalPlanner.AGREED]) == {
+        LocalPlanner.PLANS: 1, LocalPlanner.DEFERRED: 1, LocalPlanner.AGREED: 1
+    }
+    assert [row["phase"] for row in database.telemetry()] == ["plan"]
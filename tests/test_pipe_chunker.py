@@ -0,0 +1,79 @@
+import threading
+import time
+
+import io
+
+from smah.runner.pipe_chunker import PipeChunker
+from smah.runner.pipe_input import PipeInput
+from smah.runner.tokens import Tokens
+
+
+def test_chunks_within_budget():
+    pipe = "".join(f"line {i:05d} " + "x" * (i % 50) + "\n" for i in range(2000))
+    pipe += "y" * 1000 + "\n"
+    chunks = list(PipeChunker.chunks(pipe, 64))
+    assert "".join(chunks) == pipe
+    assert len(chunks) > 1
+    assert all(Tokens.estimate(chunk) <= 64 for chunk in chunks)
+
+
+def test_groups():
+    parts = ["a" * 40] * 5
+    groups = PipeChunker.groups(parts, 25)
+    assert [len(g) for g in groups] == [2, 2, 1]
+    assert sum(groups, []) == parts
+
+
+def test_bounded_map():
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+
+    def work(n):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.01 * (n % 3))
+        with lock:
+            state['active'] -= 1
+        return n * 2
+
+    assert PipeChunker.bounded_map(work, iter(range(12)), 3) == [n * 2 for n in range(12)]
+    assert 1 < state['peak'] <= 3
+
+
+class Reads(io.StringIO):
+    """
+    A stream recording the largest amount of input held unread by its consumer at once.
+    """
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.largest = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.largest = max(self.largest, len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = super().readline(size)
+        self.largest = max(self.largest, len(data))
+        return data
+
+
+def test_pipe_input():
+    pipe = "".join(f"line {i:05d} " + "x" * (i % 50) + "\n" for i in range(20000)) + "z" * 200000 + "\ntail"
+    stream = Reads(pipe)
+    source = PipeInput(stream)
+    assert source and source.preview() == pipe[:PipeInput.PREVIEW_CHARS]
+    assert not source.fill(100_000) and len(source.buffer) == 100_000
+    chunks = PipeChunker.chunks(source.lines(), 256)
+    first = next(chunks)
+    # only the buffer and the line being read are held, not the rest of the input
+    assert stream.tell() < 200_000 and len(first) <= 256 * 4
+    assert first + "".join(chunks) == pipe
+    assert stream.largest <= 100_000 and source.complete
+
+    short = PipeInput(io.StringIO("a\nb"))
+    assert short.preview() == "a\nb" and short.fill(10) and short.read() == "a\nb"
+    assert list(PipeInput.text("a\nb\n").lines()) == ["a\n", "b\n"]
+    assert not PipeInput(io.StringIO(""))
@@ -0,0 +1,50 @@
+import io
+import os
+import threading
+import time
+
+from smah.runner import ClientPool, Runner
+from smah.runner.pipe_follower import PipeFollower
+
+
+def test_windows_bounded_by_lines_and_chars():
+    stream = io.StringIO("".join(f"line {i}\n" for i in range(25)) + "x" * 100 + "\n")
+    windows = list(PipeFollower(stream, interval=60, max_lines=10, max_chars=64).windows())
+    assert all(len(w.splitlines()) <= 10 and len(w) <= 64 for w in windows)
+    assert "".join(windows).startswith("line 0\n")
+    assert windows[-1].endswith(PipeFollower.TRUNCATED)
+    assert "".join(windows[:-1]) == "".join(f"line {i}\n" for i in range(25))
+
+
+def test_windows_bounded_by_time():
+    read, write = os.pipe()
+
+    def produce():
+        with os.fdopen(write, "w") as out:
+            for i in range(3):
+                out.write(f"event {i}\n")
+                out.flush()
+                time.sleep(0.3)
+
+    threading.Thread(target=produce, daemon=True).start()
+    with os.fdopen(read) as stream:
+        windows = list(PipeFollower(stream, interval=0.1, max_lines=100).windows())
+    assert windows == ["event 0\n", "event 1\n", "event 2\n"]
+
+
+def test_follow_summary(database, fake_settings, runner_args):
+    fake_settings.inference.providers["fake"].settings["responses"] = [
+        {"match": "Condense them", "content": "disk errors on sda (windows 1-3)"},
+    ]
+    runner = Runner(runner_args(), fake_settings)
+    model = fake_settings.inference.models["fake.fake"]
+    try:
+        summary = runner.follow_summary(model, "watch the log", None, "disk error on sda\n", 0, [])
+        summary = runner.follow_summary(model, "watch the log", summary, "fan speed high\n", 1, [])
+        # earlier findings are carried forward, not replaced by the latest window
+        assert "--- Window 1" in summary and "disk error on sda" in summary and "fan speed high" in summary
+        summary = runner.follow_summary(model, "watch the log", summary, "noise " * 4000, 2, [])
+    finally:
+        ClientPool.close()
+    assert summary == "disk errors on sda (windows 1-3)"
+    assert [row["phase"] for row in database.telemetry()] == ["compact"]
@@ -0,0 +1,73 @@
+import time
+
+from smah.runner.plan_cache import PlanCache
+
+
+def plan(model: str = "openai.gpt-4o-mini") -> dict:
+    return {
+        "title": "List Files",
+        "model": model,
+        "reason": "simple",
+        "include_settings": True,
+        "include_settings_reason": "shell",
+        "format_output": True,
+        "format_output_reason": "markdown",
+        "instructions": "None"
+    }
+
+
+def test_key_normalization(database, settings):
+    cache = PlanCache(database, settings)
+    assert cache.key("query", "List  files\n") == cache.key("query", "list files")
+    assert cache.key("query", "list files") != cache.key("pipe", "list files")
+    # pipe shape not content
+    a = cache.key("pipe", "count", pipe="Oct 28 10:01:02 sshd[12]: ok\n")
+    b = cache.key("pipe", "count", pipe="Nov 01 23:59:59 sshd[99]: ok\n")
+    c = cache.key("pipe", "count", pipe='{"level": "info"}\n')
+    assert a == b
+    assert a != c
+
+
+def test_settings_invalidate(database, settings):
+    key = PlanCache(database, settings).key("query", "list files")
+    settings.user.about = "Prefers detailed answers."
+    assert PlanCache(database, settings).key("query", "list files") != key
+
+
+def test_hit_miss_and_eviction(database, settings):
+    settings.inference.plan_cache["max_entries"] = 2
+    cache = PlanCache(database, settings)
+    keys = [cache.key("query", f"request {i}") for i in range(3)]
+    assert cache.get(keys[0]) is None
+    for key in keys:
+        cache.put(key, "query", plan())
+        time.sleep(0.002)
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == plan()
+    assert cache.stats() == {'entries': 2, 'hits': 1, 'misses': 2}
+    # within the same millisecond the least recently used entry is still the one evicted
+    keys = [cache.key("query", f"burst {i}") for i in range(3)]
+    cache.put(keys[0], "query", plan())
+    cache.put(keys[1], "query", plan())
+    cache.get(keys[0])
+    cache.put(keys[2], "query", plan())
+    assert cache.get(keys[0]) == plan() and cache.get(keys[1]) is None
+
+
+def test_ttl_and_catalog(database, settings):
+    cache = PlanCache(database, settings)
+    key = cache.key("query", "list files")
+    cache.put(key, "query", plan(model="openai.o1"))
+    # disabled models are not served from cache
+    assert cache.get(key) is None
+    cache.put(key, "query", plan())
+    cache.ttl = 0
+    assert cache.get(key) is None
+
+
+def test_disabled(database, settings):
+    cache = PlanCache(database, settings, enabled=False)
+    key = cache.key("query", "list files")
+    cache.put(key, "query", plan())
+    assert cache.get(key) is None
+    assert database.plan_cache_size() == 0
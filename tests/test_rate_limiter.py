@@ -0,0 +1,86 @@
+import argparse
+import sqlite3
+
+import httpx
+import openai
+import pytest
+
+from smah.database import Database
+from smah.runner.rate_limiter import RateLimiter
+from smah.settings.inference.provider import Provider
+from smah.settings.inference.provider.model import Model
+
+MODEL = Model("openai", {"name": "gpt-4o", "model": "gpt-4o", "context": {"window": 128000, "out": 4096}})
+
+
+def limiter(db: Database, tier=None, **settings) -> RateLimiter:
+    provider = Provider("openai", {"name": "OpenAI", "enabled": True, "settings": settings})
+    return RateLimiter(db, provider, argparse.Namespace(openai_api_tier=tier))
+
+
+def rate_limit_error(headers: dict) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, headers=headers, request=request), body=None)
+
+
+def test_tier_limits():
+    assert RateLimiter.tier_limits("gpt-4o-mini-2024-07-18", 1) == (500, 200_000)
+    assert RateLimiter.tier_limits("gpt-4o", 9) == (10_000, 30_000_000)
+    assert limiter(None).limits(MODEL) is None
+    assert limiter(None, tier=2).limits(MODEL) == (5_000, 450_000)
+    assert limiter(None, tier=2, rate_limits={"gpt-4o": {"rpm": 3, "tpm": 100}}).limits(MODEL) == (3, 100)
+
+
+def test_shared_budget(tmp_path, database):
+    first = limiter(database, rate_limits={"gpt-4o": {"rpm": 2, "tpm": 1000}})
+    second = limiter(Database(argparse.Namespace(database=str(tmp_path / "smah.db"))), rate_limits={"gpt-4o": {"rpm": 2, "tpm": 1000}})
+    assert first.wait(MODEL, 100) == 0
+    assert second.wait(MODEL, 100) == 0
+    # the request bucket is shared and exhausted: ~30s until the next request slot
+    assert second.wait(MODEL, 100) == pytest.approx(30, abs=1)
+    assert first.wait(MODEL, 100) == pytest.approx(30, abs=1)
+
+
+def test_locked_database(tmp_path, database):
+    rate = limiter(database, rate_limits={"gpt-4o": {"rpm": 2, "tpm": 1000}})
+    database.connection.execute("PRAGMA busy_timeout = 10")
+    other = sqlite3.connect(str(tmp_path / "smah.db"), isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        # another process holds the write lock: wait and try again rather than switching the limiter off
+        assert rate.wait(MODEL, 100) == RateLimiter.LOCKED_RETRY
+        rate.adjust(MODEL, "tpm", 10)
+        assert rate.enabled
+    finally:
+        other.execute("ROLLBACK")
+    assert rate.wait(MODEL, 100) == 0
+
+    unmigrated = limiter(Database(argparse.Namespace(database=str(tmp_path / "unmigrated.db"))), rate_limits={"gpt-4o": {"rpm": 2, "tpm": 1000}})
+    assert unmigrated.wait(MODEL, 100) == 0 and not unmigrated.enabled
+
+
+def test_retry_after(monkeypatch, database):
+    delays = []
+    monkeypatch.setattr("smah.runner.rate_limiter.time.sleep", delays.append)
+    errors = [rate_limit_error({"retry-after-ms": "1500"}), rate_limit_error({"retry-after": "2"})]
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    rate = limiter(database, retries=3)
+    assert rate.call(MODEL, 10, request) == "ok"
+    assert 1.5 <= delays[0] <= 2.5 and 2 <= delays[1] <= 3
+
+    with pytest.raises(openai.RateLimitError):
+        limiter(database, retries=0).call(MODEL, 10, lambda: (_ for _ in ()).throw(rate_limit_error({})))
+
+
+def test_retry_after_dates(monkeypatch):
+    monkeypatch.setattr("smah.runner.rate_limiter.time.time", lambda: 784111767.0)
+    # an HTTP date is UTC even when it omits the zone
+    assert RateLimiter.retry_after(rate_limit_error({"retry-after": "Sun, 06 Nov 1994 08:49:47 GMT"})) == 20.0
+    assert RateLimiter.retry_after(rate_limit_error({"retry-after": "Sun, 06 Nov 1994 08:49:47"})) == 20.0
+    assert RateLimiter.retry_after(rate_limit_error({"retry-after": "garbage"})) is None
+    assert RateLimiter.retry_after(rate_limit_error({"retry-after": ""})) is None
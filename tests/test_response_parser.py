@@ -6,7 +6,7 @@ import rich
 from rich.markdown import Markdown
 
 from smah.console import std_console
-from smah.runner.response_parser import ResponseParser
+from smah.runner.response_parser import ResponseParser, StreamingResponseParser
 
 def sut(scenario: str = "default", options: Optional[dict] = None):
     if scenario == "cot":
@@ -179,4 +179,120 @@ def test_escape_response():
     escaped = ResponseParser.escape_response(message)
     assert escaped == "SECTION\n===\n<div><b>Some text</b> Hey :_smah_lt_: There</div>"
     m = ResponseParser.to_markdown(message)
-    assert m == "SECTION\n===\n<div><b>Some text</b> Hey < There</div>"
\ No newline at end of file
+    assert m == "SECTION\n===\n<div><b>Some text</b> Hey < There</div>"
+
+def stream(message: str, options: Optional[dict] = None) -> tuple[StreamingResponseParser, list[dict]]:
+    parser = StreamingResponseParser(options)
+    events = []
+    for c in message:
+        events.extend(parser.feed(c))
+    events.extend(parser.close())
+    return parser, events
+
+
+def test_streaming_parser():
+    for scenario in ("cot", "mixed", "indented"):
+        message = sut(scenario)
+        for strip_cot in (True, False):
+            parser, events = stream(message, {'strip-cot': strip_cot, 'conditions': {'apple': 5}})
+            assert parser.markdown == ResponseParser.to_markdown(message, {'strip-cot': strip_cot}), scenario
+            assert parser.commands == ResponseParser.extract_commands(message, {'conditions': {'apple': 5}})
+            text = "".join(event['text'] for event in events if event['type'] == "text")
+            assert "<" not in text and text.startswith("# Before") and text.endswith("# After\n...\n")
+
+    parser, events = stream(sut("mixed"), {'conditions': {'apple': 4}})
+    assert [event['type'] for event in events if event['type'] != "text"] == ["cot-start", "cot", "exec"]
+    assert next(event for event in events if event['type'] == "exec")['command'] is None and parser.commands == []
+
+
+def test_streaming_parser_partial():
+    parser = StreamingResponseParser({'strip-cot': False})
+    events = parser.feed('a < b & c <div>x</div> <cot type="thinking">half')
+    assert [event['type'] for event in events] == ["text", "cot-start"]
+    assert parser.markdown == "a < b & c <div>x</div> " and parser.pending == ""
+    events = parser.feed(' done</cot> <set-condition name="os"><prompt>OS?</prompt><choices><choice>linux</choice></choices></set-condition>')
+    assert [event['type'] for event in events] == ["cot", "text", "set-condition"]
+    assert events[0]['thought'] == "half done"
+    assert parser.conditions_set[0]['name'] == "os"
+    events = parser.feed("<exec shell='sh'><title>T</title><command>ls")
+    assert [event['type'] for event in events] == []
+    events = parser.close()
+    assert [event['type'] for event in events] == ["exec"]
+    assert parser.commands == [{'title': "T", 'purpose': "No Purpose Provided", 'command': "ls", 'shell': "sh"}]
+    assert parser.markdown.startswith("a < b & c <div>x</div> `Thinking: half done` ```sh")
+
+
+def test_parse():
+    message = sut("mixed")
+    parsed = ResponseParser.parse(message, {'conditions': {'apple': 5}})
+    root = parsed.root
+    assert parsed.markdown(False) == ResponseParser.to_markdown(message, {'strip-cot': False})
+    assert parsed.markdown() == ResponseParser.to_markdown(message)
+    assert parsed.markdown() is parsed.markdown(True)
+    assert list(parsed.commands) == ResponseParser.extract_commands(message, {'conditions': {'apple': 5}})
+    assert parsed.conditions == ()
+    assert [thought['thought'] for thought in parsed.thoughts] == ["I wonder if this is all there is"]
+    assert parsed.root is root and parsed.markdown(False) == ResponseParser.to_markdown(message, {'strip-cot': False})
+
+
+def test_exec_children():
+    parsed = ResponseParser.parse(
+        '<exec shell="sh"><title>Outer</title><command>ls</command><div><title>Inner</title><purpose>P</purpose></div></exec>'
+    )
+    elem = parsed.elements[0]
+    children = elem.extract_children()
+    assert children == {tag: elem.extract_child(tag) for tag in elem.CHILDREN}
+    assert children == {'title': "Outer", 'purpose': "P", 'command': "ls", 'prompt': None}
+    # nothing is stored on the element proxy
+    assert "_children" not in elem.__dict__
+    assert parsed.commands[0] == ResponseParser.command(elem)
+
+
+def test_streaming_parser_parity():
+    messages = [
+        "a > b <div>a > b &amp; c</div> & d",
+        "text\n<p>unclosed",
+        "text\n<cot>unclosed",
+        "before\n<cot>closed</cot>\n",
+        "a < b <1> <<>> </x> vector<int> <- c\n",
+        "<div>wrap\n  <exec shell='sh'><title>T</title><command>ls</command></exec> tail</div> after",
+        "<div><b>x</div> y <abc> z",
+        "<br/> <exec shell='sh'><title>T</title><command>ls",
+        sut("indented"),
+    ]
+    for message in messages:
+        for strip_cot in (True, False):
+            expected = ResponseParser.to_markdown(message, {'strip-cot': strip_cot})
+            for size in (1, 3, len(message) or 1):
+                parser = StreamingResponseParser({'strip-cot': strip_cot})
+                for i in range(0, len(message), size):
+                    parser.feed(message[i:i + size])
+                    # finished segments are final: the display only grows.
+                    assert (expected + "\n").startswith(parser.markdown), message
+                parser.close()
+                assert parser.markdown == expected and parser.pending == "", message
+
+
+def test_streaming_parser_pending():
+    parser = StreamingResponseParser()
+    parser.feed("hello <b>wor")
+    assert parser.markdown == "hello " and parser.pending == "<b>wor"
+    parser.feed("ld</b> and <exec shell='sh'><title>x")
+    assert parser.markdown == "hello <b>world</b> and " and parser.pending == ""
+    parser.feed("</title></exec> tail <ex")
+    assert parser.markdown == ResponseParser.to_markdown("hello <b>world</b> and <exec shell='sh'><title>x</title></exec>")
+    assert parser.pending == " tail "
+
+
+def test_empty_exec_children():
+    message = "<exec shell='sh'><title>t</title><purpose></purpose><command>ls</command></exec>\n<exec shell='sh'><title>u</title><purpose/><command>pwd</command></exec>"
+    expected = [
+        {'title': "t", 'purpose': "No Purpose Provided", 'command': "ls", 'shell': "sh"},
+        {'title': "u", 'purpose': "No Purpose Provided", 'command': "pwd", 'shell': "sh"},
+    ]
+    parsed = ResponseParser.parse(message)
+    assert list(parsed.commands) == expected
+    assert "ls" in parsed.markdown() and "pwd" in parsed.markdown()
+    parser, events = stream(message)
+    assert parser.commands == expected
+    assert parser.markdown == ResponseParser.to_markdown(message)
@@ -0,0 +1,215 @@
+import html
+import random
+import textwrap
+import time
+from typing import Callable, Optional
+
+import pytest
+from lxml import etree
+
+from smah.runner.response_parser import ExecTag, ResponseParser, SetConditionTag, SmahLookup, ThoughtTag, html_tags
+
+
+def legacy_escape_response(response: str) -> str:
+    """
+    The multi pass escaper ResponseParser.escape_response replaced (reference output).
+    """
+    response = response.replace("<", ":_smah_lt_:")
+    response = response.replace("&amp;", ":_smah_amp_amp_:")
+    response = response.replace("&", ":_smah_amp_:")
+    for tag in ResponseParser.SMAH_TAGS + html_tags:
+        response = response.replace(f":_smah_lt_:{tag}", f"<{tag}")
+        response = response.replace(f":_smah_lt_:/{tag}", f"</{tag}")
+    return response
+
+
+def legacy_unescape_response(response: Optional[str]) -> Optional[str]:
+    if response is None:
+        return None
+    response = response.replace(":_smah_lt_:", "<")
+    response = response.replace(":_smah_amp_amp_:", "&amp;")
+    return response.replace(":_smah_amp_:", "&")
+
+
+def legacy_replace_tag(elem, replace: Optional[str] = None, tail: Optional[str] = None):
+    """
+    The tree editing ResponseParser.replace_tag the single pass renderer replaced (reference output).
+    """
+    ps = elem.getprevious()
+    p = elem.getparent()
+    if ps is not None:
+        t = (ps.tail or "")
+        if replace:
+            t += textwrap.indent(replace, " " * len(t.split("\n")[-1])).lstrip()
+        ps.tail = t + (tail or "")
+    elif p is not None:
+        t = (p.text or "")
+        if replace:
+            t += textwrap.indent(replace, " " * len(t.split("\n")[-1])).lstrip()
+        p.text = t + (tail or "")
+    if p is not None:
+        p.remove(elem)
+
+
+def legacy_to_markdown(response: str, options: Optional[dict] = None) -> str:
+    options = options or {}
+    parser = etree.XMLPullParser(recover=True, encoding="utf-8")
+    parser.set_element_class_lookup(SmahLookup())
+    events = parser.read_events()
+    parser.feed("<smah-msg>\n" + ResponseParser.escape_response(response) + "\n</smah-msg>")
+    for action, elem in events:
+        if action == "end":
+            if isinstance(elem, ExecTag):
+                legacy_replace_tag(elem, replace=elem.markdown, tail=elem.tail)
+            elif isinstance(elem, SetConditionTag):
+                legacy_replace_tag(elem, replace=None, tail=elem.tail)
+            elif isinstance(elem, ThoughtTag):
+                legacy_replace_tag(elem, replace=(None if options.get("strip-cot", True) else elem.markdown), tail=elem.tail)
+    root = parser.close()
+    response = ResponseParser.unescape_response(etree.tostring(root, pretty_print=True).decode())
+    return response[len("<smah-msg>\n"):-(len("\n</smah-msg>") + 1)]
+
+
+def legacy_child(elem, tag: str) -> Optional[str]:
+    """
+    The cssselect lookup TagBase.extract_child replaced (reference output).
+    """
+    child = elem.cssselect(tag)
+    if len(child) > 0:
+        return ResponseParser.unescape_response(child[0].text.strip())
+    return None
+
+
+def legacy_exec(elem) -> tuple:
+    """
+    An exec tag's command and markdown as read through cssselect (markdown reads title and command again).
+    """
+    command = {
+        'title': legacy_child(elem, "title") or "Run Command",
+        'purpose': legacy_child(elem, "purpose") or "No Purpose Provided",
+        'command': legacy_child(elem, "command"),
+        'shell': elem.get("shell"),
+    }
+    markdown = f"```{elem.get('shell')}\n{textwrap.indent(legacy_child(elem, 'title') or 'Run Command', '# ')}\n\n{legacy_child(elem, 'command') or ''}\n```"
+    return command, markdown
+
+
+def current_exec(elem) -> tuple:
+    """
+    An exec tag's command and markdown from one extraction of its children (as ParsedResponse reads them).
+    """
+    children = elem.extract_children()
+    return ResponseParser.command(elem, children=children), elem.render_markdown(children)
+
+
+def response(size: int, seed: int = 7, stray: bool = True) -> str:
+    """
+    A synthetic model response of about size characters mixing markdown, cot/exec tags, html and stray markup
+    (left out unless stray, as unclosed tags like `<int>` nest the rest of the response).
+    """
+    rng = random.Random(seed)
+    blocks = [
+        "## Findings\nThe load average is `1.2 < 4` cores & memory is fine &amp; stable.\n",
+        '<cot type="thinking">Check whether a < b && c > d before proceeding.</cot>\n',
+        textwrap.dedent(
+            """\
+            <exec shell="bash" exec-if="os == 'Linux'">
+            <title>Disk usage</title>
+            <purpose>Find large directories</purpose>
+            <command>
+            du -sh /var/* 2>&1 | sort -h | tail -n 5
+            </command>
+            </exec>
+            """
+        ),
+        "<div><b>bold</b> <span>text</span> <br/> <abc> <1> </x> <<>></div>\n",
+        "Compare `vector<int>` with `std::map<K, V>` and a <- b in R; a :_smah_lt_ marker-like string.\n",
+        "Plain prose " * 12 + "\n",
+    ]
+    if not stray:
+        blocks = [block for block in blocks if "<int>" not in block and "<abc>" not in block]
+    parts = []
+    total = 0
+    while total < size:
+        block = rng.choice(blocks)
+        parts.append(block)
+        total += len(block)
+    return "".join(parts)
+
+
+def best(fn: Callable, *args, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def test_escape_matches_legacy():
+    text = response(200_000)
+    for tag in ResponseParser.SMAH_TAGS + html_tags:
+        text += f"<{tag}> </{tag}x> <{tag[:-1]} <{tag.upper()}> "
+    escaped = ResponseParser.escape_response(text)
+    assert escaped == legacy_escape_response(text)
+    assert ResponseParser.unescape_response(escaped) == legacy_unescape_response(escaped) == text
+
+
+@pytest.mark.benchmark
+def test_escape_benchmark():
+    text = response(4 * 1024 * 1024)
+    legacy = best(legacy_escape_response, text)
+    current = best(ResponseParser.escape_response, text)
+    escaped = ResponseParser.escape_response(text)
+    legacy_unescape = best(legacy_unescape_response, escaped)
+    current_unescape = best(ResponseParser.unescape_response, escaped)
+    print(
+        f"\nescape 4MB: legacy {legacy * 1000:.1f}ms, single pass {current * 1000:.1f}ms ({legacy / current:.1f}x)"
+        f"\nunescape 4MB: legacy {legacy_unescape * 1000:.1f}ms, current {current_unescape * 1000:.1f}ms"
+    )
+    assert current * 2 < legacy
+
+
+def exec_plan(count: int = 60) -> str:
+    return "## Plan\n" + "".join(
+        f'<exec shell="bash"><title>Step {i}</title><purpose>Check {i}</purpose><command>ls -la /var/{i}</command></exec>\n'
+        for i in range(count)
+    )
+
+
+def exec_elements(text: str) -> list:
+    return [elem for elem in ResponseParser.parse(text).elements if isinstance(elem, ExecTag)]
+
+
+def test_exec_child_lookup_matches_legacy():
+    text = exec_plan()
+    assert [legacy_exec(elem) for elem in exec_elements(text)] == [current_exec(elem) for elem in exec_elements(text)]
+
+
+@pytest.mark.benchmark
+def test_exec_child_lookup_benchmark():
+    text = exec_plan()
+    trees = [exec_elements(text) for _ in range(6)]
+    legacy = best(lambda: [legacy_exec(elem) for elem in trees.pop()])
+    current = best(lambda: [current_exec(elem) for elem in trees.pop()])
+    print(f"\nexec child lookups x60: cssselect {legacy * 1000:.2f}ms, compiled {current * 1000:.2f}ms ({legacy / current:.1f}x)")
+    assert current * 2 < legacy
+
+
+def test_to_markdown_matches_legacy():
+    # the tree serializer escaped text (`>`, and `&` inside rendered exec blocks), the single pass renderer does not.
+    text = response(200_000, stray=False)
+    for strip_cot in (True, False):
+        options = {'strip-cot': strip_cot}
+        assert html.unescape(ResponseParser.to_markdown(text, options)) == html.unescape(legacy_to_markdown(text, options))
+
+
+@pytest.mark.benchmark
+def test_to_markdown_benchmark():
+    thoughts = "".join(f'- step {i}\n  <cot type="thinking">considering option {i}</cot> then\n' for i in range(4_000))
+    text = (thoughts + response(1024 * 1024 - len(thoughts), stray=False))[:1024 * 1024]
+    text = text[:text.rfind("\n") + 1]
+    legacy = best(legacy_to_markdown, text, {'strip-cot': False}, repeat=1)
+    current = best(ResponseParser.to_markdown, text, {'strip-cot': False}, repeat=1)
+    print(f"\nto_markdown 1MB: tree edits {legacy * 1000:.1f}ms, single pass {current * 1000:.1f}ms ({legacy / current:.1f}x)")
+    assert current * 2 < legacy
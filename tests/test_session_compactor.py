@@ -0,0 +1,48 @@
+from smah.runner import ClientPool, Runner
+from smah.runner.context_budget import ContextBudget
+from smah.runner.session_compactor import SessionCompactor
+
+
+def turn(index: int, size: int = 200) -> list:
+    return [
+        {'role': "user", 'content': f"question {index} " + "detail " * size},
+        {'role': "assistant", 'content': f"answer {index} " + "detail " * size},
+    ]
+
+
+def test_split():
+    messages = list(enumerate(turn(0) + turn(1) + turn(2), start=1))
+    older, tail = SessionCompactor.split(messages, ContextBudget.tokens([m for _, m in messages[-4:]]))
+    assert [id for id, _ in older] == [1, 2]
+    assert [id for id, _ in tail] == [3, 4, 5, 6]
+    older, tail = SessionCompactor.split(messages, 0)
+    assert [id for id, _ in tail] == [5, 6]
+
+
+def test_compaction(database, fake_settings, runner_args):
+    fake_settings.inference.session_compaction.update({"max_tokens": 2500, "keep_tokens": 1000})
+    session_id = database.save_chat("long session", runner_args(), {}, turn(0) + turn(1))
+    runner = Runner(runner_args(), fake_settings)
+    model = fake_settings.inference.models["fake.fake"]
+    try:
+        assert runner.compact_session(session_id, model) is None
+
+        database.append_to_chat(session_id, turn(2) + turn(3))
+        history = runner.compact_session(session_id, model)
+        assert history[0]['content'].startswith(SessionCompactor.SUMMARY_HEADER)
+        assert [m['content'].split()[:2] for m in history[1:]] == [["question", "3"], ["answer", "3"]]
+        session = database.session(session_id, compacted=True)
+        assert session['messages'] == history
+        assert session['checkpoint']['message_id'] == 6
+        assert len(database.session(session_id)['messages']) == 8
+        assert runner.compact_session(session_id, model) is None
+
+        # later compactions fold the previous summary in
+        database.append_to_chat(session_id, turn(4) + turn(5) + turn(6))
+        history = runner.compact_session(session_id, model)
+        assert database.session_checkpoint(session_id)['message_id'] == 12
+        assert [m['content'].split()[:2] for m in history[1:]] == [["question", "6"], ["answer", "6"]]
+        assert ContextBudget.tokens(history) <= 2500
+    finally:
+        ClientPool.close()
+    assert [row["phase"] for row in database.telemetry()] == ["compact", "compact"]
@@ -0,0 +1,53 @@
+from openai.types import CompletionUsage
+
+from smah.runner import ClientPool, Runner
+from smah.runner.telemetry import Telemetry
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert Telemetry.percentile(values, 50) == 50.0
+    assert Telemetry.percentile(values, 95) == 95.0
+    assert Telemetry.percentile(values, 99) == 99.0
+    assert Telemetry.percentile([3.0], 99) == 3.0
+    assert Telemetry.percentile([], 50) is None
+
+
+def test_cost(fake_settings):
+    model = fake_settings.inference.models["fake.fake"]
+    usage = CompletionUsage.model_validate({
+        'prompt_tokens': 2000,
+        'completion_tokens': 500,
+        'total_tokens': 2500,
+        'prompt_tokens_details': {'cached_tokens': 1000}
+    })
+    assert Telemetry.cost(model, usage) is None
+    model.cost = {'million_tokens_in': 2.0, 'million_tokens_out': 10.0, 'million_tokens_cached_in': 1.0}
+    assert Telemetry.cost(model, usage) == (1000 * 2.0 + 1000 * 1.0 + 500 * 10.0) / 1_000_000
+
+
+def test_recorded(database, fake_settings, runner_args):
+    provider = fake_settings.inference.providers["fake"]
+    provider.settings.update({"latency": 0.02, "tokens_per_second": 1000})
+    fake_settings.inference.models["fake.fake"].cost = {'million_tokens_in': 2.5, 'million_tokens_out': 10.0}
+    runner = Runner(runner_args(), fake_settings)
+    try:
+        _, plan = runner.query_plan("How do I check disk usage?")
+        model = fake_settings.inference.models[plan["model"]]
+        "".join(runner.stream(model, runner.query_thread("How do I check disk usage?", plan)))
+    finally:
+        ClientPool.close()
+
+    rows = database.telemetry()
+    assert [(row["model"], row["phase"], row["streamed"]) for row in rows] == [("fake.fake", "plan", 0), ("fake.fake", "query", 1)]
+    for row in rows:
+        assert row["status"] == "ok"
+        assert 0 <= row["queue_wait"] <= row["first_token"] <= row["latency"]
+        assert row["latency"] >= 0.02
+        assert row["prompt_tokens"] > 0 and row["completion_tokens"] > 0
+        assert row["cost"] > 0
+
+    summary = Telemetry.summary(rows)
+    assert [(entry["phase"], entry["calls"]) for entry in summary] == [("plan", 1), ("query", 1)]
+    assert summary[1]["latency"]["p99"] == rows[1]["latency"]
+    assert database.telemetry(phase="plan") == rows[:1]